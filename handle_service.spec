@@ -35,6 +35,21 @@ module AbstractHandle {
     */
     funcdef persist_handle(Handle handle) returns (string hid) authentication required;
 
+    /*
+      hid - hid of the handle, null if a handle with no hid could not be persisted
+      error - why the handle could not be persisted, null if it was persisted
+    */
+    typedef structure {
+      HandleId hid;
+      string error;
+    } PersistResult;
+
+    /*
+      The persist_handles writes a list of handles to a persistent store in one batch, with the rules of persist_handle.
+      A handle that cannot be persisted does not stop the others; one result is returned per handle, in order.
+    */
+    funcdef persist_handles(list<Handle> handles) returns (list<PersistResult> results) authentication required;
+
     /*
       Given a list of handle ids, this function returns a list of handles.
       This method is replaced by fetch_handles_by.
@@ -58,6 +73,32 @@ module AbstractHandle {
     */
     funcdef fetch_handles_by(FetchHandlesParams params) returns (list<Handle> handles) authentication required;
 
+    /*
+      limit - max handles of the page, 1000 by default
+      continuation_token - continuation_token of the previous page, none for the first page
+      @optional limit continuation_token
+    */
+    typedef structure {
+      list<string> elements;
+      string field_name;
+      int limit;
+      string continuation_token;
+    } FetchHandlesPageParams;
+
+    /*
+      continuation_token - token of the next page, null after the last page
+    */
+    typedef structure {
+      list<Handle> handles;
+      string continuation_token;
+    } HandlesPage;
+
+    /*
+      This function selects records if field column entry is in elements and returns a page of at most limit handles, in hid order.
+      The continuation_token of a page fetches the next page when passed with the same elements and field_name.
+    */
+    funcdef fetch_handles_page(FetchHandlesPageParams params) returns (HandlesPage page) authentication required;
+
     /*
       Given a list of handle ids, this function determines if the underlying data is owned by the caller.
       If any one of the handle ids reference unreadable data this function returns false.
@@ -69,6 +110,21 @@ module AbstractHandle {
     */
     funcdef delete_handles(list<Handle> handles) returns (int deleted_count) authentication required;
 
+    /*
+      hid - hid as given
+      outcome - deleted, not-found, or not-owner if the handle is kept because it is not created by the caller
+    */
+    typedef structure {
+      HandleId hid;
+      string outcome;
+    } DeleteResult;
+
+    /*
+      The delete_handles_by_hid function deletes the handles of hids created by the caller, checking ownership on the stored handles.
+      One result is returned per hid, in order. A handle deleted by concurrent calls is reported as deleted to each of them.
+    */
+    funcdef delete_handles_by_hid(list<HandleId> hids) returns (list<DeleteResult> results) authentication required;
+
     /*
       Given a list of handle ids, this function determines if the underlying data is readable by the caller.
       If any one of the handle ids reference unreadable data this function returns false.
@@ -93,4 +149,20 @@ module AbstractHandle {
     */
     funcdef set_public_read(list<HandleId> hids) returns (int) authentication required;
 
+    /*
+      hid - hid as given
+      outcome - granted, already-set, failed, or not-found if there is no handle with the hid
+    */
+    typedef structure {
+      HandleId hid;
+      string outcome;
+    } AclResult;
+
+    /*
+      The add_read_acl_report function updates the acls of the shock nodes that the handles reference like add_read_acl, or makes them globally readable if username is empty.
+      A failing node does not stop the others. One result is returned per hid, in order.
+      The function is only accessible to a specific list of users specified at startup time.
+    */
+    funcdef add_read_acl_report(list<HandleId> hids, string username) returns (list<AclResult> results) authentication required;
+
 };
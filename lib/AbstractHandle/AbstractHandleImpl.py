@@ -28,6 +28,13 @@ provides a programmatic access to a remote file store
 
     #BEGIN_CLASS_HEADER
     MONGO_COLLECTION = 'handle'
+
+    def stream_handles_by(self, ctx, params):
+        """
+        fetch_handles_by for streamed responses: returns an iterator over the handles, read
+        from the database cursor as the response is sent
+        """
+        return self.handler.iter_handles_by(params)
     #END_CLASS_HEADER
 
     # config contains contents of config file in a hash or None if it couldn't
@@ -79,6 +86,53 @@ provides a programmatic access to a remote file store
         # return the results
         return [hid]
 
+    def persist_handles(self, ctx, handles):
+        """
+        The persist_handles writes a list of handles to a persistent store in one batch, with the rules of persist_handle.
+        A handle that cannot be persisted does not stop the others; one result is returned per handle, in order.
+        :param handles: instance of list of type "Handle" -> structure:
+           parameter "hid" of type "HandleId" (Handle provides a unique
+           reference that enables access to the data files through functions
+           provided as part of the HandleService. In the case of using shock,
+           the id is the node id. In the case of using shock the value of
+           type is shock. In the future these values should enumerated. The
+           value of url is the http address of the shock server, including
+           the protocol (http or https) and if necessary the port. The values
+           of remote_md5 and remote_sha1 are those computed on the file in
+           the remote data store. These can be used to verify uploads and
+           downloads.), parameter "file_name" of String, parameter "id" of
+           type "NodeId", parameter "type" of String, parameter "url" of
+           String, parameter "remote_md5" of String, parameter "remote_sha1"
+           of String
+        :returns: instance of list of type "PersistResult" (hid - hid of the
+           handle, null if a handle with no hid could not be persisted error
+           - why the handle could not be persisted, null if it was persisted)
+           -> structure: parameter "hid" of type "HandleId" (Handle provides
+           a unique reference that enables access to the data files through
+           functions provided as part of the HandleService. In the case of
+           using shock, the id is the node id. In the case of using shock the
+           value of type is shock. In the future these values should
+           enumerated. The value of url is the http address of the shock
+           server, including the protocol (http or https) and if necessary
+           the port. The values of remote_md5 and remote_sha1 are those
+           computed on the file in the remote data store. These can be used
+           to verify uploads and downloads.), parameter "error" of String
+        """
+        # ctx is the context object
+        # return variables are: results
+        #BEGIN persist_handles
+        logging.info("Start persist handles")
+
+        results = self.handler.persist_handles(handles, ctx['user_id'])
+        #END persist_handles
+
+        # At some point might do deeper type checking...
+        if not isinstance(results, list):
+            raise ValueError('Method persist_handles return value ' +
+                             'results is not type list as required.')
+        # return the results
+        return [results]
+
     def hids_to_handles(self, ctx, hids):
         """
         Given a list of handle ids, this function returns a list of handles.
@@ -189,6 +243,46 @@ provides a programmatic access to a remote file store
         # return the results
         return [handles]
 
+    def fetch_handles_page(self, ctx, params):
+        """
+        This function selects records if field column entry is in elements and returns a page of at most limit handles, in hid order.
+        The continuation_token of a page fetches the next page when passed with the same elements and field_name.
+        :param params: instance of type "FetchHandlesPageParams" (limit -
+           max handles of the page, 1000 by default continuation_token -
+           continuation_token of the previous page, none for the first page)
+           -> structure: parameter "elements" of list of String, parameter
+           "field_name" of String, parameter "limit" of Long, parameter
+           "continuation_token" of String
+        :returns: instance of type "HandlesPage" (continuation_token - token
+           of the next page, null after the last page) -> structure:
+           parameter "handles" of list of type "Handle" -> structure:
+           parameter "hid" of type "HandleId" (Handle provides a unique reference that
+           enables access to the data files through functions provided as
+           part of the HandleService. In the case of using shock, the id is
+           the node id. In the case of using shock the value of type is
+           shock. In the future these values should enumerated. The value of
+           url is the http address of the shock server, including the
+           protocol (http or https) and if necessary the port. The values of
+           remote_md5 and remote_sha1 are those computed on the file in the
+           remote data store. These can be used to verify uploads and
+           downloads.), parameter "file_name" of String, parameter "id" of
+           type "NodeId", parameter "type" of String, parameter "url" of
+           String, parameter "remote_md5" of String, parameter "remote_sha1"
+           of String, parameter "continuation_token" of String
+        """
+        # ctx is the context object
+        # return variables are: page
+        #BEGIN fetch_handles_page
+        page = self.handler.fetch_handles_page(params)
+        #END fetch_handles_page
+
+        # At some point might do deeper type checking...
+        if not isinstance(page, dict):
+            raise ValueError('Method fetch_handles_page return value ' +
+                             'page is not type dict as required.')
+        # return the results
+        return [page]
+
     def is_owner(self, ctx, hids):
         """
         Given a list of handle ids, this function determines if the underlying data is owned by the caller.
@@ -250,6 +344,47 @@ provides a programmatic access to a remote file store
         # return the results
         return [deleted_count]
 
+    def delete_handles_by_hid(self, ctx, hids):
+        """
+        The delete_handles_by_hid function deletes the handles of hids created by the caller, checking ownership on the stored handles.
+        One result is returned per hid, in order. A handle deleted by concurrent calls is reported as deleted to each of them.
+        :param hids: instance of list of type "HandleId" (Handle provides a
+           unique reference that enables access to the data files through
+           functions provided as part of the HandleService. In the case of
+           using shock, the id is the node id. In the case of using shock the
+           value of type is shock. In the future these values should
+           enumerated. The value of url is the http address of the shock
+           server, including the protocol (http or https) and if necessary
+           the port. The values of remote_md5 and remote_sha1 are those
+           computed on the file in the remote data store. These can be used
+           to verify uploads and downloads.)
+        :returns: instance of list of type "DeleteResult" (hid - hid as given
+           outcome - deleted, not-found, or not-owner if the handle is kept
+           because it is not created by the caller) -> structure: parameter
+           "hid" of type "HandleId" (Handle provides a unique reference that
+           enables access to the data files through functions provided as
+           part of the HandleService. In the case of using shock, the id is
+           the node id. In the case of using shock the value of type is
+           shock. In the future these values should enumerated. The value of
+           url is the http address of the shock server, including the
+           protocol (http or https) and if necessary the port. The values of
+           remote_md5 and remote_sha1 are those computed on the file in the
+           remote data store. These can be used to verify uploads and
+           downloads.), parameter "outcome" of String
+        """
+        # ctx is the context object
+        # return variables are: results
+        #BEGIN delete_handles_by_hid
+        results = self.handler.delete_handles_by_hid(hids, ctx['user_id'])
+        #END delete_handles_by_hid
+
+        # At some point might do deeper type checking...
+        if not isinstance(results, list):
+            raise ValueError('Method delete_handles_by_hid return value ' +
+                             'results is not type list as required.')
+        # return the results
+        return [results]
+
     def are_readable(self, ctx, hids):
         """
         Given a list of handle ids, this function determines if the underlying data is readable by the caller.
@@ -366,6 +501,49 @@ provides a programmatic access to a remote file store
                              'returnVal is not type int as required.')
         # return the results
         return [returnVal]
+
+    def add_read_acl_report(self, ctx, hids, username):
+        """
+        The add_read_acl_report function updates the acls of the shock nodes that the handles reference like add_read_acl, or makes them globally readable if username is empty.
+        A failing node does not stop the others. One result is returned per hid, in order.
+        The function is only accessible to a specific list of users specified at startup time.
+        :param hids: instance of list of type "HandleId" (Handle provides a
+           unique reference that enables access to the data files through
+           functions provided as part of the HandleService. In the case of
+           using shock, the id is the node id. In the case of using shock the
+           value of type is shock. In the future these values should
+           enumerated. The value of url is the http address of the shock
+           server, including the protocol (http or https) and if necessary
+           the port. The values of remote_md5 and remote_sha1 are those
+           computed on the file in the remote data store. These can be used
+           to verify uploads and downloads.)
+        :param username: instance of String
+        :returns: instance of list of type "AclResult" (hid - hid as given
+           outcome - granted, already-set, failed, or not-found if there is
+           no handle with the hid) -> structure: parameter "hid" of type
+           "HandleId" (Handle provides a unique reference that enables
+           access to the data files through functions provided as part of
+           the HandleService. In the case of using shock, the id is the node
+           id. In the case of using shock the value of type is shock. In the
+           future these values should enumerated. The value of url is the
+           http address of the shock server, including the protocol (http or
+           https) and if necessary the port. The values of remote_md5 and
+           remote_sha1 are those computed on the file in the remote data
+           store. These can be used to verify uploads and downloads.),
+           parameter "outcome" of String
+        """
+        # ctx is the context object
+        # return variables are: results
+        #BEGIN add_read_acl_report
+        results = self.handler.add_read_acl_report(hids, ctx['token'], username=username)
+        #END add_read_acl_report
+
+        # At some point might do deeper type checking...
+        if not isinstance(results, list):
+            raise ValueError('Method add_read_acl_report return value ' +
+                             'results is not type list as required.')
+        # return the results
+        return [results]
     def status(self, ctx):
         #BEGIN_STATUS
         returnVal = {'state': "OK",
@@ -373,5 +551,13 @@ provides a programmatic access to a remote file store
                      'version': self.VERSION,
                      'git_url': self.GIT_URL,
                      'git_commit_hash': self.GIT_COMMIT_HASH}
+
+        shock_health = self.handler.shock_health()
+        returnVal['shock'] = shock_health
+        returnVal['stats'] = self.handler.stats()  # counters of the worker serving this call
+        if shock_health.get('healthy') is False:
+            returnVal['state'] = "FAIL"
+            returnVal['message'] = 'Shock server is unavailable: {}'.format(
+                                                                    shock_health.get('error'))
         #END_STATUS
         return [returnVal]
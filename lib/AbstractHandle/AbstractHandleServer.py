@@ -18,6 +18,7 @@ from jsonrpcbase import ServerError as JSONServerError
 
 from biokbase import log
 from AbstractHandle.authclient import KBaseAuth as _KBaseAuth
+from AbstractHandle.Utils.Deadline import Deadline
 
 try:
     from ConfigParser import ConfigParser
@@ -28,6 +29,8 @@ DEPLOY = 'KB_DEPLOYMENT_CONFIG'
 SERVICE = 'KB_SERVICE_NAME'
 AUTH = 'auth-service-url'
 
+_STREAM_END = object()  # returned when the items of a streamed result are exhausted
+
 # Note that the error fields do not match the 2.0 JSONRPC spec
 
 
@@ -83,9 +86,10 @@ class JSONRPCServiceCustom(JSONRPCService):
 
         return None
 
-    def _call_method(self, ctx, request):
+    def _call_method(self, ctx, request, method=None):
         """Calls given method with given params and returns it value."""
-        method = self.method_data[request['method']]['method']
+        if method is None:
+            method = self.method_data[request['method']]['method']
         params = request['params']
         result = None
         try:
@@ -178,6 +182,75 @@ class JSONRPCServiceCustom(JSONRPCService):
             # empty dict, list or wrong type
             raise InvalidRequestError
 
+    def call_stream(self, ctx, jsondata, method, chunk_size):
+        """
+        Calls method, which takes the params of the jsonrpc method but
+        returns an iterator over the items of its list result, and returns the
+        response as an iterator of JSON text chunks of up to chunk_size items.
+
+        Items are encoded as they are read, so the result is never held in
+        memory as a whole. Errors up to the first item are raised as usual;
+        a later error, or the request deadline passing, is logged with the
+        call id and ends the stream early. The JSON is then left incomplete
+        on purpose: the status is already sent, and a client failing to parse
+        the response is better than one taking a truncated result as whole.
+        Items are read under the request deadline, which the server finishes
+        before the stream is consumed.
+
+        Arguments:
+        jsondata -- remote method call in jsonrpc format (a single request)
+        """
+        request = self._get_default_vals()
+        self._fill_request(request, jsondata)
+
+        if 'types' in self.method_data[request['method']]:
+            self._validate_params_types(request['method'], request['params'])
+
+        items = iter(self._call_method(ctx, request, method=method))
+        try:
+            first_items = [next(items)]
+        except StopIteration:
+            first_items = []
+        except Exception as e:
+            newerr = JSONServerError()
+            newerr.trace = traceback.format_exc()
+            newerr.data = repr(e.args[0]) if len(e.args) == 1 else repr(e.args)
+            raise newerr
+
+        respond = {}
+        self._fill_ver(request['jsonrpc'], respond)
+        respond['id'] = request['id']
+
+        def next_item():
+            Deadline.check('streaming the result')
+            return next(items, _STREAM_END)
+
+        return self._stream_respond(ctx, respond, first_items,
+                                    Deadline.bind(next_item), chunk_size)
+
+    def _stream_respond(self, ctx, respond, first_items, next_item, chunk_size):
+        # respond is encoded without its closing brace, then the result follows
+        yield json.dumps(respond, cls=JSONObjectEncoder)[:-1] + ', "result": [['
+
+        chunk = [json.dumps(item, cls=JSONObjectEncoder) for item in first_items]
+        separator = ''
+        try:
+            for item in iter(next_item, _STREAM_END):
+                chunk.append(json.dumps(item, cls=JSONObjectEncoder))
+                if len(chunk) >= chunk_size:
+                    yield separator + ', '.join(chunk)
+                    separator = ', '
+                    chunk = []
+        except Exception:
+            ctx.log_err('streamed result ended early, the response is incomplete\n' +
+                        traceback.format_exc())
+            return
+
+        if chunk:
+            yield separator + ', '.join(chunk)
+
+        yield ']]}'
+
     def _handle_request(self, ctx, request):
         """Handles given request and returns its response."""
         if 'types' in self.method_data[request['method']]:
@@ -342,6 +415,10 @@ class Application(object):
                              name='AbstractHandle.persist_handle',
                              types=[dict])
         self.method_authentication['AbstractHandle.persist_handle'] = 'required'  # noqa
+        self.rpc_service.add(impl_AbstractHandle.persist_handles,
+                             name='AbstractHandle.persist_handles',
+                             types=[list])
+        self.method_authentication['AbstractHandle.persist_handles'] = 'required'  # noqa
         self.rpc_service.add(impl_AbstractHandle.hids_to_handles,
                              name='AbstractHandle.hids_to_handles',
                              types=[list])
@@ -354,6 +431,10 @@ class Application(object):
                              name='AbstractHandle.fetch_handles_by',
                              types=[dict])
         self.method_authentication['AbstractHandle.fetch_handles_by'] = 'required'  # noqa
+        self.rpc_service.add(impl_AbstractHandle.fetch_handles_page,
+                             name='AbstractHandle.fetch_handles_page',
+                             types=[dict])
+        self.method_authentication['AbstractHandle.fetch_handles_page'] = 'required'  # noqa
         self.rpc_service.add(impl_AbstractHandle.is_owner,
                              name='AbstractHandle.is_owner',
                              types=[list])
@@ -362,6 +443,10 @@ class Application(object):
                              name='AbstractHandle.delete_handles',
                              types=[list])
         self.method_authentication['AbstractHandle.delete_handles'] = 'required'  # noqa
+        self.rpc_service.add(impl_AbstractHandle.delete_handles_by_hid,
+                             name='AbstractHandle.delete_handles_by_hid',
+                             types=[list])
+        self.method_authentication['AbstractHandle.delete_handles_by_hid'] = 'required'  # noqa
         self.rpc_service.add(impl_AbstractHandle.are_readable,
                              name='AbstractHandle.are_readable',
                              types=[list])
@@ -378,9 +463,24 @@ class Application(object):
                              name='AbstractHandle.set_public_read',
                              types=[list])
         self.method_authentication['AbstractHandle.set_public_read'] = 'required'  # noqa
+        self.rpc_service.add(impl_AbstractHandle.add_read_acl_report,
+                             name='AbstractHandle.add_read_acl_report',
+                             types=[list, str])
+        self.method_authentication['AbstractHandle.add_read_acl_report'] = 'required'  # noqa
         self.rpc_service.add(impl_AbstractHandle.status,
                              name='AbstractHandle.status',
                              types=[dict])
+        # methods whose handles are encoded into the response while they are
+        # read from the database, instead of being collected first
+        self.stream_methods = {
+            'AbstractHandle.fetch_handles_by': impl_AbstractHandle.stream_handles_by,
+            'AbstractHandle.hids_to_handles':
+                lambda ctx, hids: impl_AbstractHandle.stream_handles_by(
+                    ctx, {'elements': hids, 'field_name': 'hid'}),
+            'AbstractHandle.ids_to_handles':
+                lambda ctx, ids: impl_AbstractHandle.stream_handles_by(
+                    ctx, {'elements': ids, 'field_name': 'id'})}
+        self.stream_chunk_size = int((config or {}).get('stream-chunk-size', 1000))
         authurl = config.get(AUTH) if config else None
         self.auth_client = _KBaseAuth(authurl)
 
@@ -422,6 +522,9 @@ class Application(object):
                                'method_params': req['params']
                                }
                 ctx['provenance'] = [prov_action]
+                # the whole call, auth included, runs under the deadline of the method
+                deadline_token = Deadline.start(Deadline.seconds_for(
+                    config or {}, ctx['method'], self.requested_deadline(environ, req)))
                 try:
                     token = environ.get('HTTP_AUTHORIZATION')
                     # parse out the method being requested and check if it
@@ -455,7 +558,12 @@ class Application(object):
                         self.log(log.INFO, ctx, 'X-Forwarded-For: ' +
                                  environ.get('HTTP_X_FORWARDED_FOR'))
                     self.log(log.INFO, ctx, 'start method')
-                    rpc_result = self.rpc_service.call(ctx, req)
+                    stream_method = self.stream_methods.get(method_name)
+                    if stream_method is not None and req.get('id') is not None:
+                        rpc_result = self.rpc_service.call_stream(
+                            ctx, req, stream_method, self.stream_chunk_size)
+                    else:
+                        rpc_result = self.rpc_service.call(ctx, req)
                     self.log(log.INFO, ctx, 'end method')
                     status = '200 OK'
                 except JSONRPCError as jre:
@@ -475,6 +583,8 @@ class Application(object):
                            }
                     rpc_result = self.process_error(err, ctx, req,
                                                     traceback.format_exc())
+                finally:
+                    Deadline.finish(deadline_token)
 
         # print('Request method was %s\n' % environ['REQUEST_METHOD'])
         # print('Environment dictionary is:\n%s\n' % pprint.pformat(environ))
@@ -482,20 +592,34 @@ class Application(object):
         # print('Result from the method call is:\n%s\n' % \
         #    pprint.pformat(rpc_result))
 
+        response_headers = [
+            ('Access-Control-Allow-Origin', '*'),
+            ('Access-Control-Allow-Headers', environ.get(
+                'HTTP_ACCESS_CONTROL_REQUEST_HEADERS', 'authorization')),
+            ('content-type', 'application/json')]
+
+        if rpc_result is not None and not isinstance(rpc_result, str):
+            # streamed result, sent without content-length as it is produced
+            start_response(status, response_headers)
+            return (chunk.encode('utf8') for chunk in rpc_result)
+
         if rpc_result:
             response_body = rpc_result
         else:
             response_body = ''
 
-        response_headers = [
-            ('Access-Control-Allow-Origin', '*'),
-            ('Access-Control-Allow-Headers', environ.get(
-                'HTTP_ACCESS_CONTROL_REQUEST_HEADERS', 'authorization')),
-            ('content-type', 'application/json'),
-            ('content-length', str(len(response_body)))]
+        response_headers.append(('content-length', str(len(response_body))))
         start_response(status, response_headers)
         return [response_body.encode('utf8')]
 
+    def requested_deadline(self, environ, request):
+        # seconds the caller allows for the call, from the X-Request-Deadline header or else
+        # the deadline field of the rpc context
+        deadline = environ.get('HTTP_X_REQUEST_DEADLINE')
+        if deadline is None and isinstance(request.get('context'), dict):
+            deadline = request['context'].get('deadline')
+        return deadline
+
     def process_error(self, error, context, request, trace=None):
         if trace:
             self.log(log.ERR, context, trace.split('\n')[0:-1])
@@ -550,6 +674,9 @@ try:
         from gevent import monkey
         monkey.patch_all()
     uwsgi.applications = {'': application}
+    # open connections in each worker right after it is forked, before it
+    # serves requests
+    uwsgi.post_fork_hook = impl_AbstractHandle.handler.warm_up
 except ImportError:
     # Not available outside of wsgi, ignore
     pass
@@ -0,0 +1,91 @@
+import hashlib
+import threading
+from cachetools import TTLCache
+
+_MISSING = object()
+
+
+class _EvictionCountingCache(TTLCache):
+
+    def __init__(self, maxsize, ttl):
+        super(_EvictionCountingCache, self).__init__(maxsize, ttl)
+        self.evictions = 0
+
+    def popitem(self):
+        # only called by cachetools when the cache is full
+        self.evictions += 1
+        return super(_EvictionCountingCache, self).popitem()
+
+
+class ACLCache:
+    """
+    Caches Shock acl lookups (owner/readability) per token and node for a short time.
+    Tokens are kept only as sha256 hashes.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = int(maxsize)
+        self.ttl = float(ttl)
+        self.enabled = self.maxsize > 0 and self.ttl > 0
+
+        self._cache = _EvictionCountingCache(self.maxsize, self.ttl)
+        self._node_keys = dict()  # node_id -> keys cached for the node, used to invalidate
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _hash_token(token):
+        return hashlib.sha256((token or '').encode('utf-8')).hexdigest()
+
+    def _prune_index(self):
+        for node_id in list(self._node_keys):
+            keys = {key for key in self._node_keys[node_id] if key in self._cache}
+            if keys:
+                self._node_keys[node_id] = keys
+            else:
+                self._node_keys.pop(node_id)
+
+    def get(self, kind, token, node_id, default=None):
+        """
+        return cached value of kind ('owner', 'readable') for token and node
+        """
+        if not self.enabled:
+            return default
+
+        key = (kind, self._hash_token(token), node_id)
+        with self._lock:
+            value = self._cache.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+
+        return value
+
+    def set(self, kind, token, node_id, value):
+        if not self.enabled:
+            return
+
+        key = (kind, self._hash_token(token), node_id)
+        with self._lock:
+            self._cache[key] = value
+            self._node_keys.setdefault(node_id, set()).add(key)
+            if len(self._node_keys) > 2 * self.maxsize:
+                self._prune_index()
+
+    def invalidate(self, node_id):
+        """
+        drop every cached entry of node, for all tokens
+        """
+        with self._lock:
+            for key in self._node_keys.pop(node_id, set()):
+                self._cache.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self._cache.evictions,
+                    'size': len(self._cache)}
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import os
+import traceback
+import aiohttp
+
+from AbstractHandle.Utils.ACLCache import ACLCache
+from AbstractHandle.Utils.Deadline import Deadline
+from AbstractHandle.Utils.Resilience import CircuitBreaker, RetryPolicy
+
+
+class AsyncShockUtil:
+    """
+    asyncio counterpart of ShockUtil.
+    All node checks of an event loop share one pooled aiohttp session.
+    """
+
+    POOL_MAXSIZE = 25  # max connections per host
+    POOL_LIMIT = 100  # max connections in total
+    CONNECT_TIMEOUT = 5  # seconds
+    READ_TIMEOUT = 60  # seconds
+
+    def _get_header(self, token):
+        return {'Authorization': 'OAuth {}'.format(token)}
+
+    def _get_admin_header(self):
+        return {'Authorization': 'OAuth {}'.format(self.admin_token)}
+
+    async def _close_stale_session(self):
+        """
+        close the session of a previous event loop, it cannot be used from the running one
+        """
+        session, loop = self._session, self._session_loop
+        self._session = None
+        if session is None or session.closed:
+            return
+
+        if loop.is_closed():
+            await session.close()  # its connections went with the loop, this only marks it closed
+        else:
+            asyncio.run_coroutine_threadsafe(session.close(), loop)  # close it on its own loop
+
+    async def _get_session(self):
+        """
+        return the session of the running event loop, creating it on first use
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is not None and self._session_loop is not loop:
+            await self._close_stale_session()
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_limit,
+                                             limit_per_host=self.pool_maxsize)
+            timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout,
+                                            sock_read=self.read_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._session_loop = loop
+
+        return self._session
+
+    async def _send(self, method, end_point, **kwargs):
+        session = await self._get_session()
+        remaining = Deadline.remaining_time()
+        if remaining is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(
+                                    total=remaining,
+                                    sock_connect=min(self.connect_timeout, remaining),
+                                    sock_read=min(self.read_timeout, remaining))
+        async with session.request(method, end_point, **kwargs) as resp:
+            try:
+                data = await resp.json(content_type=None)
+            except ValueError:
+                data = await resp.text()
+
+            return resp.status, data
+
+    async def _request(self, method, end_point, **kwargs):
+        """
+        send request and return (status, json body or text)
+
+        same retry, circuit breaker and deadline rules as ShockUtil._request
+        """
+        retries = self.retry_policy.max_retries if method == 'GET' else 0
+
+        attempt = 0
+        while True:
+            Deadline.check('calling Shock')
+            caller = object()  # identifies this attempt to the circuit breaker
+            if not self.circuit_breaker.allow(caller):
+                raise ValueError('Shock server is unavailable (circuit breaker is open)')
+
+            try:
+                status, data = await self._send(method, end_point, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                # cut short by the deadline, not a shock failure: the finally below releases
+                # the trial the call may hold
+                Deadline.check('calling Shock')
+                self.circuit_breaker.record_failure()
+                if attempt >= retries:
+                    self.retry_policy.record_exhausted()
+                    raise
+            else:
+                if status < 500:
+                    self.circuit_breaker.record_success()
+                    return status, data
+
+                self.circuit_breaker.record_failure()
+                if attempt >= retries:
+                    self.retry_policy.record_exhausted()
+                    return status, data
+            finally:
+                self.circuit_breaker.release(caller)  # unsettled, e.g. cancelled or other errors
+
+            await asyncio.sleep(Deadline.remaining_time(self.retry_policy.delay(attempt)))
+            attempt += 1
+
+    def __init__(self, config, acl_cache=None, retry_policy=None, circuit_breaker=None):
+        self.shock_url = config.get('shock-url')
+        self.admin_token = config.get('admin-token')
+
+        self.pool_maxsize = int(config.get('shock-pool-maxsize', self.POOL_MAXSIZE))
+        self.pool_limit = int(config.get('shock-async-pool-limit', self.POOL_LIMIT))
+        self.connect_timeout = float(config.get('shock-connect-timeout', self.CONNECT_TIMEOUT))
+        self.read_timeout = float(config.get('shock-read-timeout', self.READ_TIMEOUT))
+
+        if acl_cache is None:
+            acl_cache = ACLCache(config.get('shock-acl-cache-size', 0),
+                                 config.get('shock-acl-cache-ttl', 0))
+        self.acl_cache = acl_cache
+
+        if retry_policy is None:
+            retry_policy = RetryPolicy(config.get('shock-max-retries', 0),
+                                       config.get('shock-retry-backoff', 0),
+                                       config.get('shock-retry-backoff-max', 0))
+        self.retry_policy = retry_policy
+
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker(config.get('shock-breaker-failures', 5),
+                                             config.get('shock-breaker-reset', 30),
+                                             name='shock circuit breaker')
+        self.circuit_breaker = circuit_breaker
+
+        self._session = None
+        self._session_loop = None
+
+        logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
+                            level=logging.INFO)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _grant_read_access(self, node_id, token, username=None):
+        """
+        grant readable acl for username or global if username is empty
+        """
+        headers = self._get_header(token)
+        self.acl_cache.invalidate(node_id)
+
+        if username:  # grand readable acl for user
+            end_point = os.path.join(self.shock_url, 'node', node_id,
+                                     'acl/read?users={}'.format(username))
+            error_msg = 'Grant user readable access failed.\nError Code: {}\n{}\n'
+        else:  # grand global readable acl
+            end_point = os.path.join(self.shock_url, 'node', node_id, 'acl/public_read')
+            error_msg = 'Grant global readable access failed.\nError Code: {}\n{}\n'
+
+        status, data = await self._request('PUT', end_point, headers=headers)
+
+        if status != 200:
+            raise ValueError(error_msg.format(status, data))
+
+        return True
+
+    async def get_owner(self, node_id, token):
+        """
+        parse owner.username information from shock acl of a node
+        """
+
+        owner = self.acl_cache.get('owner', token, node_id)
+        if owner is not None:
+            return owner
+
+        headers = self._get_header(token)
+
+        end_point = os.path.join(self.shock_url, 'node', node_id, 'acl/?verbosity=full')
+
+        status, data = await self._request('GET', end_point, headers=headers)
+
+        if status != 200:
+            raise ValueError('Request owner failed.\nError Code: {}\n{}\n'
+                             .format(status, data))
+
+        try:
+            owner = data.get('data').get('owner').get('username')
+        except Exception as e:
+            error_msg = 'Connot parse owner information from reponse\n'
+            error_msg += 'ERROR -- {}:\n{}'.format(
+                        e,
+                        ''.join(traceback.format_exception(None, e, e.__traceback__)))
+            raise ValueError(error_msg)
+
+        self.acl_cache.set('owner', token, node_id, owner)
+        return owner
+
+    async def is_readable(self, node_id, token):
+        """
+        check if a node is reachable/readable
+        """
+
+        if self.acl_cache.get('readable', token, node_id):
+            return True
+
+        headers = self._get_header(token)
+
+        end_point = os.path.join(self.shock_url, 'node', node_id)
+
+        status, _ = await self._request('GET', end_point, headers=headers)
+
+        if 200 <= status < 400:
+            self.acl_cache.set('readable', token, node_id, True)
+            return True
+
+        return False
+
+    async def add_read_acl(self, node_id, token, username=None):
+        """
+        check current acl and then grant readable acl to user or public
+
+        return True if access was granted, False if the node was already readable
+        """
+
+        headers = self._get_admin_header()
+
+        end_point = os.path.join(self.shock_url, 'node', node_id, 'acl/?verbosity=full')
+        status, data = await self._request('GET', end_point, headers=headers)
+
+        if status != 200:
+            raise ValueError('Grant readable access for node failed.\nError Code: {}\n{}\n'
+                             .format(status, data))
+
+        if username:  # check readble acl and grand readable acl for user
+            try:
+                read_users = [r.get('username') for r in data.get('data').get('read')]
+            except Exception as e:
+                error_msg = 'Connot parse read information from reponse\n'
+                error_msg += 'ERROR -- {}:\n{}'.format(
+                            e,
+                            ''.join(traceback.format_exception(None, e, e.__traceback__)))
+                raise ValueError(error_msg)
+
+            if username not in read_users:
+                # grant user read access
+                return await self._grant_read_access(node_id, token, username=username)
+        else:  # check readble acl and grand global readable acl
+            try:
+                public_read = data.get('data').get('public').get('read')
+            except Exception as e:
+                error_msg = 'Connot parse public_read information from reponse\n'
+                error_msg += 'ERROR -- {}:\n{}'.format(
+                            e,
+                            ''.join(traceback.format_exception(None, e, e.__traceback__)))
+                raise ValueError(error_msg)
+
+            if not public_read:
+                # grant global read access
+                return await self._grant_read_access(node_id, token)
+
+        return False
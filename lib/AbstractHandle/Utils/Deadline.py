@@ -0,0 +1,103 @@
+import contextvars
+import logging
+import time
+
+
+class Deadline:
+    """
+    Time budget of the request being served.
+
+    The deadline of the current request lives in a context variable, so it follows the request
+    into asyncio tasks; functions sent to thread pools must be wrapped with bind.
+    """
+
+    DEFAULT_SECONDS = 0  # no deadline
+
+    _current = contextvars.ContextVar('deadline', default=None)
+
+    def __init__(self, seconds):
+        self.seconds = float(seconds)
+        self.expires_at = time.monotonic() + self.seconds
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0)
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    @classmethod
+    def seconds_for(cls, config, method, requested=None):
+        """
+        return the deadline in seconds of method (0 for none)
+
+        request-deadline-<method> or else request-deadline from config. a caller may ask for a
+        shorter deadline (requested seconds) but not for a longer one.
+        """
+        seconds = float(config.get('request-deadline-{}'.format(method),
+                                   config.get('request-deadline', cls.DEFAULT_SECONDS)))
+
+        if requested is not None:
+            try:
+                requested = float(requested)
+            except (TypeError, ValueError):
+                logging.warning('Ignoring unexpected request deadline {}'.format(requested))
+            else:
+                if requested > 0 and (seconds <= 0 or requested < seconds):
+                    seconds = requested
+
+        return seconds
+
+    @classmethod
+    def start(cls, seconds):
+        """
+        start a deadline of seconds for the current request (none if seconds is not positive)
+
+        return a token to pass to finish
+        """
+        return cls._current.set(cls(seconds) if seconds > 0 else None)
+
+    @classmethod
+    def finish(cls, token):
+        cls._current.reset(token)
+
+    @classmethod
+    def current(cls):
+        return cls._current.get()
+
+    @classmethod
+    def remaining_time(cls, timeout=None):
+        """
+        return the smaller of timeout and the time left to the current deadline, None if neither
+        """
+        deadline = cls._current.get()
+        if deadline is None:
+            return timeout
+
+        remaining = deadline.remaining()
+        return remaining if timeout is None else min(timeout, remaining)
+
+    @classmethod
+    def check(cls, action):
+        """
+        raise ValueError if the current deadline has passed
+        """
+        deadline = cls._current.get()
+        if deadline is not None and deadline.expired():
+            raise ValueError('Request deadline of {:g}s exceeded while {}'
+                             .format(deadline.seconds, action))
+
+    @classmethod
+    def bind(cls, func):
+        """
+        return func running under the current deadline, for calls made in another thread
+        """
+        deadline = cls._current.get()
+
+        def call(*args, **kwargs):
+            token = cls._current.set(deadline)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                cls._current.reset(token)
+
+        return call
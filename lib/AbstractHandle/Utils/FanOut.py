@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from AbstractHandle.Utils.Deadline import Deadline
+
+
+class FanOut:
+    """
+    Runs a blocking function over a list of items with bounded concurrency.
+    Stops as soon as one result makes the rest of the work pointless, or when the deadline of
+    the current request passes.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max(int(max_workers), 1)
+
+        logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
+                            level=logging.INFO)
+
+    @staticmethod
+    def _check_deadline(done_count, total):
+        Deadline.check('fanning out ({} of {} calls done)'.format(done_count, total))
+
+    def _run_serial(self, func, items, stop):
+        results = dict()
+        for item in items:
+            self._check_deadline(len(results), len(items))
+            result = func(item)
+            results[item] = result
+            if stop is not None and stop(result):
+                break
+
+        return results
+
+    def run(self, func, items, stop=None):
+        """
+        call func on each distinct item and return a dict of item -> result
+
+        if stop(result) is true for a result, pending calls are cancelled and only the
+        results collected so far are returned. an exception raised by func cancels pending
+        calls and is re-raised. if the request deadline passes, pending calls are cancelled and
+        ValueError is raised.
+        """
+        items = list(dict.fromkeys(items))  # drop duplicates, keep order
+
+        max_workers = min(self.max_workers, len(items))
+        if max_workers <= 1:
+            return self._run_serial(func, items, stop)
+
+        results = dict()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        bound_func = Deadline.bind(func)
+        pending = {executor.submit(bound_func, item): item for item in items}
+        try:
+            while pending:
+                done, _ = wait(pending, timeout=Deadline.remaining_time(),
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    self._check_deadline(len(results), len(items))
+                for future in done:
+                    item = pending.pop(future)
+                    result = future.result()
+                    results[item] = result
+                    if stop is not None and stop(result):
+                        logging.info('stopping early, cancelling {} pending calls'
+                                     .format(len(pending)))
+                        return results
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        return results
+
+    def _next_result(self, futures, done_count, total):
+        future = futures.popleft()
+        try:
+            return future.result(timeout=Deadline.remaining_time())
+        except FutureTimeoutError:
+            self._check_deadline(done_count, total)
+            return future.result()
+
+    def imap(self, func, items):
+        """
+        call func on each item and yield the results in the order of items
+
+        at most max_workers calls are running or waiting to be consumed at a time, so results
+        are produced as fast as they are consumed. an exception raised by func, or the request
+        deadline passing, cancels pending calls and is raised from the generator.
+        """
+        items = list(items)
+
+        if min(self.max_workers, len(items)) <= 1:
+            for done_count, item in enumerate(items):
+                self._check_deadline(done_count, len(items))
+                yield func(item)
+            return
+
+        bound_func = Deadline.bind(func)
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(items)))
+        futures = deque()
+        done_count = 0
+        try:
+            for item in items:
+                futures.append(executor.submit(bound_func, item))
+                if len(futures) >= self.max_workers:
+                    yield self._next_result(futures, done_count, len(items))
+                    done_count += 1
+
+            while futures:
+                yield self._next_result(futures, done_count, len(items))
+                done_count += 1
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    async def run_async(self, func, items, stop=None):
+        """
+        coroutine version of run: await func(item) for each distinct item on the running loop,
+        at most max_workers at a time
+        """
+        items = list(dict.fromkeys(items))  # drop duplicates, keep order
+
+        results = dict()
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def call(item):
+            async with semaphore:
+                return item, await func(item)
+
+        pending = {asyncio.ensure_future(call(item)) for item in items}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=Deadline.remaining_time(),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self._check_deadline(len(results), len(items))
+                for task in done:
+                    item, result = task.result()
+                    results[item] = result
+                    if stop is not None and stop(result):
+                        logging.info('stopping early, cancelling {} pending calls'
+                                     .format(len(pending)))
+                        return results
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return results
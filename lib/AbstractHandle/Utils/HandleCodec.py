@@ -0,0 +1,190 @@
+import logging
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+class HandleCodec:
+    """
+    Translates handles to and from the compact docs stored in mongo.
+
+    Compact docs use short keys, keep hid as _id only, store type and url as integer codes of a
+    dictionary collection and creation_date as a BSON datetime. Docs still in the plain form
+    decode as they are.
+    """
+
+    KEYS = {'id': 'i', 'file_name': 'f', 'type': 't', 'url': 'u', 'remote_md5': 'm',
+            'remote_sha1': 's', 'created_by': 'c', 'creation_date': 'd', 'node_owner': 'o'}
+    FIELDS = {key: field_name for field_name, key in KEYS.items()}
+    DICTIONARY_FIELDS = ['type', 'url']  # few distinct values, stored as codes
+    DATE_FIELDS = ['creation_date']
+    DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+    DICTIONARY_SUFFIX = '_dictionary'  # dictionary collection is <handle collection>_dictionary
+    COUNTER_ID = 'counter'  # dictionary doc holding the last code given
+
+    def __init__(self, handle_collection):
+        self.use_collection(handle_collection)
+        # dictionary entries never change, so they are cached for good
+        self._codes = dict()  # value -> code
+        self._values = dict()  # code -> value
+
+        logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
+                            level=logging.INFO)
+
+    def use_collection(self, handle_collection):
+        """
+        read and write the dictionary of handle_collection through its client, e.g. the client
+        of a forked process; cached entries are kept
+        """
+        self.dictionary = handle_collection.database[handle_collection.name +
+                                                     self.DICTIONARY_SUFFIX]
+
+    def load(self):
+        """
+        ensure the dictionary index and cache all entries
+        """
+        self.dictionary.create_index('value', unique=True, sparse=True)
+
+        for entry in self.dictionary.find({'value': {'$exists': True}}):
+            self._remember(entry)
+
+        logging.info('loaded {} dictionary entries'.format(len(self._values)))
+
+    def _remember(self, entry):
+        self._codes[entry['value']] = entry['_id']
+        self._values[entry['_id']] = entry['value']
+
+    def _add(self, value):
+        counter = self.dictionary.find_one_and_update({'_id': self.COUNTER_ID},
+                                                      {'$inc': {'seq': 1}}, upsert=True,
+                                                      return_document=ReturnDocument.AFTER)
+        entry = {'_id': counter['seq'], 'value': value}
+        try:
+            self.dictionary.insert_one(entry)
+        except DuplicateKeyError:
+            # added meanwhile by another process, its code wins
+            entry = self.dictionary.find_one({'value': value})
+
+        return entry
+
+    def _code(self, value, create):
+        """
+        return the code of value, adding it to the dictionary if create is set (None otherwise)
+        """
+        code = self._codes.get(value)
+        if code is not None:
+            return code
+
+        entry = self.dictionary.find_one({'value': value})
+        if entry is None:
+            if not create:
+                return None
+            entry = self._add(value)
+
+        self._remember(entry)
+
+        return entry['_id']
+
+    def _value(self, code):
+        value = self._values.get(code)
+        if value is not None:
+            return value
+
+        entry = self.dictionary.find_one({'_id': code})
+        if entry is None:
+            raise ValueError('Unknown dictionary code {}'.format(code))
+
+        self._remember(entry)
+
+        return entry['value']
+
+    def key(self, field_name):
+        """
+        return the key of field_name in compact docs
+        """
+        if field_name == 'hid':
+            return '_id'
+
+        return self.KEYS.get(field_name, field_name)
+
+    def _encode_value(self, field_name, value, create):
+        if value is None:
+            return value
+
+        if field_name in self.DICTIONARY_FIELDS:
+            return self._code(value, create)
+
+        if field_name in self.DATE_FIELDS and isinstance(value, str):
+            try:
+                return datetime.strptime(value, self.DATE_FORMAT)
+            except ValueError:
+                return value  # kept as it is, it still decodes the same
+
+        return value
+
+    def _decode_value(self, field_name, value):
+        if field_name in self.DICTIONARY_FIELDS and isinstance(value, int):
+            return self._value(value)
+
+        if field_name in self.DATE_FIELDS and isinstance(value, datetime):
+            return value.strftime(self.DATE_FORMAT)
+
+        return value
+
+    def encode_values(self, field_name, values):
+        """
+        return values of field_name to look up in compact docs, without the ones no doc can have
+        """
+        encoded = [self._encode_value(field_name, value, False) for value in values]
+
+        if field_name in self.DICTIONARY_FIELDS:
+            # no doc refers to a value missing from the dictionary
+            encoded = [code for code, value in zip(encoded, values)
+                       if code is not None or value is None]
+
+        return encoded
+
+    def encode_doc(self, doc):
+        """
+        return the compact doc of a handle
+        """
+        compact = {self.key(field_name): self._encode_value(field_name, value, True)
+                   for field_name, value in doc.items() if field_name not in ['_id', 'hid']}
+
+        hid = doc.get('hid', doc.get('_id'))
+        if hid is not None:
+            compact['_id'] = hid
+
+        return compact
+
+    def decode_doc(self, doc, keep_id=True):
+        """
+        return the handle of a compact or plain doc, with _id only if keep_id is set
+        """
+        handle = dict()
+        for key, value in doc.items():
+            field_name = self.FIELDS.get(key, key)
+            handle[field_name] = self._decode_value(field_name, value)
+
+        if '_id' in handle:
+            handle.setdefault('hid', handle['_id'])
+            if not keep_id:
+                handle.pop('_id')
+
+        return handle
+
+    def encode_projection(self, projection):
+        """
+        return the projection of compact docs for projection of handles
+
+        the returned projection always keeps _id, the hid of compact docs
+        """
+        compact = {self.key(field_name): value for field_name, value in projection.items()
+                   if field_name not in ['_id', 'hid']}
+        if not compact:
+            return None  # {'_id': True} alone would leave out every other field
+
+        compact['_id'] = True
+
+        return compact
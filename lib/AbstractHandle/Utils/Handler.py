@@ -1,11 +1,19 @@
 
+import asyncio
+import base64
+import json
 import logging
+import time
 from time import gmtime, strftime
-import uuid
 import os
 import requests as _requests
 
+from AbstractHandle.Utils.AsyncShockUtil import AsyncShockUtil
+from AbstractHandle.Utils.Deadline import Deadline
+from AbstractHandle.Utils.FanOut import FanOut
+from AbstractHandle.Utils.HidGenerator import HidGenerator
 from AbstractHandle.Utils.MongoUtil import MongoUtil
+from AbstractHandle.Utils.NodeStore import NodeStore, ShockNodeStore, MemoryNodeStore
 from AbstractHandle.Utils.ShockUtil import ShockUtil
 from AbstractHandle.Utils.TokenCache import TokenCache
 
@@ -15,8 +23,26 @@ class Handler:
     FIELD_NAMES = ['hid', 'id', 'file_name', 'type', 'url', 'remote_md5', 'remote_sha1',
                    'created_by', 'creation_date']
 
+    # node_owner is recorded by is_owner for internal use and is not part of Handle
+    HANDLE_PROJECTION = {'_id': False, 'node_owner': False}
+    OWNER_PROJECTION = {'_id': False, 'hid': True, 'id': True, 'type': True, 'node_owner': True}
+
     AUTH_API_PATH = 'api/V2'
     CACHE_EXPIRE_TIME = 300  # seconds
+    SHOCK_CONCURRENCY = 10  # max concurrent shock calls per request
+    ACL_CONCURRENCY = 25  # max concurrent nodes in flight per add_read_acl request
+    ASYNC_CONCURRENCY = 1000  # max concurrent shock calls per request on the async path
+    PAGE_LIMIT = 1000  # handles per page of fetch_handles_page if no limit is given
+    MAX_PAGE_LIMIT = 10000
+
+    ACL_GRANTED = NodeStore.GRANTED
+    ACL_ALREADY_SET = NodeStore.ALREADY_SET
+    ACL_FAILED = NodeStore.FAILED
+
+    # outcomes of delete_handles_by_hid
+    DELETED = 'deleted'
+    NOT_FOUND = 'not-found'
+    NOT_OWNER = 'not-owner'
 
     @staticmethod
     def validate_params(params, expected, opt_param=set()):
@@ -40,7 +66,7 @@ class Handler:
 
         handle = {k: v for k, v in handle.items() if k in self.FIELD_NAMES}  # remove unnecessary fields
         if not handle.get('hid'):
-            handle['hid'] = 'KBH_' + str(uuid.uuid4())
+            handle['hid'] = self.hid_generator.new_hid()
 
         handle['_id'] = handle.get('hid')  # assign _id to hid
 
@@ -65,12 +91,34 @@ class Handler:
 
         return handle
 
+    def _prepare_handle(self, handle, user_id):
+        """
+        process handle into the doc to store
+        """
+        handle = self._process_handle(handle, user_id)
+
+        hid = self._stored_hid(handle.get('hid'))
+        handle['hid'] = handle['_id'] = hid
+
+        return handle
+
+    @staticmethod
+    def _stored_hid(hid):
+        """
+        return hid as stored: legacy hids are stored as integers
+        """
+        try:
+            return int(hid)
+        except Exception:
+            return hid
+
     def _get_token_roles(self, token):
 
         headers = {'Authorization': token}
         end_point = os.path.join(self.auth_url, self.AUTH_API_PATH, 'me')
 
-        resp = _requests.get(end_point, headers=headers)
+        Deadline.check('checking token roles')
+        resp = _requests.get(end_point, headers=headers, timeout=Deadline.remaining_time())
 
         if resp.status_code != 200:
             raise ValueError('Request owner failed.\nError Code: {}\n{}\n'
@@ -91,19 +139,81 @@ class Handler:
 
         return not set(self.admin_roles).isdisjoint(customroles)
 
+    def _timed(self, step, func, *args):
+        start = time.monotonic()
+        result = func(*args)
+        self.startup_timings[step] = round(time.monotonic() - start, 3)
+
+        return result
+
     def __init__(self, config):
-        self.mongo_util = MongoUtil(config)
-        self.shock_util = ShockUtil(config)
+        self.startup_timings = dict()
+        self.mongo_util = self._timed('mongo', MongoUtil, config)
+        self.shock_util = self._timed('shock', ShockUtil, config)
         self.token_cache = TokenCache(1000, self.CACHE_EXPIRE_TIME)
+        self.fan_out = FanOut(config.get('shock-concurrency', self.SHOCK_CONCURRENCY))
+        self.acl_fan_out = FanOut(config.get('shock-acl-concurrency', self.ACL_CONCURRENCY))
+        self.async_shock_util = self._timed(
+                                'async_shock',
+                                lambda: AsyncShockUtil(
+                                    config, acl_cache=self.shock_util.acl_cache,
+                                    retry_policy=self.shock_util.retry_policy,
+                                    circuit_breaker=self.shock_util.circuit_breaker))
+        self.async_fan_out = FanOut(config.get('shock-async-concurrency', self.ASYNC_CONCURRENCY))
+        self.node_stores = dict()
+        self.register_node_store('shock', ShockNodeStore(self.shock_util, self.async_shock_util,
+                                                         self.fan_out, self.acl_fan_out,
+                                                         self.async_fan_out))
+        if config.get('memory-node-store', 'false') == 'true':
+            # handles of type 'memory' are served from process memory, for benchmarking only
+            self.register_node_store('memory', MemoryNodeStore())
+        self.max_page_limit = int(config.get('max-page-limit', self.MAX_PAGE_LIMIT))
+        self.hid_generator = HidGenerator(config.get('hid-generator', 'uuid4'))
         self.auth_url = config.get('auth-url')
         self.admin_roles = [role.strip() for role in config.get('admin-roles').split(',')]
 
         logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
                             level=logging.INFO)
+        logging.info('startup timings (seconds): {}'.format(self.startup_report()))
 
-    def fetch_handles_by(self, params):
+    def startup_report(self):
         """
-        query DB and return if element match one of entry in field column
+        return seconds spent starting each component, with the steps of mongo startup
+        """
+        report = dict(self.startup_timings)
+        for step, seconds in self.mongo_util.startup_timings.items():
+            report['mongo.{}'.format(step)] = seconds
+
+        return report
+
+    def shock_health(self):
+        """
+        return the state of the shock server as last checked, see ShockUtil.health
+        """
+        return self.shock_util.health()
+
+    def stats(self):
+        """
+        return the counters of the mongo connection pool and of the shock connections, acl cache,
+        retries, circuit breaker and hedging of this worker process
+        """
+        return {'mongo_pool': self.mongo_util.pool_stats(),
+                'shock_connections': self.shock_util.connection_stats(),
+                'shock_acl_cache': self.shock_util.cache_stats(),
+                'shock_resilience': self.shock_util.resilience_stats()}
+
+    def warm_up(self):
+        """
+        open connections ahead of the first requests, e.g. right after a worker is forked
+        """
+        self.mongo_util.warm_up()
+        self.shock_util.warm_up()
+        logging.info('startup timings (seconds): {}'.format(self.startup_report()))
+
+    def iter_handles_by(self, params):
+        """
+        query DB and return an iterator over the handles whose field column matches one of
+        elements, read from the DB cursor in batches as it is consumed
         """
         logging.info('start fetching handles')
 
@@ -112,13 +222,73 @@ class Handler:
         elements = params.get('elements')
         field_name = params.get('field_name')
 
-        docs = self.mongo_util.find_in(elements, field_name)
+        return self.mongo_util.find_in(elements, field_name, projection=self.HANDLE_PROJECTION)
+
+    def fetch_handles_by(self, params):
+        """
+        query DB and return if element match one of entry in field column
+        """
+        return list(self.iter_handles_by(params))
+
+    @staticmethod
+    def _encode_continuation_token(field_name, after):
+        """
+        return an opaque token for the page after the handle whose hid is after
+        """
+        # json keeps integer and string hids apart
+        token = json.dumps({'field_name': field_name, 'after': after})
+        return base64.urlsafe_b64encode(token.encode()).decode()
+
+    @staticmethod
+    def _decode_continuation_token(continuation_token, field_name):
+        """
+        return the hid the page of continuation_token starts after
+        """
+        try:
+            token = json.loads(base64.urlsafe_b64decode(continuation_token.encode()))
+            token_field_name, after = token['field_name'], token['after']
+        except Exception:
+            raise ValueError('Invalid continuation_token {}'.format(continuation_token))
+
+        if token_field_name != field_name:
+            raise ValueError('Cannot continue fetching handles by {} with a continuation_token '
+                             'of {}'.format(field_name, token_field_name))
+
+        return after
+
+    def fetch_handles_page(self, params):
+        """
+        query DB and return a page of the handles whose field column matches one of elements
+
+        returns {'handles': handles, 'continuation_token': token}, token fetching the next page
+        or None after the last page. pages are in hid order: handles persisted meanwhile show up
+        in a later page if their hid sorts after the current page
+        """
+        logging.info('start fetching a page of handles')
+
+        self.validate_params(params, ['elements', 'field_name'],
+                             opt_param=['limit', 'continuation_token'])
+
+        elements = params.get('elements')
+        field_name = params.get('field_name')
+
+        limit = int(params.get('limit') or self.PAGE_LIMIT)
+        if not 0 < limit <= self.max_page_limit:
+            raise ValueError('Unexpected limit {}, expected 1 to {}'
+                             .format(limit, self.max_page_limit))
+
+        after = None
+        if params.get('continuation_token'):
+            after = self._decode_continuation_token(params.get('continuation_token'), field_name)
+
+        handles, last_hid = self.mongo_util.find_page(elements, field_name, limit, after=after,
+                                                      projection=self.HANDLE_PROJECTION)
 
-        handles = list()
-        for doc in docs:
-            handles.append(doc)
+        continuation_token = None
+        if last_hid is not None:
+            continuation_token = self._encode_continuation_token(field_name, last_hid)
 
-        return handles
+        return {'handles': handles, 'continuation_token': continuation_token}
 
     def persist_handle(self, handle, user_id):
         """
@@ -126,30 +296,52 @@ class Handler:
 
         insert handle if handle does not exist
         otherwise update handle if it's created by token user
+
+        ownership is checked by Mongo in the same atomic upsert that writes the handle
         """
         logging.info('start persisting handle')
 
-        handle = self._process_handle(handle, user_id)
+        handle = self._prepare_handle(handle, user_id)
         hid = handle.get('hid')
 
-        try:
-            hid = int(hid)
-        except Exception:
-            pass
+        inserted = self.mongo_util.upsert_one(handle, user_id)
+        logging.info('{} handle {}'.format('inserted' if inserted else 'updated', hid))
 
-        docs = self.mongo_util.find_in([hid], 'hid')
+        return str(hid)
 
-        if docs.count():
-            # handle exists, update handle
-            if handle.get('created_by') != user_id:
-                raise ValueError('Cannot update handle not created by owner')
+    def persist_handles(self, handles, user_id):
+        """
+        writes handles to a persistent store in one batch, with the rules of persist_handle
 
-            self.mongo_util.update_one(handle)
-        else:
-            # handle doesn't exist, insert handle
-            self.mongo_util.insert_one(handle)
+        a handle that fails does not stop the others.
+        returns a list with, for each handle, {'hid': hid, 'error': None} or
+        {'hid': hid or None, 'error': message}
+        """
+        logging.info('start persisting {} handles'.format(len(handles)))
 
-        return str(hid)
+        results = [None] * len(handles)
+        docs = list()
+        positions = list()
+        for position, handle in enumerate(handles):
+            if not isinstance(handle, dict):
+                results[position] = {'hid': None, 'error': 'Handle must be a structure'}
+                continue
+
+            try:
+                doc = self._prepare_handle(handle, user_id)
+            except ValueError as e:
+                hid = handle.get('hid')
+                results[position] = {'hid': str(hid) if hid else None, 'error': str(e)}
+            else:
+                docs.append(doc)
+                positions.append(position)
+
+        if docs:
+            outcomes = self.mongo_util.upsert_many(docs, user_id)
+            for position, doc, outcome in zip(positions, docs, outcomes):
+                results[position] = {'hid': str(doc.get('hid')), 'error': outcome.get('error')}
+
+        return results
 
     def delete_handles(self, handles, user_id):
         """
@@ -167,22 +359,167 @@ class Handler:
 
         return deleted_count
 
-    def is_owner(self, hids, token, user_id):
+    def delete_handles_by_hid(self, hids, user_id):
         """
-        check and see if token user is owner.username from shock node
+        delete the handles of hids created by token user
+
+        ownership is checked by Mongo on the stored handles, in the delete itself.
+        returns a list with, for each hid, {'hid': hid, 'outcome': outcome}, outcome being
+        DELETED, NOT_FOUND or NOT_OWNER
         """
+        logging.info('start deleting {} handles by hid'.format(len(hids)))
 
-        handles = self.fetch_handles_by({'elements': hids, 'field_name': 'hid'})
+        if not hids:
+            return list()
+
+        stored_hids = [self._stored_hid(hid) for hid in hids]
+        deleted, not_owner = self.mongo_util.delete_owned(list(dict.fromkeys(stored_hids)),
+                                                          user_id)
+        deleted, not_owner = set(deleted), set(not_owner)
+
+        results = list()
+        for hid, stored_hid in zip(hids, stored_hids):
+            if stored_hid in deleted:
+                outcome = self.DELETED
+            elif stored_hid in not_owner:
+                outcome = self.NOT_OWNER
+            else:
+                outcome = self.NOT_FOUND
+            results.append({'hid': hid, 'outcome': outcome})
+
+        return results
+
+    def register_node_store(self, node_type, node_store):
+        """
+        serve handles of type node_type with node_store (a NodeStore)
+        """
+        self.node_stores[node_type] = node_store
 
+    def _get_node_store(self, node_type):
+        node_store = self.node_stores.get(node_type)
+        if node_store is None:
+            raise ValueError('Do not support node type {}'.format(node_type))
+
+        return node_store
+
+    def _owner_nodes(self, handles, user_id):
+        """
+        group handles with no recorded owner by node type and node
+
+        returns (node type -> node id -> hids, whether a recorded owner is not user_id).
+        grouping stops at the first mismatch
+        """
+        type_node_hids = dict()
         for handle in handles:
             node_type = handle.get('type')
-            if node_type != 'shock':
-                raise ValueError('Do not support node type other than Shock')
+            self._get_node_store(node_type)
+
+            owner = handle.get('node_owner')
+            if owner is None:
+                node_hids = type_node_hids.setdefault(node_type, dict())
+                node_hids.setdefault(handle.get('id'), list()).append(handle.get('hid'))
+            elif owner != user_id:
+                return type_node_hids, True
+
+        return type_node_hids, False
+
+    def _readable_nodes(self, handles):
+        """
+        returns node type -> node ids
+        """
+        type_node_ids = dict()
+        for handle in handles:
+            node_type = handle.get('type')
+            self._get_node_store(node_type)
+            type_node_ids.setdefault(node_type, list()).append(handle.get('id'))
+
+        return type_node_ids
+
+    def _acl_nodes(self, handles):
+        """
+        group handles by node type and node
+
+        returns (report with handles of unsupported types marked failed,
+        node type -> node id -> hids)
+        """
+        report = dict()
+        type_node_hids = dict()
+        for handle in handles:
+            hid = handle.get('hid')
+            node_type = handle.get('type')
+            if node_type not in self.node_stores:
+                logging.warning('Do not support node type {} of handle {}'.format(node_type, hid))
+                report[hid] = self.ACL_FAILED
+                continue
+
+            node_hids = type_node_hids.setdefault(node_type, dict())
+            node_hids.setdefault(handle.get('id'), list()).append(hid)
+
+        return report, type_node_hids
+
+    @staticmethod
+    def _report_outcomes(report, node_hids, outcomes):
+        for node_id, outcome in outcomes.items():
+            for hid in node_hids[node_id]:
+                report[hid] = outcome
+
+    def _record_owners(self, node_hids, owners):
+        for node_id, owner in owners.items():
+            try:
+                self.mongo_util.set_node_owner(node_hids[node_id], node_id, owner)
+            except ValueError as e:
+                logging.warning('Unable to record owner of node {}: {}'.format(node_id, e))
+
+    async def _run_blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, Deadline.bind(func), *args)
+
+    async def _find_handles_async(self, hids, projection):
+        return await self._run_blocking(
+                        lambda: list(self.mongo_util.find_in(hids, 'hid', projection=projection)))
+
+    def is_owner(self, hids, token, user_id):
+        """
+        check and see if token user is owner.username from shock node
+
+        node owners recorded on the handles are used directly. the rest are asked from the node
+        store of each handle type in one batch per store, stopping at the first node owned by
+        someone else, and recorded on the handles for later calls.
+        """
+
+        handles = self.mongo_util.find_in(hids, 'hid', projection=self.OWNER_PROJECTION)
+
+        type_node_hids, mismatch = self._owner_nodes(handles, user_id)
+        if mismatch:
+            return 0
+
+        for node_type, node_hids in type_node_hids.items():
+            owners = self._get_node_store(node_type).owners_of(list(node_hids), token,
+                                                               expected_owner=user_id)
+            self._record_owners(node_hids, owners)
+
+            if any(owner != user_id for owner in owners.values()):
+                return 0
+
+        return 1
+
+    async def is_owner_async(self, hids, token, user_id):
+        """
+        asyncio version of is_owner, for use from an async server
+        """
+
+        handles = await self._find_handles_async(hids, self.OWNER_PROJECTION)
+
+        type_node_hids, mismatch = self._owner_nodes(handles, user_id)
+        if mismatch:
+            return 0
 
-            node_id = handle.get('id')
-            owner = self.shock_util.get_owner(node_id, token)
+        for node_type, node_hids in type_node_hids.items():
+            owners = await self._get_node_store(node_type).owners_of_async(
+                                                list(node_hids), token, expected_owner=user_id)
+            await self._run_blocking(self._record_owners, node_hids, owners)
 
-            if owner != user_id:
+            if any(owner != user_id for owner in owners.values()):
                 return 0
 
         return 1
@@ -190,24 +527,71 @@ class Handler:
     def are_readable(self, hids, token):
         """
         check if nodes associated with handles is reachable/readable
+
+        each node store gets all of its nodes in one batch and stops at the first unreadable node
         """
 
         handles = self.fetch_handles_by({'elements': hids, 'field_name': 'hid'})
 
-        for handle in handles:
-            node_type = handle.get('type')
-            if node_type != 'shock':
-                raise ValueError('Do not support node type other than Shock')
+        for node_type, node_ids in self._readable_nodes(handles).items():
+            readable = self._get_node_store(node_type).readable(node_ids, token)
 
-            node_id = handle.get('id')
+            if not all(readable.values()):
+                return 0
+
+        return 1
 
-            is_readable = self.shock_util.is_readable(node_id, token)
+    async def are_readable_async(self, hids, token):
+        """
+        asyncio version of are_readable, for use from an async server
+        """
 
-            if not is_readable:
+        handles = await self._find_handles_async(hids, self.HANDLE_PROJECTION)
+
+        for node_type, node_ids in self._readable_nodes(handles).items():
+            readable = await self._get_node_store(node_type).readable_async(node_ids, token)
+
+            if not all(readable.values()):
                 return 0
 
         return 1
 
+    def bulk_add_read_acl(self, hids, token, username=None):
+        """
+        grant readable acl for username or global on all nodes and report outcome per hid
+
+        each node store gets all of its nodes in one batch; one failing node does not stop the
+        others.
+        returns a dict of hid -> 'granted', 'already-set' or 'failed'
+        """
+
+        handles = self.fetch_handles_by({'elements': hids, 'field_name': 'hid'})
+
+        report, type_node_hids = self._acl_nodes(handles)
+
+        for node_type, node_hids in type_node_hids.items():
+            outcomes = self._get_node_store(node_type).grant_read(list(node_hids), token,
+                                                                  username=username)
+            self._report_outcomes(report, node_hids, outcomes)
+
+        return report
+
+    async def bulk_add_read_acl_async(self, hids, token, username=None):
+        """
+        asyncio version of bulk_add_read_acl, for use from an async server
+        """
+
+        handles = await self._find_handles_async(hids, self.HANDLE_PROJECTION)
+
+        report, type_node_hids = self._acl_nodes(handles)
+
+        for node_type, node_hids in type_node_hids.items():
+            outcomes = await self._get_node_store(node_type).grant_read_async(
+                                                        list(node_hids), token, username=username)
+            self._report_outcomes(report, node_hids, outcomes)
+
+        return report
+
     def add_read_acl(self, hids, token, username=None):
         """
         grand readable acl for username or global if username is empty
@@ -216,17 +600,28 @@ class Handler:
         if not self._is_admin_user(token):
             raise ValueError('User may not run add_read_acl/set_public_read method')
 
-        handles = self.fetch_handles_by({'elements': hids, 'field_name': 'hid'})
+        report = self.bulk_add_read_acl(hids, token, username=username)
 
-        for handle in handles:
-            node_type = handle.get('type')
-            if node_type != 'shock':
-                raise ValueError('Do not support node type other than Shock')
-
-            node_id = handle.get('id')
-            try:
-                self.shock_util.add_read_acl(node_id, token, username=username)
-            except Exception:
-                raise ValueError("Unable to set acl(s) on handles {}".format(handle.get('hid')))
+        failed_hids = [hid for hid, outcome in report.items() if outcome == self.ACL_FAILED]
+        if failed_hids:
+            raise ValueError("Unable to set acl(s) on handles {}".format(
+                                                        ', '.join(map(str, failed_hids))))
 
         return 1
+
+    def add_read_acl_report(self, hids, token, username=None):
+        """
+        grant readable acl for username or global if username is empty, like add_read_acl, but
+        report the outcome per hid instead of failing
+
+        returns a list with, for each hid, {'hid': hid, 'outcome': outcome}, outcome being
+        'granted', 'already-set', 'failed' or NOT_FOUND
+        """
+
+        if not self._is_admin_user(token):
+            raise ValueError('User may not run add_read_acl_report method')
+
+        report = self.bulk_add_read_acl(hids, token, username=username or None)
+
+        return [{'hid': hid, 'outcome': report.get(self._stored_hid(hid), self.NOT_FOUND)}
+                for hid in hids]
@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class Hedger:
+    """
+    Sends a duplicate of a slow read-only call and returns whichever copy answers first.
+
+    A call is hedged when it has not answered within the given percentile of recent
+    latencies (at least min_delay seconds). Hedged calls never exceed budget (a fraction)
+    of all calls.
+
+    Calls never queue for the max_workers threads: a call that cannot be hedged, or finds no
+    free thread for itself and its hedge, runs on the caller's thread.
+    """
+
+    WINDOW = 1000  # latency samples kept
+    REFRESH = 50  # recompute the hedge delay every REFRESH samples
+
+    def __init__(self, percentile, budget, min_delay, min_samples, max_workers):
+        self.percentile = float(percentile)
+        self.budget = float(budget)
+        self.min_delay = float(min_delay)
+        self.min_samples = int(min_samples)
+
+        self.max_workers = int(max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix='hedge')
+        self._lock = threading.Lock()
+        self._busy_workers = 0
+        self._latencies = deque(maxlen=self.WINDOW)
+        self._new_samples = 0
+        self._delay = None
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            self._new_samples += 1
+            if len(self._latencies) >= self.min_samples and (self._delay is None or
+                                                             self._new_samples >= self.REFRESH):
+                latencies = sorted(self._latencies)
+                idx = min(int(len(latencies) * self.percentile / 100), len(latencies) - 1)
+                self._delay = max(latencies[idx], self.min_delay)
+                self._new_samples = 0
+
+    def _has_budget(self):
+        return self.hedged + 1 <= self.budget * self.calls
+
+    def _take_budget(self):
+        with self._lock:
+            if not self._has_budget():
+                return False
+            self.hedged += 1
+            return True
+
+    def _reserve_workers(self, count):
+        """
+        reserve count executor threads, so that submitted calls start at once
+        """
+        with self._lock:
+            if self._busy_workers + count > self.max_workers:
+                return False
+            self._busy_workers += count
+            return True
+
+    def _release_worker(self, future):
+        with self._lock:
+            self._busy_workers -= 1
+
+    def _submit(self, func):
+        future = self._executor.submit(self._timed, func)
+        future.add_done_callback(self._release_worker)
+        return future
+
+    def _timed(self, func):
+        start = time.monotonic()
+        result = func()
+        self._record(time.monotonic() - start)
+        return result
+
+    def delay(self):
+        """
+        return seconds to wait before hedging, None until enough latencies are known
+        """
+        with self._lock:
+            return self._delay
+
+    def call(self, func):
+        """
+        call func (which must be safe to run twice) and return its result
+        """
+        with self._lock:
+            self.calls += 1
+            delay = self._delay
+            can_hedge = delay is not None and self._has_budget()
+
+        # the primary only leaves the caller's thread when a hedge could be sent next to it
+        if not can_hedge or not self._reserve_workers(2):
+            return self._timed(func)
+
+        primary = self._submit(func)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_budget():
+            self._release_worker(None)  # the thread reserved for the hedge is not needed
+            return primary.result()
+
+        logging.info('hedging request not answered within {:.3f}s'.format(delay))
+        hedge = self._submit(func)
+
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        succeeded = [future for future in done if future.exception() is None]
+        if not succeeded:
+            # first copy failed, the other one may still succeed
+            done, _ = wait([primary, hedge])
+            succeeded = [future for future in done if future.exception() is None]
+            if not succeeded:
+                return primary.result()
+
+        first = succeeded[0]
+        if first is hedge:
+            with self._lock:
+                self.hedge_wins += 1
+
+        return first.result()
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls,
+                    'hedged': self.hedged,
+                    'hedge_wins': self.hedge_wins,
+                    'delay': self._delay}
@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+import uuid
+
+
+class HidGenerator:
+    """
+    Mints the hids of new handles.
+
+    uuid4 hids are random. ulid hids start with the minting time in milliseconds followed by 80
+    random bits (https://github.com/ulid/spec), so new handles are inserted at the end of the _id
+    index instead of all over it. Both stay unique across processes without coordination.
+    """
+
+    PREFIX = 'KBH_'
+    GENERATORS = ['uuid4', 'ulid']
+
+    ENCODING = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford's base32, sorts as the values do
+    RANDOM_BITS = 80
+
+    def __init__(self, generator='uuid4'):
+        if generator not in self.GENERATORS:
+            raise ValueError('Unexpected hid-generator {}, expected one of {}'
+                             .format(generator, self.GENERATORS))
+
+        self.generator = generator
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_random = 0
+
+    def new_hid(self):
+        """
+        return a new hid
+        """
+        if self.generator == 'ulid':
+            return self.PREFIX + self._new_ulid()
+
+        return self.PREFIX + str(uuid.uuid4())
+
+    def _new_ulid(self):
+        now_ms = int(time.time() * 1000)
+
+        with self._lock:
+            if now_ms <= self._last_ms:
+                # same millisecond (or clock stepped back): keep order by incrementing the random
+                # part of the last ulid, moving on to the next millisecond when it overflows
+                now_ms = self._last_ms
+                random_part = self._last_random + 1
+                if random_part >> self.RANDOM_BITS:
+                    now_ms += 1
+                    random_part = int.from_bytes(os.urandom(self.RANDOM_BITS // 8), 'big')
+            else:
+                random_part = int.from_bytes(os.urandom(self.RANDOM_BITS // 8), 'big')
+
+            self._last_ms, self._last_random = now_ms, random_part
+
+        return self._encode((now_ms << self.RANDOM_BITS) | random_part, 26)
+
+    @classmethod
+    def _encode(cls, value, length):
+        return ''.join(cls.ENCODING[(value >> (5 * position)) & 31]
+                       for position in reversed(range(length)))
@@ -0,0 +1,164 @@
+import logging
+import os
+import threading
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+
+
+class _PoolStatsListener(ConnectionPoolListener):
+    """
+    counts connection pool events of one MongoClient
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checkouts_started = 0
+        self.checked_out = 0
+        self.checked_in = 0
+        self.checkout_failures = 0
+        self.cleared = 0
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count('cleared')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count('created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count('closed')
+
+    def connection_check_out_started(self, event):
+        self._count('checkouts_started')
+
+    def connection_check_out_failed(self, event):
+        self._count('checkout_failures')
+        logging.warning('Mongo connection check out failed: {}'.format(event.reason))
+
+    def connection_checked_out(self, event):
+        self._count('checked_out')
+
+    def connection_checked_in(self, event):
+        self._count('checked_in')
+
+    def stats(self):
+        with self._lock:
+            return {'open': self.created - self.closed,
+                    'in_use': self.checked_out - self.checked_in,
+                    'waiting': self.checkouts_started - self.checked_out - self.checkout_failures,
+                    'checkouts': self.checked_out,
+                    'checkout_failures': self.checkout_failures,
+                    'cleared': self.cleared}
+
+
+class MongoPool:
+    """
+    Process-wide registry of MongoClients, one per (host, port, database).
+
+    A MongoClient is thread-safe and keeps its own connection pool, so every MongoUtil of a
+    process shares one. Clients must not be used across fork: clients are kept per process, and
+    MongoUtil asks again for the client of a uwsgi worker forked after the master connected.
+    """
+
+    MAX_POOL_SIZE = 20  # connections per worker process (uwsgi 5 threads plus parallel queries)
+    MIN_POOL_SIZE = 0
+    WAIT_QUEUE_TIMEOUT_MS = 10000  # how long a thread waits for a free connection
+
+    # config key -> MongoClient option, applied only when set
+    CONFIG_OPTIONS = [('mongo-socket-timeout-ms', 'socketTimeoutMS', int),
+                      ('mongo-connect-timeout-ms', 'connectTimeoutMS', int),
+                      ('mongo-server-selection-timeout-ms', 'serverSelectionTimeoutMS', int),
+                      ('mongo-compressors', 'compressors', str),
+                      ('mongo-write-concern', 'w', lambda w: int(w) if w.isdigit() else w),
+                      ('mongo-read-concern', 'readConcernLevel', str)]
+
+    _clients = dict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def client_options(cls, config):
+        """
+        return MongoClient options from config
+        """
+        options = {'maxPoolSize': int(config.get('mongo-max-pool-size', cls.MAX_POOL_SIZE)),
+                   'minPoolSize': int(config.get('mongo-min-pool-size', cls.MIN_POOL_SIZE)),
+                   'waitQueueTimeoutMS': int(config.get('mongo-wait-queue-timeout-ms',
+                                                        cls.WAIT_QUEUE_TIMEOUT_MS))}
+
+        for key, option, convert in cls.CONFIG_OPTIONS:
+            value = str(config.get(key, '')).strip()
+            if value:
+                options[option] = convert(value)
+
+        return options
+
+    @classmethod
+    def _key(cls, host, port, database):
+        return os.getpid(), host, port, database
+
+    @classmethod
+    def get_client(cls, host, port, database, options):
+        """
+        return the client of the current process for host, port and database, creating it with
+        options on first use
+        """
+        key = cls._key(host, port, database)
+        with cls._lock:
+            entry = cls._clients.get(key)
+            if entry is None:
+                logging.info('creating Mongo client for {}:{}/{} with {}'.format(
+                                                            host, port, database, options))
+                listener = _PoolStatsListener()
+                client = MongoClient(host, port, event_listeners=[listener], **options)
+                entry = {'client': client, 'listener': listener, 'options': options}
+                cls._clients[key] = entry
+            elif entry['options'] != options:
+                logging.warning('Mongo client for {}:{}/{} already exists, ignoring options {}'
+                                .format(host, port, database, options))
+
+        return entry['client']
+
+    @classmethod
+    def discard(cls, host, port, database):
+        """
+        close and forget the client of the current process, e.g. after it failed to connect
+        """
+        with cls._lock:
+            entry = cls._clients.pop(cls._key(host, port, database), None)
+
+        if entry is not None:
+            entry['client'].close()
+
+    @classmethod
+    def stats(cls, host, port, database):
+        """
+        return pool options and counters of the client of the current process, None if none
+        """
+        with cls._lock:
+            entry = cls._clients.get(cls._key(host, port, database))
+
+        if entry is None:
+            return None
+
+        stats = entry['listener'].stats()
+        stats['max_pool_size'] = entry['options']['maxPoolSize']
+        stats['min_pool_size'] = entry['options']['minPoolSize']
+
+        return stats
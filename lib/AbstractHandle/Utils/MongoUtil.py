@@ -1,13 +1,51 @@
 
 import logging
-from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError
+from pymongo import ASCENDING, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, ServerSelectionTimeoutError
+from pymongo.read_preferences import (Nearest, Primary, PrimaryPreferred, Secondary,
+                                      SecondaryPreferred)
+import os
 import subprocess
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from AbstractHandle.Utils.Deadline import Deadline
+from AbstractHandle.Utils.FanOut import FanOut
+from AbstractHandle.Utils.HandleCodec import HandleCodec
+from AbstractHandle.Utils.MongoPool import MongoPool
+from AbstractHandle.Utils.WriteBuffer import WriteBuffer
 
 
 class MongoUtil:
 
+    # lookup fields indexed at startup, each followed by _id so that pages of a lookup are read
+    # in _id order from the index. _id is always indexed
+    INDEXES = ['id', 'created_by', 'node_owner']
+    # hid duplicates _id, so hid lookups are served by the _id index
+    FIELD_ALIASES = {'hid': '_id'}
+    DUPLICATE_KEY_ERROR = 11000  # mongo error code
+    QUERY_CHUNK_SIZE = 10000  # max elements of one $in query
+    QUERY_PARALLELISM = 4  # max chunks of one find_in queried at a time
+    GROUP_COMMIT_SIZE = 0  # max upserts of one group commit, 0 to write each on its own
+    GROUP_COMMIT_DELAY_MS = 5  # how long a group commit waits for more upserts
+    # service: start the local mongod service, then connect and check the server before serving
+    # sync: connect and check the server before serving, without service management
+    # lazy: connect on first use
+    STARTUP_MODES = ['service', 'sync', 'lazy']
+    # plain: docs are stored as handles
+    # compact: docs are stored in the compact form of HandleCodec
+    ENCODINGS = ['plain', 'compact']
+    # attributes set once connected, a first access connects in lazy startup mode
+    LAZY_ATTRIBUTES = ['codec', 'indexed_fields']
+
+    READ_PREFERENCES = {'primary': Primary,
+                        'primaryPreferred': PrimaryPreferred,
+                        'secondary': Secondary,
+                        'secondaryPreferred': SecondaryPreferred,
+                        'nearest': Nearest}
+
     def _start_service(self):
         logging.info('starting mongod service')
 
@@ -27,13 +65,17 @@ class MongoUtil:
     def _get_collection(self, mongo_host, mongo_port, mongo_database, mongo_collection):
         """
         connect Mongo server and return a collection
+
+        the client and its connection pool are shared by the whole process
         """
 
-        my_client = MongoClient(mongo_host, mongo_port)
+        my_client = MongoPool.get_client(mongo_host, mongo_port, mongo_database,
+                                         self.client_options)
 
         try:
             my_client.server_info()  # force a call to server
         except ServerSelectionTimeoutError as e:
+            MongoPool.discard(mongo_host, mongo_port, mongo_database)
             error_msg = 'Connot connect to Mongo server\n'
             error_msg += 'ERROR -- {}:\n{}'.format(
                             e,
@@ -46,28 +88,278 @@ class MongoUtil:
 
         return my_collection
 
+    def _get_read_preference(self, config):
+        """
+        return read preference of read-only queries from config
+        """
+        mode = config.get('mongo-read-preference', 'primary')
+        max_staleness = int(config.get('mongo-max-staleness-seconds', -1))
+
+        if mode not in self.READ_PREFERENCES:
+            raise ValueError('Unexpected mongo-read-preference {}, expected one of {}'
+                             .format(mode, list(self.READ_PREFERENCES)))
+
+        if mode == 'primary':
+            return Primary()
+
+        return self.READ_PREFERENCES[mode](max_staleness=max_staleness)
+
     def __init__(self, config):
         self.mongo_host = config['mongo-host']
         self.mongo_port = int(config['mongo-port'])
         self.mongo_database = config['mongo-database']
         self.mongo_collection = config['mongo-collection']
+        self.client_options = MongoPool.client_options(config)
+        self.read_preference = self._get_read_preference(config)
+        self.strict_indexes = config.get('mongo-strict-indexes', 'false') == 'true'
+        self.warm_up_connections = int(config.get('mongo-warm-up-connections', 0))
+        self.query_chunk_size = max(int(config.get('mongo-query-chunk-size',
+                                                   self.QUERY_CHUNK_SIZE)), 1)
+        self.query_fan_out = FanOut(config.get('mongo-query-parallelism', self.QUERY_PARALLELISM))
+
+        self.write_buffer = None
+        group_commit_size = int(config.get('mongo-group-commit-size', self.GROUP_COMMIT_SIZE))
+        if group_commit_size > 0:
+            group_commit_delay_ms = float(config.get('mongo-group-commit-delay-ms',
+                                                     self.GROUP_COMMIT_DELAY_MS))
+            self.write_buffer = WriteBuffer(self._upsert_pairs, group_commit_size,
+                                            group_commit_delay_ms / 1000)
 
-        self._start_service()
-        self.handle_collection = self._get_collection(self.mongo_host, self.mongo_port,
-                                                      self.mongo_database, self.mongo_collection)
+        self.startup = config.get('mongo-startup', 'service')
+        if self.startup not in self.STARTUP_MODES:
+            raise ValueError('Unexpected mongo-startup {}, expected one of {}'
+                             .format(self.startup, self.STARTUP_MODES))
+
+        self.encoding = config.get('mongo-encoding', 'plain')
+        if self.encoding not in self.ENCODINGS:
+            raise ValueError('Unexpected mongo-encoding {}, expected one of {}'
+                             .format(self.encoding, self.ENCODINGS))
+
+        self.startup_timings = dict()
+        self._connect_lock = threading.RLock()
+
+        if self.startup == 'service':
+            self._timed('service', self._start_service)
+        if self.startup != 'lazy':
+            self._connect()
 
         logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
                             level=logging.INFO)
 
-    def find_in(self, elements, field_name, projection={'_id': False}, batch_size=1000):
+    def __getattr__(self, name):
+        # only called for attributes not set yet
+        if name in self.LAZY_ATTRIBUTES and self.__dict__.get('startup') == 'lazy':
+            self._connect()
+            return self.__dict__[name]
+
+        raise AttributeError("'{}' object has no attribute '{}'"
+                             .format(type(self).__name__, name))
+
+    def _timed(self, step, func, *args):
+        start = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            self.startup_timings[step] = round(time.monotonic() - start, 3)
+            logging.info('mongo {} took {}s'.format(step, self.startup_timings[step]))
+
+    def _connect(self):
+        """
+        connect, ensure indexes and set the LAZY_ATTRIBUTES, once
+        """
+        with self._connect_lock:
+            if 'indexed_fields' in self.__dict__:
+                return
+
+            self._set_collections(self._timed('connect', self._get_collection,
+                                              self.mongo_host, self.mongo_port,
+                                              self.mongo_database, self.mongo_collection))
+            self.codec = None
+            if self.encoding == 'compact':
+                self.codec = HandleCodec(self.handle_collection)
+                self._timed('dictionary', self.codec.load)
+            self._timed('indexes', self._ensure_indexes)
+
+    def _set_collections(self, handle_collection):
+        self._handle_collection = handle_collection
+        # writes always go to the primary, read-only queries follow the read preference
+        self._read_collection = handle_collection.with_options(
+                                                        read_preference=self.read_preference)
+        self._collections_pid = os.getpid()
+
+    def _process_collection(self, name):
+        """
+        return the collection name of the current process
+
+        a client must not be used across fork: a uwsgi worker forked after the master connected
+        gets a client of its own from MongoPool on first use
+        """
+        if self.__dict__.get('_collections_pid') != os.getpid():
+            self._connect()
+            with self._connect_lock:
+                if self._collections_pid != os.getpid():
+                    logging.info('opening Mongo client of process {}'.format(os.getpid()))
+                    client = MongoPool.get_client(self.mongo_host, self.mongo_port,
+                                                  self.mongo_database, self.client_options)
+                    self._set_collections(client[self.mongo_database][self.mongo_collection])
+                    if self.codec is not None:
+                        self.codec.use_collection(self._handle_collection)
+
+        return self.__dict__[name]
+
+    @property
+    def handle_collection(self):
+        return self._process_collection('_handle_collection')
+
+    @property
+    def read_collection(self):
+        return self._process_collection('_read_collection')
+
+    def warm_up(self, connections=None):
+        """
+        connect now and open connections (mongo-warm-up-connections by default) of the pool
+        ahead of the first requests
+
+        failures are logged, the first request connects again
+        """
+        connections = self.warm_up_connections if connections is None else connections
+
+        def ping(_):
+            self.handle_collection.database.command('ping')
+
+        try:
+            self._connect()
+            # concurrent pings each need a connection of their own
+            with ThreadPoolExecutor(max_workers=max(connections, 1)) as executor:
+                self._timed('warm_up', lambda: list(executor.map(ping, range(connections))))
+        except Exception as e:
+            logging.warning('Mongo warm up failed: {}'.format(e))
+
+    def pool_stats(self):
+        """
+        return options and counters of the connection pool shared by this process
+        """
+        self._process_collection('_handle_collection')  # the client of this process
+        return MongoPool.stats(self.mongo_host, self.mongo_port, self.mongo_database)
+
+    def _ensure_indexes(self):
+        """
+        create missing indexes and record the fields an index can serve lookups on
+        """
+        for field in self.INDEXES:
+            self.handle_collection.create_index([(self._key(field), ASCENDING),
+                                                 ('_id', ASCENDING)], background=True)
+
+        # a compound index serves lookups on its first field
+        self.indexed_fields = {index['key'][0][0]
+                               for index in self.handle_collection.index_information().values()}
+        logging.info('indexed fields: {}'.format(sorted(self.indexed_fields)))
+
+    def _query_field(self, field_name):
+        """
+        return the field to query for field_name
+
+        querying a field no index starts with would scan the whole collection: it is refused if
+        mongo-strict-indexes is set and logged as a warning otherwise
+        """
+        field_name = self.FIELD_ALIASES.get(field_name, field_name)
+
+        if self._key(field_name) not in self.indexed_fields:
+            if self.strict_indexes:
+                raise ValueError('Cannot query unindexed field {}'.format(field_name))
+            logging.warning('querying unindexed field {} scans the whole collection'
+                            .format(field_name))
+
+        return self._key(field_name)
+
+    def _key(self, field_name):
+        """
+        return the key of field_name in stored docs
+        """
+        return field_name if self.codec is None else self.codec.key(field_name)
+
+    def _encode_doc(self, doc):
+        """
+        return the doc to store for doc
+        """
+        return doc if self.codec is None else self.codec.encode_doc(doc)
+
+    def _encode_query(self, elements, field_name, projection):
+        """
+        return elements and projection of stored docs for a lookup of handles
+        """
+        if self.codec is None:
+            return elements, projection
+
+        elements = self.codec.encode_values(field_name, elements)
+        if projection is not None:
+            projection = self.codec.encode_projection(projection)
+
+        return elements, projection
+
+    def find_in(self, elements, field_name, projection={'_id': False}, batch_size=1000,
+                primary=False):
         """
         return cursor that contains docs which field column is in elements
+
+        the query follows mongo-read-preference and may return slightly stale docs from a
+        secondary, unless primary is set.
+        the query may run for the time left to the request deadline at most (maxTimeMS)
+
+        more than mongo-query-chunk-size distinct elements are split into chunks queried in
+        parallel (mongo-query-parallelism at a time); an iterator over the docs of all chunks is
+        returned instead of a cursor. docs stored in compact encoding are also returned by an
+        iterator, decoded as they are read
         """
         logging.info('start querying MongoDB')
 
+        query_field = self._query_field(field_name)
+        keep_id = projection is None or projection.get('_id', True)
+        elements, projection = self._encode_query(elements, field_name, projection)
+
+        if len(elements) > self.query_chunk_size:
+            elements = list(dict.fromkeys(elements))  # drop duplicates, keep order
+
+        if len(elements) > self.query_chunk_size:
+            docs = self._find_chunks(elements, query_field, projection, batch_size, primary)
+        else:
+            docs = self._find(elements, query_field, projection, batch_size, primary)
+
+        if self.codec is not None:
+            return (self.codec.decode_doc(doc, keep_id=keep_id) for doc in docs)
+
+        return docs
+
+    def _find_chunks(self, elements, query_field, projection, batch_size, primary):
+        """
+        yield docs of the chunks of elements in order, querying the next chunks meanwhile
+
+        each doc matches a single element and elements are distinct, so no doc is returned twice
+        """
+        chunks = [elements[i:i + self.query_chunk_size]
+                  for i in range(0, len(elements), self.query_chunk_size)]
+        logging.info('querying {} elements in {} chunks'.format(len(elements), len(chunks)))
+
+        def find_chunk(chunk):
+            return list(self._find(chunk, query_field, projection, batch_size, primary))
+
+        for docs in self.query_fan_out.imap(find_chunk, chunks):
+            yield from docs
+
+    @staticmethod
+    def _max_time_ms():
+        remaining = Deadline.remaining_time()
+        return None if remaining is None else max(int(remaining * 1000), 1)
+
+    def _find(self, elements, query_field, projection, batch_size, primary):
+        Deadline.check('querying MongoDB')
+        max_time_ms = self._max_time_ms()
+
         try:
-            result = self.handle_collection.find({field_name: {'$in': elements}},
-                                                 projection=projection, batch_size=batch_size)
+            collection = self.handle_collection if primary else self.read_collection
+            result = collection.find({query_field: {'$in': elements}},
+                                     projection=projection, batch_size=batch_size,
+                                     max_time_ms=max_time_ms)
         except Exception as e:
             error_msg = 'Connot query doc\n'
             error_msg += 'ERROR -- {}:\n{}'.format(
@@ -75,18 +367,79 @@ class MongoUtil:
                             ''.join(traceback.format_exception(None, e, e.__traceback__)))
             raise ValueError(error_msg)
 
-        logging.info('returned {} results'.format(result.count()))
-
         return result
 
+    @staticmethod
+    def _after_filter(after):
+        """
+        return filter of the docs sorted after the doc whose _id is after
+        """
+        if isinstance(after, str):
+            return {'_id': {'$gt': after}}
+
+        # numbers sort before strings, and $gt only matches values of the type of after
+        return {'$or': [{'_id': {'$gt': after}}, {'_id': {'$type': 'string'}}]}
+
+    def find_page(self, elements, field_name, limit, after=None, projection={'_id': False},
+                  primary=False):
+        """
+        return a page of at most limit docs which field column is in elements, in _id order and
+        starting after the doc whose _id is after, and the _id of the last doc of the page if
+        more docs follow (None otherwise)
+
+        the lookup field is indexed together with _id, so a page is a range scan of the index
+        whatever its position in the results
+        """
+        logging.info('start querying a page of MongoDB')
+
+        query_field = self._query_field(field_name)
+        keep_id = projection is None or projection.get('_id', True)
+        elements, projection = self._encode_query(elements, field_name, projection)
+
+        query = {query_field: {'$in': elements}}
+        if after is not None:
+            query = {'$and': [query, self._after_filter(after)]}
+
+        # _id is needed to continue after the last doc
+        if projection is not None:
+            projection = dict(projection, _id=True)
+
+        Deadline.check('querying MongoDB')
+        max_time_ms = self._max_time_ms()
+
+        try:
+            collection = self.handle_collection if primary else self.read_collection
+            # one doc more than limit tells if another page follows
+            docs = list(collection.find(query, projection=projection, sort=[('_id', ASCENDING)],
+                                        limit=limit + 1, max_time_ms=max_time_ms))
+        except Exception as e:
+            error_msg = 'Connot query doc\n'
+            error_msg += 'ERROR -- {}:\n{}'.format(
+                            e,
+                            ''.join(traceback.format_exception(None, e, e.__traceback__)))
+            raise ValueError(error_msg)
+
+        last_id = docs[limit - 1]['_id'] if len(docs) > limit else None
+        docs = docs[:limit]
+
+        if self.codec is not None:
+            docs = [self.codec.decode_doc(doc, keep_id=keep_id) for doc in docs]
+        elif not keep_id:
+            for doc in docs:
+                doc.pop('_id')
+
+        return docs, last_id
+
     def insert_one(self, doc):
         """
         insert a doc into collection
         """
         logging.info('start inserting document')
 
+        Deadline.check('inserting document')
+
         try:
-            self.handle_collection.insert_one(doc)
+            self.handle_collection.insert_one(self._encode_doc(doc))
         except Exception as e:
             error_msg = 'Connot insert doc\n'
             error_msg += 'ERROR -- {}:\n{}'.format(
@@ -102,9 +455,14 @@ class MongoUtil:
         """
         logging.info('start updating document')
 
+        Deadline.check('updating document')
+
         try:
-            update_filter = {'hid': doc.get('hid')}
-            update = {'$set': doc}
+            update_filter = {'_id': doc.get('hid')}
+            update = {'$set': self._encode_doc(doc)}
+            if 'node_owner' not in doc:
+                # node id may have changed, drop the recorded owner of the old node
+                update['$unset'] = {self._key('node_owner'): ''}
             self.handle_collection.update_one(update_filter, update)
         except Exception as e:
             error_msg = 'Connot update doc\n'
@@ -115,14 +473,162 @@ class MongoUtil:
 
         return True
 
+    def _upsert_update(self, doc, owner):
+        """
+        return filter and update of an upsert that only matches a doc created by owner
+        """
+        update_filter = {'_id': doc.get('hid'), self._key('created_by'): owner}
+        update = {'$set': {k: v for k, v in self._encode_doc(doc).items() if k != '_id'}}
+        if 'node_owner' not in doc:
+            # node id may have changed, drop the recorded owner of the old node
+            update['$unset'] = {self._key('node_owner'): ''}
+
+        return update_filter, update
+
+    def upsert_one(self, doc, owner):
+        """
+        insert doc, or update the doc with the same hid if it is created by owner
+
+        a doc whose created_by is not owner can only be inserted.
+        one atomic round trip; returns True if doc was inserted, False if it was updated.
+
+        with mongo-group-commit-size set, concurrent upserts are written together in one bulk
+        write, each still getting its own result
+        """
+        logging.info('start upserting document')
+
+        Deadline.check('upserting document')
+
+        if self.write_buffer is not None:
+            result = self.write_buffer.submit((doc, owner))
+            if 'error' in result:
+                raise ValueError(result['error'])
+            return result['inserted']
+
+        insert_only = doc.get('created_by') != owner
+
+        # a duplicate key means a doc with hid exists but is not created by owner, unless it was
+        # inserted meanwhile by a concurrent upsert: try once more to tell the two apart
+        for attempt in range(1 if insert_only else 2):
+            try:
+                if insert_only:
+                    self.handle_collection.insert_one(self._encode_doc(doc))
+                    return True
+
+                update_filter, update = self._upsert_update(doc, owner)
+                result = self.handle_collection.update_one(update_filter, update, upsert=True)
+            except DuplicateKeyError:
+                continue
+            except Exception as e:
+                error_msg = 'Connot upsert doc\n'
+                error_msg += 'ERROR -- {}:\n{}'.format(
+                                e,
+                                ''.join(traceback.format_exception(None, e, e.__traceback__)))
+                raise ValueError(error_msg)
+            else:
+                return result.upserted_id is not None
+
+        raise ValueError('Cannot update handle not created by owner')
+
+    def upsert_many(self, docs, owner):
+        """
+        upsert_one for many docs in one unordered bulk write
+
+        a failing doc does not stop the others.
+        returns a list with, for each doc, {'inserted': True or False} or {'error': message}
+        """
+        logging.info('start upserting {} documents'.format(len(docs)))
+
+        return self._upsert_pairs([(doc, owner) for doc in docs])
+
+    def _upsert_pairs(self, pairs):
+        """
+        upsert_many for a list of (doc, owner) pairs, owners may differ
+        """
+        Deadline.check('upserting documents')
+
+        results = [None] * len(pairs)
+        pending = list(range(len(pairs)))
+
+        # docs failing with a duplicate key are tried once more, as in upsert_one
+        for attempt in range(2):
+            if not pending:
+                break
+
+            requests = list()
+            for doc_index in pending:
+                doc, owner = pairs[doc_index]
+                if doc.get('created_by') != owner:
+                    requests.append(InsertOne(self._encode_doc(doc)))
+                else:
+                    update_filter, update = self._upsert_update(doc, owner)
+                    requests.append(UpdateOne(update_filter, update, upsert=True))
+
+            try:
+                result = self.handle_collection.bulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                write_errors = {error['index']: error for error in e.details['writeErrors']}
+                upserted = {upsert['index'] for upsert in e.details['upserted']}
+            except Exception as e:
+                error_msg = 'Connot upsert docs\n'
+                error_msg += 'ERROR -- {}:\n{}'.format(
+                                e,
+                                ''.join(traceback.format_exception(None, e, e.__traceback__)))
+                raise ValueError(error_msg)
+            else:
+                write_errors = dict()
+                upserted = set(result.upserted_ids)
+
+            retry = list()
+            for request_index, doc_index in enumerate(pending):
+                doc, owner = pairs[doc_index]
+                insert_only = doc.get('created_by') != owner
+                error = write_errors.get(request_index)
+
+                if error is None:
+                    results[doc_index] = {'inserted': insert_only or request_index in upserted}
+                elif error['code'] != self.DUPLICATE_KEY_ERROR:
+                    results[doc_index] = {'error': 'Connot upsert doc\n{}'.format(error['errmsg'])}
+                elif attempt == 0 and not insert_only:
+                    retry.append(doc_index)
+                else:
+                    results[doc_index] = {'error': 'Cannot update handle not created by owner'}
+
+            pending = retry
+
+        return results
+
+    def set_node_owner(self, hids, node_id, owner):
+        """
+        record the owner of node on handles that still point to the node
+        """
+        logging.info('start recording node owner')
+
+        Deadline.check('recording node owner')
+
+        try:
+            update_filter = {'_id': {'$in': hids}, self._key('id'): node_id}
+            update = {'$set': {self._key('node_owner'): owner}}
+            self.handle_collection.update_many(update_filter, update)
+        except Exception as e:
+            error_msg = 'Connot update docs\n'
+            error_msg += 'ERROR -- {}:\n{}'.format(
+                            e,
+                            ''.join(traceback.format_exception(None, e, e.__traceback__)))
+            raise ValueError(error_msg)
+
+        return True
+
     def delete_one(self, doc):
         """
         delete a doc
         """
         logging.info('start deleting document')
 
+        Deadline.check('deleting document')
+
         try:
-            delete_filter = {'hid': doc.get('hid')}
+            delete_filter = {'_id': doc.get('hid')}
             self.handle_collection.delete_one(delete_filter)
         except Exception as e:
             error_msg = 'Connot delete doc\n'
@@ -133,15 +639,63 @@ class MongoUtil:
 
         return True
 
+    def delete_owned(self, hids, owner):
+        """
+        delete the docs of hids created by owner
+
+        owners are read from the primary first, to tell docs not created by owner from missing
+        ones. the delete is then one round trip, filtered on owner by Mongo.
+        returns the hids of the deleted docs and the hids of the docs not created by owner
+
+        if fewer docs than expected are deleted, owners are read again: docs replaced meanwhile
+        by docs of another owner are reported as not created by owner. docs gone meanwhile are
+        reported as deleted, a concurrent delete of the same doc reports it too.
+        """
+        logging.info('start deleting documents of owner')
+
+        Deadline.check('deleting documents')
+
+        created_by = self._key('created_by')
+        try:
+            owners = self._read_owners(hids, created_by)
+            owned = [hid for hid, doc_owner in owners.items() if doc_owner == owner]
+            if owned:
+                delete_filter = {'_id': {'$in': owned}, created_by: owner}
+                result = self.handle_collection.delete_many(delete_filter)
+                if result.deleted_count != len(owned):
+                    logging.warning('{} of {} documents were deleted or replaced meanwhile'.format(
+                                                len(owned) - result.deleted_count, len(owned)))
+                    owners.update(self._read_owners(owned, created_by))
+        except Exception as e:
+            error_msg = 'Connot delete docs\n'
+            error_msg += 'ERROR -- {}:\n{}'.format(
+                            e,
+                            ''.join(traceback.format_exception(None, e, e.__traceback__)))
+            raise ValueError(error_msg)
+
+        return ([hid for hid in owned if owners[hid] == owner],
+                [hid for hid, doc_owner in owners.items() if doc_owner != owner])
+
+    def _read_owners(self, hids, created_by):
+        """
+        return hid -> created_by of the stored docs of hids
+        """
+        return {doc['_id']: doc.get(created_by)
+                for doc in self.handle_collection.find({'_id': {'$in': hids}},
+                                                       projection={created_by: True},
+                                                       max_time_ms=self._max_time_ms())}
+
     def delete_many(self, docs):
         """
         delete a docs
         """
         logging.info('start deleting documents')
 
+        Deadline.check('deleting documents')
+
         try:
             hids_to_delete = list(set([doc.get('hid') for doc in docs]))
-            delete_filter = {'hid': {'$in': hids_to_delete}}
+            delete_filter = {'_id': {'$in': hids_to_delete}}
             result = self.handle_collection.delete_many(delete_filter)
         except Exception as e:
             error_msg = 'Connot delete docs\n'
@@ -0,0 +1,201 @@
+import abc
+import asyncio
+import logging
+import threading
+import time
+
+from AbstractHandle.Utils.Deadline import Deadline
+
+
+class NodeStore(abc.ABC):
+    """
+    Interface of a backend storing the nodes that handles point to.
+    Handler keeps one node store per handle type and sends it all nodes of a request at once.
+    A backend must implement owners_of, readable and grant_read; the async variants run them
+    in the default executor unless overridden.
+    """
+
+    GRANTED = 'granted'
+    ALREADY_SET = 'already-set'
+    FAILED = 'failed'
+
+    @abc.abstractmethod
+    def owners_of(self, node_ids, token, expected_owner=None):
+        """
+        return a dict of node id -> owner username
+
+        if expected_owner is given the store may stop at the first node owned by someone else
+        and return the owners found so far
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def readable(self, node_ids, token):
+        """
+        return a dict of node id -> whether token user can read the node
+
+        the store may stop at the first unreadable node and return the results found so far
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def grant_read(self, node_ids, token, username=None):
+        """
+        grant read access to username, or public read access if username is empty
+
+        return a dict of node id -> GRANTED, ALREADY_SET or FAILED
+        """
+        raise NotImplementedError
+
+    async def _run_blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, Deadline.bind(func), *args)
+
+    async def owners_of_async(self, node_ids, token, expected_owner=None):
+        return await self._run_blocking(self.owners_of, node_ids, token, expected_owner)
+
+    async def readable_async(self, node_ids, token):
+        return await self._run_blocking(self.readable, node_ids, token)
+
+    async def grant_read_async(self, node_ids, token, username=None):
+        return await self._run_blocking(self.grant_read, node_ids, token, username)
+
+
+class ShockNodeStore(NodeStore):
+    """
+    Shock backend. Nodes are checked concurrently through FanOut, one Shock call per node.
+    """
+
+    def __init__(self, shock_util, async_shock_util, fan_out, acl_fan_out, async_fan_out):
+        self.shock_util = shock_util
+        self.async_shock_util = async_shock_util
+        self.fan_out = fan_out
+        self.acl_fan_out = acl_fan_out
+        self.async_fan_out = async_fan_out
+
+    def _grant_read(self, node_id, token, username=None):
+        try:
+            granted = self.shock_util.add_read_acl(node_id, token, username=username)
+        except Exception as e:
+            logging.warning('Unable to set acl on node {}: {}'.format(node_id, e))
+            return self.FAILED
+
+        return self.GRANTED if granted else self.ALREADY_SET
+
+    async def _grant_read_async(self, node_id, token, username=None):
+        try:
+            granted = await self.async_shock_util.add_read_acl(node_id, token, username=username)
+        except Exception as e:
+            logging.warning('Unable to set acl on node {}: {}'.format(node_id, e))
+            return self.FAILED
+
+        return self.GRANTED if granted else self.ALREADY_SET
+
+    def owners_of(self, node_ids, token, expected_owner=None):
+        stop = None if expected_owner is None else (lambda owner: owner != expected_owner)
+        return self.fan_out.run(lambda node_id: self.shock_util.get_owner(node_id, token),
+                                node_ids, stop=stop)
+
+    def readable(self, node_ids, token):
+        return self.fan_out.run(lambda node_id: self.shock_util.is_readable(node_id, token),
+                                node_ids, stop=lambda is_readable: not is_readable)
+
+    def grant_read(self, node_ids, token, username=None):
+        return self.acl_fan_out.run(
+                        lambda node_id: self._grant_read(node_id, token, username=username),
+                        node_ids)
+
+    async def owners_of_async(self, node_ids, token, expected_owner=None):
+        stop = None if expected_owner is None else (lambda owner: owner != expected_owner)
+        return await self.async_fan_out.run_async(
+                        lambda node_id: self.async_shock_util.get_owner(node_id, token),
+                        node_ids, stop=stop)
+
+    async def readable_async(self, node_ids, token):
+        return await self.async_fan_out.run_async(
+                        lambda node_id: self.async_shock_util.is_readable(node_id, token),
+                        node_ids, stop=lambda is_readable: not is_readable)
+
+    async def grant_read_async(self, node_ids, token, username=None):
+        return await self.async_fan_out.run_async(
+                        lambda node_id: self._grant_read_async(node_id, token, username=username),
+                        node_ids)
+
+
+class MemoryNodeStore(NodeStore):
+    """
+    In-memory backend for benchmarking and testing Handler without a remote store.
+    Tokens are mapped to usernames with add_user; latency (seconds) is slept once per batch
+    to mimic a round trip.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = float(latency)
+        self._nodes = dict()
+        self._users = dict()
+        self._lock = threading.Lock()
+
+    def add_user(self, token, username):
+        with self._lock:
+            self._users[token] = username
+
+    def add_node(self, node_id, owner, readers=(), public_read=False):
+        with self._lock:
+            self._nodes[node_id] = {'owner': owner,
+                                    'read': set(readers) | {owner},
+                                    'public_read': public_read}
+
+    def get_node(self, node_id):
+        with self._lock:
+            node = self._nodes.get(node_id)
+            return None if node is None else dict(node, read=set(node['read']))
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def owners_of(self, node_ids, token, expected_owner=None):
+        self._wait()
+        owners = dict()
+        with self._lock:
+            for node_id in node_ids:
+                node = self._nodes.get(node_id)
+                if node is None:
+                    raise ValueError('Request owner failed.\nNode {} not found\n'.format(node_id))
+                owners[node_id] = node['owner']
+                if expected_owner is not None and node['owner'] != expected_owner:
+                    break
+
+        return owners
+
+    def readable(self, node_ids, token):
+        self._wait()
+        readable = dict()
+        with self._lock:
+            username = self._users.get(token)
+            for node_id in node_ids:
+                node = self._nodes.get(node_id)
+                readable[node_id] = node is not None and (node['public_read'] or
+                                                          username in node['read'])
+                if not readable[node_id]:
+                    break
+
+        return readable
+
+    def grant_read(self, node_ids, token, username=None):
+        self._wait()
+        outcomes = dict()
+        with self._lock:
+            for node_id in node_ids:
+                node = self._nodes.get(node_id)
+                if node is None:
+                    outcomes[node_id] = self.FAILED
+                elif username:
+                    outcomes[node_id] = (self.ALREADY_SET if username in node['read']
+                                         else self.GRANTED)
+                    node['read'].add(username)
+                else:
+                    outcomes[node_id] = self.ALREADY_SET if node['public_read'] else self.GRANTED
+                    node['public_read'] = True
+
+        return outcomes
@@ -0,0 +1,143 @@
+import logging
+import random
+import threading
+import time
+
+
+class RetryPolicy:
+    """
+    Jittered exponential backoff for idempotent calls.
+    The n-th retry waits a random time between 0 and min(backoff_max, backoff * 2 ** n).
+    """
+
+    def __init__(self, max_retries, backoff, backoff_max):
+        self.max_retries = max(int(max_retries), 0)
+        self.backoff = float(backoff)
+        self.backoff_max = float(backoff_max)
+
+        self._lock = threading.Lock()
+        self.retry_count = 0
+        self.exhausted_count = 0
+
+    def delay(self, attempt):
+        """
+        return seconds to wait before retry number attempt (starting at 0) and count the retry
+        """
+        with self._lock:
+            self.retry_count += 1
+
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def record_exhausted(self):
+        with self._lock:
+            self.exhausted_count += 1
+
+    def stats(self):
+        with self._lock:
+            return {'retry_count': self.retry_count,
+                    'exhausted_count': self.exhausted_count}
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while a dependency keeps failing.
+
+    closed: calls go through. after failure_threshold consecutive failures the breaker opens.
+    open: calls are refused until reset_timeout seconds have passed.
+    half-open: one trial call goes through; success closes the breaker, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout, name='breaker'):
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.reset_timeout = float(reset_timeout)
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._trial_running = False
+        self._trial_started_at = 0
+        self._trial_caller = None
+        self.open_count = 0
+        self.rejected_count = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self, caller=None):
+        """
+        return whether a call may be made now
+
+        caller identifies the call, so that it can release the trial it may be given. a trial
+        that is neither settled nor released within reset_timeout seconds is given up and the
+        next call gets a new one.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.OPEN:
+                if now - self._opened_at < self.reset_timeout:
+                    self.rejected_count += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._trial_running = False
+
+            if self._state == self.HALF_OPEN:
+                if self._trial_running:
+                    if now - self._trial_started_at < self.reset_timeout:
+                        self.rejected_count += 1
+                        return False
+                    logging.warning('{} trial call did not finish within {:g}s, allowing another'
+                                    .format(self.name, self.reset_timeout))
+                self._trial_running = True
+                self._trial_started_at = now
+                self._trial_caller = caller
+
+            return True
+
+    def release(self, caller):
+        """
+        give up the trial of caller if it is still running, without settling it
+
+        for calls that end neither in record_success nor in record_failure
+        """
+        with self._lock:
+            if (self._state == self.HALF_OPEN and self._trial_running and
+                    caller is not None and self._trial_caller is caller):
+                self._trial_running = False
+                self._trial_caller = None
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logging.info('{} closed'.format(self.name))
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+            self._trial_caller = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logging.warning('{} opened after {} failures'
+                                    .format(self.name, self._failures))
+                    self.open_count += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+                self._trial_caller = None
+
+    def stats(self):
+        with self._lock:
+            return {'state': self._state,
+                    'consecutive_failures': self._failures,
+                    'open_count': self.open_count,
+                    'rejected_count': self.rejected_count}
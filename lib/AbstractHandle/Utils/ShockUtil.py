@@ -1,14 +1,159 @@
 
 import logging
 import os
+import threading
+import time
 import traceback
 import requests as _requests
+from requests.adapters import HTTPAdapter
+
+from AbstractHandle.Utils.ACLCache import ACLCache
+from AbstractHandle.Utils.Deadline import Deadline
+from AbstractHandle.Utils.Hedger import Hedger
+from AbstractHandle.Utils.Resilience import CircuitBreaker, RetryPolicy
 
 
 class ShockUtil:
 
     SERVER_TYPE = 'Shock'
 
+    POOL_CONNECTIONS = 10  # number of per-host connection pools to keep
+    POOL_MAXSIZE = 25  # max connections kept open per host (uwsgi 5 processes x 5 threads)
+    CONNECT_TIMEOUT = 5  # seconds
+    READ_TIMEOUT = 60  # seconds
+    ACL_CACHE_SIZE = 10000
+    ACL_CACHE_TTL = 30  # seconds
+    MAX_RETRIES = 2  # retries of idempotent (GET) requests
+    RETRY_BACKOFF = 0.1  # seconds, doubled on each retry
+    RETRY_BACKOFF_MAX = 2  # seconds
+    BREAKER_FAILURES = 5  # consecutive failures that open the circuit breaker
+    BREAKER_RESET = 30  # seconds the breaker stays open before a trial request
+
+    # sync: check shock connection in __init__ and raise if it fails
+    # background: probe shock in a daemon thread of each worker process, never block startup
+    # lazy: check shock connection on the first call to health()
+    STARTUP_CHECK_MODES = ['sync', 'background', 'lazy']
+    HEALTH_INTERVAL = 60  # seconds between background probes
+
+    HEDGE_PERCENTILE = 95  # hedge GETs slower than this percentile of recent GETs
+    HEDGE_BUDGET = 0.05  # max fraction of GETs that get a duplicate
+    HEDGE_MIN_DELAY = 0.05  # seconds
+    HEDGE_MIN_SAMPLES = 20  # latencies needed before hedging starts
+
+    def _get_session(self):
+        """
+        return a keep-alive session shared by all threads of this process
+
+        the underlying urllib3 pools are thread-safe; pool_block caps the number of
+        connections per host at pool_maxsize and makes extra callers wait for a free one.
+        pooled sockets must not be shared across fork, so a process forked from the one that
+        opened the session (uwsgi workers forked from the master) opens its own
+        """
+        with self._session_lock:
+            if self._session is None or self._session_pid != os.getpid():
+                # the inherited session is dropped without closing it: closing would shut down
+                # connections the parent process still uses
+                adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                                      pool_maxsize=self.pool_maxsize,
+                                      pool_block=True)
+                session = _requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._adapter = adapter
+                self._session = session
+                self._session_pid = os.getpid()
+
+        return self._session
+
+    def _request(self, method, end_point, **kwargs):
+        """
+        send request to shock
+
+        connection errors, timeouts and 5xx responses count as failures of the circuit breaker.
+        GET requests are retried with jittered exponential backoff, and hedged if hedging is
+        enabled; while the breaker is open requests fail at once.
+        timeouts are cut to the time left to the request deadline, and no attempt is made once
+        it has passed.
+        """
+        self._ensure_probe()
+
+        timeout = kwargs.pop('timeout', (self.connect_timeout, self.read_timeout))
+        retries = self.retry_policy.max_retries if method == 'GET' else 0
+
+        attempt = 0
+        while True:
+            Deadline.check('calling Shock')
+            caller = object()  # identifies this attempt to the circuit breaker
+            if not self.circuit_breaker.allow(caller):
+                raise ValueError('Shock server is unavailable (circuit breaker is open){}'
+                                 .format(self._health_detail()))
+
+            kwargs['timeout'] = tuple(Deadline.remaining_time(t) for t in timeout)
+
+            try:
+                if method == 'GET' and self.hedger is not None:
+                    resp = self.hedger.call(
+                                lambda: self._get_session().request(method, end_point, **kwargs))
+                else:
+                    resp = self._get_session().request(method, end_point, **kwargs)
+            except (_requests.exceptions.ConnectionError, _requests.exceptions.Timeout):
+                # cut short by the deadline, not a shock failure: the finally below releases
+                # the trial the call may hold
+                Deadline.check('calling Shock')
+                self.circuit_breaker.record_failure()
+                if attempt >= retries:
+                    self.retry_policy.record_exhausted()
+                    raise
+            else:
+                if resp.status_code < 500:
+                    self.circuit_breaker.record_success()
+                    return resp
+
+                self.circuit_breaker.record_failure()
+                if attempt >= retries:
+                    self.retry_policy.record_exhausted()
+                    return resp
+            finally:
+                self.circuit_breaker.release(caller)  # unsettled, e.g. cancelled or other errors
+
+            time.sleep(Deadline.remaining_time(self.retry_policy.delay(attempt)))
+            attempt += 1
+
+    def resilience_stats(self):
+        """
+        return circuit breaker state and retry counters
+        """
+        return {'circuit_breaker': self.circuit_breaker.stats(),
+                'retries': self.retry_policy.stats(),
+                'hedging': self.hedger.stats() if self.hedger is not None else None}
+
+    def connection_stats(self):
+        """
+        return counters of connections opened and reused by the keep-alive pools
+        """
+        opened = 0
+        requests_sent = 0
+
+        with self._session_lock:
+            if self._adapter is not None and self._session_pid == os.getpid():
+                pools = self._adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is None:  # evicted meanwhile
+                        continue
+                    opened += pool.num_connections
+                    requests_sent += pool.num_requests
+
+        return {'opened': opened,
+                'reused': max(requests_sent - opened, 0),
+                'requests': requests_sent}
+
+    def cache_stats(self):
+        """
+        return hit/miss/eviction counters of the acl cache
+        """
+        return self.acl_cache.stats()
+
     def _get_header(self, token):
         return {'Authorization': 'OAuth {}'.format(token)}
 
@@ -20,10 +165,11 @@ class ShockUtil:
         grant readable acl for username or global if username is empty
         """
         headers = self._get_header(token)
+        self.acl_cache.invalidate(node_id)
 
         if username:  # grand readable acl for user
             end_point = os.path.join(self.shock_url, 'node', node_id, 'acl/read?users={}'.format(username))
-            resp = _requests.put(end_point, headers=headers)
+            resp = self._request('PUT', end_point, headers=headers)
 
             if resp.status_code != 200:
                 raise ValueError('Grant user readable access failed.\nError Code: {}\n{}\n'
@@ -32,7 +178,7 @@ class ShockUtil:
                 return True
         else:  # grand global readable acl
             end_point = os.path.join(self.shock_url, 'node', node_id, 'acl/public_read')
-            resp = _requests.put(end_point, headers=headers)
+            resp = self._request('PUT', end_point, headers=headers)
 
             if resp.status_code != 200:
                 raise ValueError('Grant global readable access failed.\nError Code: {}\n{}\n'
@@ -42,7 +188,7 @@ class ShockUtil:
 
     def _check_shock_conn(self, shock_url):
         end_point = self.shock_url + '/'
-        resp = _requests.put(end_point)
+        resp = self._request('PUT', end_point)
 
         if resp.status_code != 200:
             raise ValueError('Connot connect to shock server.\nError Code: {}\n{}\n'
@@ -53,11 +199,129 @@ class ShockUtil:
                 raise ValueError('Unexpected response from shock server.\nError Code: {}\n{}\n'
                                  .format(resp.status_code, resp.text))
 
+    def check_connection(self):
+        """
+        check connection to shock server and cache the result
+
+        raise ValueError if shock server is not reachable
+        """
+        try:
+            self._check_shock_conn(self.shock_url)
+        except Exception as e:
+            with self._health_lock:
+                self._health = {'healthy': False, 'checked_at': time.time(), 'error': str(e)}
+            raise
+        else:
+            with self._health_lock:
+                self._health = {'healthy': True, 'checked_at': time.time(), 'error': None}
+
+        return True
+
+    def _probe(self):
+        while True:
+            try:
+                self.check_connection()
+            except Exception as e:
+                logging.warning('Shock health probe failed: {}'.format(e))
+
+            time.sleep(self.health_interval)
+
+    def _ensure_probe(self):
+        """
+        start the background probe thread of the current process
+
+        threads do not survive fork, so uwsgi workers forked from the master start their own
+        """
+        if self.startup_check != 'background' or self._probe_pid == os.getpid():
+            return
+
+        with self._health_lock:
+            if self._probe_pid == os.getpid():
+                return
+            self._probe_pid = os.getpid()
+
+        threading.Thread(target=self._probe, name='shock-health-probe', daemon=True).start()
+
+    def warm_up(self):
+        """
+        start the background probe of the current process, e.g. right after a worker is forked
+        """
+        self._ensure_probe()
+
+    def _health_detail(self):
+        """
+        return the error of the last failed health check, for error messages
+        """
+        with self._health_lock:
+            if self._health.get('healthy') is False:
+                return '\nlast health check failed: {}'.format(self._health.get('error'))
+
+        return ''
+
+    def health(self):
+        """
+        return cached state of shock server: healthy (None if never checked), checked_at, error
+        """
+        self._ensure_probe()
+
+        if self.startup_check == 'lazy' and self._health.get('healthy') is None:
+            try:
+                self.check_connection()
+            except Exception as e:
+                logging.warning('Shock connection check failed: {}'.format(e))
+
+        with self._health_lock:
+            return dict(self._health)
+
     def __init__(self, config):
         self.shock_url = config.get('shock-url')
         self.admin_token = config.get('admin-token')
 
-        self._check_shock_conn(self.shock_url)
+        self.pool_connections = int(config.get('shock-pool-connections', self.POOL_CONNECTIONS))
+        self.pool_maxsize = int(config.get('shock-pool-maxsize', self.POOL_MAXSIZE))
+        self.connect_timeout = float(config.get('shock-connect-timeout', self.CONNECT_TIMEOUT))
+        self.read_timeout = float(config.get('shock-read-timeout', self.READ_TIMEOUT))
+
+        self._session = None
+        self._adapter = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+        self.acl_cache = ACLCache(config.get('shock-acl-cache-size', self.ACL_CACHE_SIZE),
+                                  config.get('shock-acl-cache-ttl', self.ACL_CACHE_TTL))
+
+        self.retry_policy = RetryPolicy(config.get('shock-max-retries', self.MAX_RETRIES),
+                                        config.get('shock-retry-backoff', self.RETRY_BACKOFF),
+                                        config.get('shock-retry-backoff-max',
+                                                   self.RETRY_BACKOFF_MAX))
+        self.circuit_breaker = CircuitBreaker(
+                                    config.get('shock-breaker-failures', self.BREAKER_FAILURES),
+                                    config.get('shock-breaker-reset', self.BREAKER_RESET),
+                                    name='shock circuit breaker')
+
+        self.hedger = None
+        if config.get('shock-hedge-enabled', 'false') == 'true':
+            self.hedger = Hedger(config.get('shock-hedge-percentile', self.HEDGE_PERCENTILE),
+                                 config.get('shock-hedge-budget', self.HEDGE_BUDGET),
+                                 config.get('shock-hedge-min-delay', self.HEDGE_MIN_DELAY),
+                                 config.get('shock-hedge-min-samples', self.HEDGE_MIN_SAMPLES),
+                                 2 * self.pool_maxsize)
+
+        self.startup_check = config.get('shock-startup-check', 'sync')
+        if self.startup_check not in self.STARTUP_CHECK_MODES:
+            raise ValueError('Unexpected shock-startup-check {}, expected one of {}'
+                             .format(self.startup_check, self.STARTUP_CHECK_MODES))
+        self.health_interval = float(config.get('shock-health-interval', self.HEALTH_INTERVAL))
+
+        self._health = {'healthy': None, 'checked_at': None, 'error': None}
+        self._health_lock = threading.Lock()
+        self._probe_pid = None
+
+        # the background probe starts in the process serving requests, on first use or from
+        # warm_up: a thread started here would run in the uwsgi master, and a worker forked
+        # while it holds a lock would inherit the lock held forever
+        if self.startup_check == 'sync':
+            self.check_connection()
 
         logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
                             level=logging.INFO)
@@ -67,11 +331,15 @@ class ShockUtil:
         parse owner.username information from shock acl of a node
         """
 
+        owner = self.acl_cache.get('owner', token, node_id)
+        if owner is not None:
+            return owner
+
         headers = self._get_header(token)
 
         end_point = os.path.join(self.shock_url, 'node', node_id, 'acl/?verbosity=full')
 
-        resp = _requests.get(end_point, headers=headers)
+        resp = self._request('GET', end_point, headers=headers)
 
         if resp.status_code != 200:
             raise ValueError('Request owner failed.\nError Code: {}\n{}\n'
@@ -87,20 +355,27 @@ class ShockUtil:
                             ''.join(traceback.format_exception(None, e, e.__traceback__)))
                 raise ValueError(error_msg)
             else:
+                self.acl_cache.set('owner', token, node_id, owner)
                 return owner
 
     def is_readable(self, node_id, token):
         """
         check if a node is reachable/readable
+
+        only readable nodes are cached, so a node that becomes readable is seen at once
         """
 
+        if self.acl_cache.get('readable', token, node_id):
+            return True
+
         headers = self._get_header(token)
 
         end_point = os.path.join(self.shock_url, 'node', node_id)
 
-        resp = _requests.get(end_point, headers=headers)
+        resp = self._request('GET', end_point, headers=headers)
 
         if resp.ok:
+            self.acl_cache.set('readable', token, node_id, True)
             return True
         else:
             return False
@@ -108,12 +383,14 @@ class ShockUtil:
     def add_read_acl(self, node_id, token, username=None):
         """
         check current acl and then grant readable acl to user or public
+
+        return True if access was granted, False if the node was already readable
         """
 
         headers = self._get_admin_header()
 
         end_point = os.path.join(self.shock_url, 'node', node_id, 'acl/?verbosity=full')
-        resp = _requests.get(end_point, headers=headers)
+        resp = self._request('GET', end_point, headers=headers)
 
         if resp.status_code != 200:
             raise ValueError('Grant readable access for node failed.\nError Code: {}\n{}\n'
@@ -135,7 +412,7 @@ class ShockUtil:
 
                     if username not in read_users:
                         # grant user read access
-                        self._grant_read_access(node_id, token, username=username)
+                        return self._grant_read_access(node_id, token, username=username)
             else:  # check readble acl and grand global readable acl
                 try:
                     public_read = data.get('data').get('public').get('read')
@@ -148,6 +425,6 @@ class ShockUtil:
                 else:
                     if not public_read:
                         # grant global read access
-                        self._grant_read_access(node_id, token)
+                        return self._grant_read_access(node_id, token)
 
-        return True
+        return False
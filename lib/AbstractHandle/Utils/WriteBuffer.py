@@ -0,0 +1,98 @@
+import logging
+import threading
+
+from AbstractHandle.Utils.Deadline import Deadline
+
+
+class _PendingWrite:
+    """
+    one write of a batch, done once its result or error is set
+    """
+
+    def __init__(self, item):
+        self.item = item
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _Batch:
+
+    def __init__(self):
+        self.writes = list()
+        self.full = threading.Event()
+
+
+class WriteBuffer:
+    """
+    Group commit: concurrent writes are collected for up to max_delay seconds or max_size writes
+    and flushed together by one call of flush_func. Each caller waits for and gets its own result.
+
+    The first caller of a batch waits for the others and flushes the batch on its own thread, so
+    no background thread is needed (threads do not survive the uwsgi fork).
+    """
+
+    def __init__(self, flush_func, max_size, max_delay):
+        # flush_func takes a list of items and returns a list of results, one per item
+        self.flush_func = flush_func
+        self.max_size = max(int(max_size), 1)
+        self.max_delay = float(max_delay)
+
+        self._lock = threading.Lock()
+        self._batch = None  # batch taking writes
+
+        logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
+                            level=logging.INFO)
+
+    def submit(self, item):
+        """
+        add item to the next flush and return its result once flushed
+
+        an exception raised by flush_func is raised to every caller of the batch.
+        the request deadline is checked before item is added: once added, the write is flushed
+        and its caller waits for it past the deadline, so a write never completes unreported
+        """
+        Deadline.check('adding a write to a group commit')
+        pending = _PendingWrite(item)
+
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            batch.writes.append(pending)
+            if len(batch.writes) >= self.max_size:
+                self._batch = None  # the next write starts a new batch
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_delay)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+            self._flush(batch.writes)
+        else:
+            pending.done.wait()
+
+        if pending.error is not None:
+            raise pending.error
+
+        return pending.result
+
+    def _flush(self, writes):
+        logging.info('flushing {} buffered writes'.format(len(writes)))
+
+        # the batch serves several requests, it is not bound to the deadline of the leader
+        token = Deadline.start(0)
+        try:
+            results = self.flush_func([write.item for write in writes])
+        except Exception as e:
+            for write in writes:
+                write.error = e
+        else:
+            for write, result in zip(writes, results):
+                write.result = result
+        finally:
+            Deadline.finish(token)
+            for write in writes:
+                write.done.set()
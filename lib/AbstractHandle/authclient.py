@@ -10,6 +10,8 @@ import requests as _requests
 import threading as _threading
 import hashlib
 
+from AbstractHandle.Utils.Deadline import Deadline
+
 
 class TokenCache(object):
     ''' A basic cache for tokens. '''
@@ -79,7 +81,8 @@ class KBaseAuth(object):
             return user
 
         d = {'token': token, 'fields': 'user_id'}
-        ret = _requests.post(self._authurl, data=d)
+        Deadline.check('validating the token')
+        ret = _requests.post(self._authurl, data=d, timeout=Deadline.remaining_time())
         if not ret.ok:
             try:
                 err = ret.json()
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+"""
+Compares the hid generators of HidGenerator: inserts the same number of handle docs keyed by the
+hids of each generator into a scratch collection, and reports insert throughput and index size.
+
+Use a mongo server other than production: the scratch collections are dropped afterwards.
+"""
+
+import getopt
+import os
+import sys
+import time
+import uuid
+
+from pymongo import MongoClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from AbstractHandle.Utils.HidGenerator import HidGenerator  # noqa: E402
+
+USAGE = ('benchmark_hids.py --mongo_host <mongo_host> [--mongo_port <mongo_port>] '
+         '[--mongo_database <mongo_database>] [--count <count>] [--batch_size <batch_size>]')
+
+
+def make_doc(hid):
+    return {'_id': hid, 'hid': hid, 'id': str(uuid.uuid4()), 'file_name': 'file_name',
+            'type': 'shock', 'url': 'https://ci.kbase.us/services/shock-api',
+            'remote_md5': None, 'remote_sha1': None, 'created_by': 'benchmark',
+            'creation_date': '2020-01-01 00:00:00'}
+
+
+def benchmark(my_database, generator, count, batch_size):
+    """
+    insert count docs keyed by hids of generator and return timings and index sizes
+    """
+    hid_generator = HidGenerator(generator)
+    my_collection = my_database['hid_benchmark_{}'.format(generator)]
+    my_collection.drop()
+
+    start = time.monotonic()
+    for _ in range(count):
+        hid_generator.new_hid()
+    mint_seconds = time.monotonic() - start
+
+    insert_seconds = 0
+    inserted = 0
+    while inserted < count:
+        docs = [make_doc(hid_generator.new_hid())
+                for _ in range(min(batch_size, count - inserted))]
+        start = time.monotonic()
+        my_collection.insert_many(docs, ordered=False)
+        insert_seconds += time.monotonic() - start
+        inserted += len(docs)
+
+    stats = my_database.command('collStats', my_collection.name)
+    my_collection.drop()
+
+    return {'generator': generator,
+            'mint_per_second': count / mint_seconds,
+            'insert_per_second': count / insert_seconds,
+            'id_index_bytes': stats['indexSizes']['_id_'],
+            'total_index_bytes': stats['totalIndexSize']}
+
+
+def main(argv):
+
+    input_args = ['mongo_host', 'mongo_port', 'mongo_database', 'count', 'batch_size']
+    mongo_host = ''
+    mongo_port = 27017
+    mongo_database = 'hid_benchmark'
+    count = 100000
+    batch_size = 1000
+
+    try:
+        opts, args = getopt.getopt(argv, "h", [a + '=' for a in input_args])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(USAGE)
+            sys.exit()
+        elif opt == '--mongo_host':
+            mongo_host = arg
+        elif opt == '--mongo_port':
+            mongo_port = int(arg)
+        elif opt == '--mongo_database':
+            mongo_database = arg
+        elif opt == '--count':
+            count = int(arg)
+        elif opt == '--batch_size':
+            batch_size = int(arg)
+
+    if not mongo_host:
+        print('missing requried arg mongo_host')
+        print(USAGE)
+        sys.exit()
+
+    my_database = MongoClient(mongo_host, mongo_port)[mongo_database]
+
+    print('{:<10}{:>16}{:>18}{:>18}{:>20}'.format('generator', 'minted/s', 'inserted/s',
+                                                  '_id index bytes', 'all indexes bytes'))
+    for generator in HidGenerator.GENERATORS:
+        result = benchmark(my_database, generator, count, batch_size)
+        print('{generator:<10}{mint_per_second:>16.0f}{insert_per_second:>18.0f}'
+              '{id_index_bytes:>18}{total_index_bytes:>20}'.format(**result))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
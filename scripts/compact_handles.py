@@ -0,0 +1,118 @@
+#!/usr/bin/python
+"""
+Converts the handle docs of a collection in place to the compact encoding of HandleCodec, or
+back to plain docs with --decode.
+
+Run it while the service is stopped, then start the service with mongo-encoding set to match.
+Docs already converted are skipped, so an interrupted run can be started again.
+"""
+
+import getopt
+import os
+import sys
+
+from pymongo import MongoClient, ReplaceOne
+from pymongo.errors import ServerSelectionTimeoutError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from AbstractHandle.Utils.HandleCodec import HandleCodec  # noqa: E402
+
+USAGE = ('compact_handles.py --mongo_host <mongo_host> [--mongo_port <mongo_port>] '
+         '[--mongo_database <mongo_database>] [--mongo_collection <mongo_collection>] '
+         '[--batch_size <batch_size>] [--decode]')
+
+
+def connect_mongo(mongo_host, mongo_port, mongo_database, mongo_collection):
+    my_client = MongoClient(mongo_host, mongo_port)
+
+    try:
+        my_client.server_info()  # force a call to server
+    except ServerSelectionTimeoutError as e:
+        raise ValueError('Connot connect to Mongo server\nERROR -- {}'.format(e))
+
+    return my_client[mongo_database][mongo_collection]
+
+
+def convert(my_collection, decode=False, batch_size=1000):
+    """
+    rewrite every doc of my_collection in compact (or plain if decode) form
+
+    returns the number of docs seen and of docs rewritten
+    """
+    codec = HandleCodec(my_collection)
+    codec.load()
+
+    seen = converted = 0
+    requests = list()
+
+    def flush():
+        if requests:
+            my_collection.bulk_write(requests, ordered=False)
+            requests.clear()
+
+    for doc in my_collection.find({}, batch_size=batch_size):
+        seen += 1
+
+        handle = codec.decode_doc(doc)  # plain and compact docs both decode
+        new_doc = handle if decode else codec.encode_doc(handle)
+        if new_doc != doc:
+            requests.append(ReplaceOne({'_id': doc['_id']}, new_doc))
+            converted += 1
+
+        if len(requests) >= batch_size:
+            flush()
+            print('converted {} of {} records seen'.format(converted, seen))
+
+    flush()
+
+    return seen, converted
+
+
+def main(argv):
+
+    input_args = ['mongo_host', 'mongo_port', 'mongo_database', 'mongo_collection', 'batch_size']
+    mongo_host = ''
+    mongo_port = 27017
+    mongo_database = 'handle_db'
+    mongo_collection = 'handle'
+    batch_size = 1000
+    decode = False
+
+    try:
+        opts, args = getopt.getopt(argv, "h", [a + '=' for a in input_args] + ['decode'])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(USAGE)
+            sys.exit()
+        elif opt == '--mongo_host':
+            mongo_host = arg
+        elif opt == '--mongo_port':
+            mongo_port = int(arg)
+        elif opt == '--mongo_database':
+            mongo_database = arg
+        elif opt == '--mongo_collection':
+            mongo_collection = arg
+        elif opt == '--batch_size':
+            batch_size = int(arg)
+        elif opt == '--decode':
+            decode = True
+
+    if not mongo_host:
+        print('missing requried arg mongo_host')
+        print(USAGE)
+        sys.exit()
+
+    my_collection = connect_mongo(mongo_host, mongo_port, mongo_database, mongo_collection)
+
+    seen, converted = convert(my_collection, decode=decode, batch_size=batch_size)
+
+    print('totally converted {} of {} records to {} encoding'.format(
+                                            converted, seen, 'plain' if decode else 'compact'))
+    print('indexes on the keys of the other encoding are no longer used and can be dropped')
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+
+from AbstractHandle.Utils.ACLCache import ACLCache
+
+
+class ACLCacheTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing ACLCache')
+
+    def test_acl_cache(self):
+        acl_cache = ACLCache(100, 300)
+
+        # empty cache at the begining
+        self.assertIsNone(acl_cache.get('owner', 'token', 'node_1'))
+
+        acl_cache.set('owner', 'token', 'node_1', 'user_1')
+        self.assertEqual(acl_cache.get('owner', 'token', 'node_1'), 'user_1')
+
+        # entries are per token and per kind
+        self.assertIsNone(acl_cache.get('owner', 'other_token', 'node_1'))
+        self.assertIsNone(acl_cache.get('readable', 'token', 'node_1'))
+
+        stats = acl_cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['size'], 1)
+
+        # raw tokens are not kept
+        self.assertNotIn('token', str(list(acl_cache._cache.keys())))
+
+    def test_invalidate(self):
+        acl_cache = ACLCache(100, 300)
+
+        acl_cache.set('owner', 'token_1', 'node_1', 'user_1')
+        acl_cache.set('readable', 'token_2', 'node_1', True)
+        acl_cache.set('readable', 'token_1', 'node_2', True)
+
+        acl_cache.invalidate('node_1')
+
+        self.assertIsNone(acl_cache.get('owner', 'token_1', 'node_1'))
+        self.assertIsNone(acl_cache.get('readable', 'token_2', 'node_1'))
+        self.assertTrue(acl_cache.get('readable', 'token_1', 'node_2'))
+
+    def test_eviction_and_expiration(self):
+        acl_cache = ACLCache(2, 300)
+
+        for node_id in ['node_1', 'node_2', 'node_3']:
+            acl_cache.set('readable', 'token', node_id, True)
+
+        stats = acl_cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 2)
+
+        acl_cache = ACLCache(100, 0.1)
+        acl_cache.set('readable', 'token', 'node_1', True)
+        time.sleep(0.2)
+        self.assertIsNone(acl_cache.get('readable', 'token', 'node_1'))
+
+    def test_disabled(self):
+        acl_cache = ACLCache(0, 300)
+        acl_cache.set('owner', 'token', 'node_1', 'user_1')
+        self.assertIsNone(acl_cache.get('owner', 'token', 'node_1'))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+from AbstractHandle.AbstractHandleServer import application, MethodContext
+from AbstractHandle.Utils.Deadline import Deadline
+
+
+def stream_items(ctx, count, fail_at=None):
+    for item in range(count):
+        if item == fail_at:
+            raise ValueError('item {} is missing'.format(item))
+        yield {'hid': item, 'id': 'KBH_{}'.format(item)}
+
+
+def list_items(ctx, count, fail_at=None):
+    # the non-streamed method returns the list of its outputs
+    return [list(stream_items(ctx, count, fail_at))]
+
+
+class AbstractHandleServerTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing AbstractHandleServer')
+
+    def serve_chunks(self, request, headers=None):
+        """
+        send request through the wsgi application and return status and body chunks
+        """
+        body = json.dumps(request).encode('utf8')
+        environ = {'REQUEST_METHOD': 'POST',
+                   'CONTENT_LENGTH': str(len(body)),
+                   'REMOTE_ADDR': '127.0.0.1',
+                   'wsgi.input': io.BytesIO(body)}
+        environ.update(headers or {})
+
+        response = dict()
+
+        def start_response(status, response_headers):
+            response['status'] = status
+
+        chunks = [chunk.decode('utf8') for chunk in application(environ, start_response)]
+        return response['status'], chunks
+
+    def serve(self, request, headers=None):
+        """
+        send request through the wsgi application and return status and parsed body
+        """
+        status, chunks = self.serve_chunks(request, headers)
+        return status, json.loads(''.join(chunks))
+
+    def status_request(self, context=None):
+        request = {'version': '1.1', 'id': '12345', 'method': 'AbstractHandle.status',
+                   'params': []}
+        if context is not None:
+            request['context'] = context
+        return request
+
+    def test_request_deadline(self):
+        deadlines = list()
+
+        def call(ctx, request):
+            deadlines.append(Deadline.current())
+            return json.dumps({'version': '1.1', 'id': request['id'], 'result': [{}]})
+
+        with patch('AbstractHandle.AbstractHandleServer.config', {'request-deadline': '60'}), \
+                patch.object(application.rpc_service, 'call', side_effect=call):
+            # the configured deadline
+            status, _ = self.serve(self.status_request())
+            self.assertEqual(status, '200 OK')
+
+            # callers may shorten it with the X-Request-Deadline header or the rpc context
+            self.serve(self.status_request(), {'HTTP_X_REQUEST_DEADLINE': '5'})
+            self.serve(self.status_request(context={'deadline': 10}))
+            self.serve(self.status_request(context={'deadline': 10}),
+                       {'HTTP_X_REQUEST_DEADLINE': '2'})
+
+            # but not extend it
+            self.serve(self.status_request(), {'HTTP_X_REQUEST_DEADLINE': '600'})
+            self.serve(self.status_request(context={'deadline': 'soon'}))
+
+        self.assertEqual([deadline.seconds for deadline in deadlines], [60, 5, 10, 2, 60, 60])
+
+        # the deadline ends with the call
+        self.assertIsNone(Deadline.current())
+
+    def items_request(self, count, fail_at=None, version='1.1'):
+        request = {'id': '12345', 'method': 'AbstractHandle.list_items',
+                   'params': [count, fail_at]}
+        if version == '2.0':
+            request['jsonrpc'] = version
+        else:
+            request['version'] = version
+        return request
+
+    def serve_items(self, request, streamed):
+        """
+        serve request with list_items, whose result is streamed in chunks of 2 items by
+        stream_items if streamed
+        """
+        stream_methods = {'AbstractHandle.list_items': stream_items} if streamed else {}
+        with patch.dict(application.rpc_service.method_data,
+                        {'AbstractHandle.list_items': {'method': list_items}}), \
+                patch.dict(application.stream_methods, stream_methods), \
+                patch.object(application, 'stream_chunk_size', 2):
+            return self.serve_chunks(request)
+
+    @staticmethod
+    def without_trace(response):
+        # the trace tells where the error was raised, which differs between the paths
+        error = dict(response['error'])
+        error.pop('error', None)
+        error.pop('data', None)
+        return dict(response, error=error)
+
+    def test_stream_result(self):
+        for version in ['1.1', '2.0']:
+            for count in [0, 1, 2, 3, 5]:
+                with self.subTest(version=version, count=count):
+                    request = self.items_request(count, version=version)
+                    status, chunks = self.serve_items(request, streamed=True)
+                    expected_status, expected_chunks = self.serve_items(request, streamed=False)
+
+                    self.assertEqual(status, '200 OK')
+                    self.assertEqual(status, expected_status)
+                    response = json.loads(''.join(chunks))
+                    self.assertEqual(response, json.loads(''.join(expected_chunks)))
+                    self.assertEqual(response.get('jsonrpc', response.get('version')), version)
+                    self.assertEqual(response['result'], [list(stream_items(None, count))])
+
+                    # the opening, a chunk per 2 items and the closing brackets
+                    self.assertEqual(len(chunks), 2 + (count + 1) // 2)
+                    self.assertEqual(len(expected_chunks), 1)
+
+    def test_stream_error_before_first_item(self):
+        for version in ['1.1', '2.0']:
+            with self.subTest(version=version):
+                request = self.items_request(3, fail_at=0, version=version)
+                status, chunks = self.serve_items(request, streamed=True)
+                expected_status, expected_chunks = self.serve_items(request, streamed=False)
+
+                # nothing is sent yet, so the error is a usual JSON-RPC error
+                self.assertEqual(status, '500 Internal Server Error')
+                self.assertEqual(status, expected_status)
+                response = json.loads(''.join(chunks))
+                self.assertEqual(self.without_trace(response),
+                                 self.without_trace(json.loads(''.join(expected_chunks))))
+                self.assertEqual(response['error']['message'], "'item 0 is missing'")
+
+    def test_stream_error_mid_stream(self):
+        request = self.items_request(5, fail_at=3)
+        with patch.object(MethodContext, 'log_err') as log_err:
+            status, chunks = self.serve_items(request, streamed=True)
+
+        # the status is sent before the failure, and the truncated result is no valid JSON
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(len(chunks), 2)
+        with self.assertRaises(ValueError):
+            json.loads(''.join(chunks))
+        log_err.assert_called_once()
+        self.assertIn('streamed result ended early', log_err.call_args[0][0])
+        self.assertIn('item 3 is missing', log_err.call_args[0][0])
+
+        # where the non-streamed response is the error
+        expected_status, expected_chunks = self.serve_items(request, streamed=False)
+        self.assertEqual(expected_status, '500 Internal Server Error')
+        self.assertEqual(json.loads(''.join(expected_chunks))['error']['message'],
+                         "'item 3 is missing'")
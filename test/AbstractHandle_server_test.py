@@ -199,6 +199,90 @@ class handle_serviceTest(unittest.TestCase):
 
         self.mongo_util.delete_one(handle)
 
+    def test_persist_handles_ok(self):
+        self.start_test()
+        handler = self.getImpl()
+
+        handles = [{'id': 'id',
+                    'file_name': 'file_name',
+                    'type': 'shock',
+                    'url': 'http://ci.kbase.us:7044/'},
+                   {'id': ''}]
+        results = handler.persist_handles(self.ctx, handles)[0]
+        self.assertEqual(len(results), 2)
+        self.assertIsNone(results[0]['error'])
+        self.assertIn('Missing one or more required positional field', results[1]['error'])
+
+        hid = results[0]['hid']
+        handles = handler.fetch_handles_by(self.ctx, {'elements': [hid], 'field_name': 'hid'})[0]
+        self.assertEqual(len(handles), 1)
+        self.assertEqual(handles[0].get('created_by'), self.user_id)
+
+        self.mongo_util.delete_one(handles[0])
+
+    def test_fetch_handles_page_ok(self):
+        self.start_test()
+        handler = self.getImpl()
+
+        params = {'elements': [68021, 68022], 'field_name': 'hid', 'limit': 1}
+        hids = list()
+        while True:
+            page = handler.fetch_handles_page(self.ctx, params)[0]
+            hids.extend(h.get('hid') for h in page['handles'])
+            if not page['continuation_token']:
+                break
+            params['continuation_token'] = page['continuation_token']
+
+        self.assertEqual(hids, [68021, 68022])
+
+    def test_status_ok(self):
+        self.start_test()
+        handler = self.getImpl()
+
+        status = handler.status(self.ctx)[0]
+        self.assertEqual(status['state'], 'OK')
+        self.assertIsNot(status['shock']['healthy'], False)  # None until the first check
+        self.assertCountEqual(status['stats'].keys(), ['mongo_pool', 'shock_connections',
+                                                        'shock_acl_cache', 'shock_resilience'])
+        self.assertIn('circuit_breaker', status['stats']['shock_resilience'])
+
+        with patch.object(Handler, 'shock_health',
+                          return_value={'healthy': False, 'checked_at': time.time(),
+                                        'error': 'Connection refused'}):
+            status = handler.status(self.ctx)[0]
+        self.assertEqual(status['state'], 'FAIL')
+        self.assertIn('Connection refused', status['message'])
+
+    def test_delete_handles_by_hid_ok(self):
+        self.start_test()
+        handler = self.getImpl()
+
+        handle = {'id': 'id', 'file_name': 'file_name', 'type': 'shock',
+                  'url': 'http://ci.kbase.us:7044/'}
+        hid = handler.persist_handle(self.ctx, handle)[0]
+
+        results = handler.delete_handles_by_hid(self.ctx, [hid, 'fake_hid'])[0]
+        self.assertEqual([result['outcome'] for result in results], ['deleted', 'not-found'])
+
+    @patch.object(Handler, "_is_admin_user", return_value=True)
+    def test_add_read_acl_report_ok(self, _is_admin_user):
+        self.start_test()
+        handler = self.getImpl()
+        node_id = self.createTestNode()
+
+        handle = {'id': node_id, 'file_name': 'file_name', 'type': 'shock',
+                  'url': 'https://ci.kbase.us/services/shock-api'}
+        hid = handler.persist_handle(self.ctx, handle)[0]
+
+        results = handler.add_read_acl_report(self.ctx, [hid, 'fake_hid'], 'tgu3')[0]
+        self.assertEqual(results, [{'hid': hid, 'outcome': 'granted'},
+                                   {'hid': 'fake_hid', 'outcome': 'not-found'}])
+
+        results = handler.add_read_acl_report(self.ctx, [hid], 'tgu3')[0]
+        self.assertEqual(results, [{'hid': hid, 'outcome': 'already-set'}])
+
+        handler.delete_handles_by_hid(self.ctx, [hid])
+
     def test_delete_handles_ok(self):
         self.start_test()
         handler = self.getImpl()
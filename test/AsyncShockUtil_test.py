@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import unittest
+from configparser import ConfigParser
+import inspect
+import time
+import aiohttp
+import requests as _requests
+from unittest.mock import AsyncMock, patch
+
+from AbstractHandle.authclient import KBaseAuth as _KBaseAuth
+from AbstractHandle.Utils.AsyncShockUtil import AsyncShockUtil
+from AbstractHandle.Utils.Deadline import Deadline
+from AbstractHandle.Utils.Resilience import CircuitBreaker
+
+
+class AsyncShockUtilTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.token = os.environ.get('KB_AUTH_TOKEN', None)
+        config_file = os.environ.get('KB_DEPLOYMENT_CONFIG', None)
+        cls.cfg = {}
+        config = ConfigParser()
+        config.read(config_file)
+        for nameval in config.items('AbstractHandle'):
+            cls.cfg[nameval[0]] = nameval[1]
+        cls.cfg['admin-token'] = cls.token
+        # Getting username from Auth profile for token
+        authServiceUrl = cls.cfg['auth-service-url']
+        auth_client = _KBaseAuth(authServiceUrl)
+        cls.user_id = auth_client.get_user(cls.token)
+
+        cls.shock_util = AsyncShockUtil(cls.cfg)
+        cls.shock_url = cls.cfg['shock-url']
+        cls.shock_ids_to_delete = list()
+
+    @classmethod
+    def tearDownClass(cls):
+        if hasattr(cls, 'shock_ids_to_delete'):
+            print('Nodes to delete: {}'.format(cls.shock_ids_to_delete))
+            cls.deleteShockID(cls.shock_ids_to_delete)
+
+        print('Finished testing AsyncShockUtil')
+
+    @classmethod
+    def deleteShockID(cls, shock_ids):
+        headers = {'Authorization': 'OAuth {}'.format(cls.token)}
+        for shock_id in shock_ids:
+            end_point = os.path.join(cls.shock_url, 'node', shock_id)
+            resp = _requests.delete(end_point, headers=headers, allow_redirects=True)
+            if resp.status_code != 200:
+                print('Cannot detele shock node ' + shock_id)
+            else:
+                print('Deleted shock node ' + shock_id)
+
+    def getShockUtil(self):
+        return self.__class__.shock_util
+
+    def createTestNode(self):
+        headers = {'Authorization': 'OAuth {}'.format(self.token)}
+
+        end_point = os.path.join(self.shock_url, 'node')
+
+        resp = _requests.post(end_point, headers=headers)
+
+        if resp.status_code != 200:
+            raise ValueError('Grant user readable access failed.\nError Code: {}\n{}\n'
+                             .format(resp.status_code, resp.text))
+        else:
+            shock_id = resp.json().get('data').get('id')
+            self.shock_ids_to_delete.append(shock_id)
+            return shock_id
+
+    def start_test(self):
+        testname = inspect.stack()[1][3]
+        print('\n*** starting test: ' + testname + ' **')
+
+    def test_get_owner_ok(self):
+        self.start_test()
+        shock_util = self.getShockUtil()
+        node_id = self.createTestNode()
+
+        owner = asyncio.run(shock_util.get_owner(node_id, self.token))
+        self.assertEqual(owner, self.user_id)
+
+        with self.assertRaises(ValueError) as context:
+            asyncio.run(shock_util.get_owner('fake_node_id', self.token))
+        self.assertIn('Request owner failed', str(context.exception.args))
+
+    def test_is_readable_ok(self):
+        self.start_test()
+        shock_util = self.getShockUtil()
+        node_ids = [self.createTestNode() for _ in range(3)]
+
+        async def check(node_ids):
+            return await asyncio.gather(*[shock_util.is_readable(node_id, self.token)
+                                          for node_id in node_ids])
+
+        self.assertTrue(all(asyncio.run(check(node_ids))))
+        self.assertFalse(any(asyncio.run(check(['fake_node_id']))))
+
+    def test_add_read_acl_ok(self):
+        self.start_test()
+        shock_util = self.getShockUtil()
+        node_id = self.createTestNode()
+
+        headers = {'Authorization': 'OAuth {}'.format(self.token)}
+        end_point = os.path.join(self.shock_url, 'node', node_id, 'acl/?verbosity=full')
+
+        # grant public read access
+        self.assertTrue(asyncio.run(shock_util.add_read_acl(node_id, self.token)))
+        data = _requests.get(end_point, headers=headers).json()
+        self.assertTrue(data.get('data').get('public').get('read'))
+
+        # should work for already publicly accessable ndoes
+        self.assertFalse(asyncio.run(shock_util.add_read_acl(node_id, self.token)))
+
+        new_user = 'tgu3'
+        self.assertTrue(asyncio.run(shock_util.add_read_acl(node_id, self.token,
+                                                            username=new_user)))
+        data = _requests.get(end_point, headers=headers).json()
+        new_users = [user.get('username') for user in data.get('data').get('read')]
+        self.assertCountEqual(new_users, [self.user_id, new_user])
+
+
+class AsyncShockUtilRequestTest(unittest.TestCase):
+    """
+    request paths of AsyncShockUtil against a mocked transport, no shock server needed
+    """
+
+    end_point = 'http://fake_shock_host/node'
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing AsyncShockUtil requests')
+
+    def getShockUtil(self, **config):
+        config = dict({'shock-url': 'http://fake_shock_host', 'shock-retry-backoff': 0.01,
+                       'shock-retry-backoff-max': 0.02}, **config)
+        shock_util = AsyncShockUtil(config)
+        patcher = patch.object(shock_util, '_send', new_callable=AsyncMock,
+                               return_value=(200, {}))
+        send = patcher.start()
+        self.addCleanup(patcher.stop)
+        return shock_util, send
+
+    def test_retries(self):
+        shock_util, send = self.getShockUtil(**{'shock-max-retries': 2,
+                                                'shock-breaker-failures': 10})
+
+        # a GET failing with 5xx responses is tried max_retries more times
+        send.return_value = (503, 'unavailable')
+        self.assertEqual(asyncio.run(shock_util._request('GET', self.end_point)),
+                         (503, 'unavailable'))
+        self.assertEqual(send.await_count, 3)
+        self.assertEqual(shock_util.retry_policy.stats(), {'retry_count': 2,
+                                                           'exhausted_count': 1})
+
+        # and succeeds once a retry does
+        send.reset_mock()
+        send.side_effect = [(502, 'bad gateway'), (200, {'data': {}})]
+        self.assertEqual(asyncio.run(shock_util._request('GET', self.end_point)),
+                         (200, {'data': {}}))
+        self.assertEqual(send.await_count, 2)
+
+        # timeouts and connection errors are retried too
+        for error in [asyncio.TimeoutError(), aiohttp.ClientConnectionError('refused')]:
+            send.reset_mock()
+            send.side_effect = error
+            with self.assertRaises(type(error)):
+                asyncio.run(shock_util._request('GET', self.end_point))
+            self.assertEqual(send.await_count, 3)
+
+        # a PUT may have been applied, so it is never retried
+        for side_effect in [None, asyncio.TimeoutError()]:
+            send.reset_mock()
+            send.side_effect = side_effect
+            if side_effect is None:
+                self.assertEqual(asyncio.run(shock_util._request('PUT', self.end_point))[0],
+                                 503)
+            else:
+                with self.assertRaises(asyncio.TimeoutError):
+                    asyncio.run(shock_util._request('PUT', self.end_point))
+            self.assertEqual(send.await_count, 1)
+
+    def test_circuit_breaker(self):
+        shock_util, send = self.getShockUtil(**{'shock-breaker-failures': 2})
+
+        send.side_effect = aiohttp.ClientConnectionError('refused')
+        for _ in range(2):
+            with self.assertRaises(aiohttp.ClientConnectionError):
+                asyncio.run(shock_util._request('GET', self.end_point))
+        self.assertEqual(shock_util.circuit_breaker.state, CircuitBreaker.OPEN)
+
+        # an open breaker fails at once, without calling shock
+        send.reset_mock()
+        with self.assertRaises(ValueError) as context:
+            asyncio.run(shock_util._request('GET', self.end_point))
+        self.assertIn('circuit breaker is open', str(context.exception.args))
+        send.assert_not_awaited()
+        self.assertEqual(shock_util.circuit_breaker.stats()['rejected_count'], 1)
+
+    def test_trial_released_on_deadline(self):
+        shock_util, send = self.getShockUtil(**{'shock-breaker-failures': 1,
+                                                'shock-breaker-reset': 0.2})
+
+        send.return_value = (503, 'unavailable')
+        asyncio.run(shock_util._request('GET', self.end_point))
+        self.assertEqual(shock_util.circuit_breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.25)
+
+        # the trial call is cut short by the deadline
+        async def slow_timeout(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            raise asyncio.TimeoutError()
+
+        send.side_effect = slow_timeout
+        token = Deadline.start(0.02)
+        try:
+            with self.assertRaises(ValueError) as context:
+                asyncio.run(shock_util._request('GET', self.end_point))
+            self.assertIn('Request deadline of 0.02s exceeded', str(context.exception.args))
+        finally:
+            Deadline.finish(token)
+
+        # and gives up its trial, so the next call is the trial instead of waiting for it to
+        # time out
+        self.assertEqual(shock_util.circuit_breaker.state, CircuitBreaker.HALF_OPEN)
+        send.side_effect = None
+        send.return_value = (200, {})
+        self.assertEqual(asyncio.run(shock_util._request('GET', self.end_point)), (200, {}))
+        self.assertEqual(shock_util.circuit_breaker.state, CircuitBreaker.CLOSED)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+
+from AbstractHandle.Utils.Deadline import Deadline
+
+
+class DeadlineTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing Deadline')
+
+    def test_seconds_for(self):
+        config = {'request-deadline': '60', 'request-deadline-fetch_handles_by': '300'}
+
+        self.assertEqual(Deadline.seconds_for({}, 'is_owner'), 0)
+        self.assertEqual(Deadline.seconds_for(config, 'is_owner'), 60)
+        self.assertEqual(Deadline.seconds_for(config, 'fetch_handles_by'), 300)
+
+        # callers may only shorten the deadline
+        self.assertEqual(Deadline.seconds_for(config, 'is_owner', requested='10'), 10)
+        self.assertEqual(Deadline.seconds_for(config, 'is_owner', requested=600), 60)
+        self.assertEqual(Deadline.seconds_for({}, 'is_owner', requested=5), 5)
+        self.assertEqual(Deadline.seconds_for(config, 'is_owner', requested='soon'), 60)
+
+    def test_start_finish(self):
+        self.assertIsNone(Deadline.current())
+        self.assertIsNone(Deadline.remaining_time())
+        self.assertEqual(Deadline.remaining_time(5), 5)
+        Deadline.check('doing nothing')
+
+        token = Deadline.start(0.1)
+        try:
+            self.assertLessEqual(Deadline.remaining_time(), 0.1)
+            self.assertEqual(Deadline.remaining_time(0.01), 0.01)
+            Deadline.check('doing nothing')
+
+            time.sleep(0.15)
+            self.assertEqual(Deadline.remaining_time(5), 0)
+            with self.assertRaises(ValueError) as context:
+                Deadline.check('doing nothing')
+            self.assertIn('Request deadline of 0.1s exceeded while doing nothing',
+                          str(context.exception.args))
+        finally:
+            Deadline.finish(token)
+
+        self.assertIsNone(Deadline.current())
+
+        token = Deadline.start(0)
+        self.assertIsNone(Deadline.current())
+        Deadline.finish(token)
+
+    def test_bind(self):
+        seen = dict()
+
+        def func():
+            seen['unbound'] = Deadline.current()
+
+        def bound_func():
+            seen['bound'] = Deadline.current()
+
+        token = Deadline.start(10)
+        try:
+            deadline = Deadline.current()
+            threads = [threading.Thread(target=func),
+                       threading.Thread(target=Deadline.bind(bound_func))]
+        finally:
+            Deadline.finish(token)
+
+        for thread in threads:
+            thread.start()
+            thread.join()
+
+        self.assertIsNone(seen['unbound'])
+        self.assertIs(seen['bound'], deadline)
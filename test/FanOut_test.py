@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+import unittest
+
+from AbstractHandle.Utils.Deadline import Deadline
+from AbstractHandle.Utils.FanOut import FanOut
+
+
+class FanOutTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fan_out = FanOut(4)
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing FanOut')
+
+    def test_run_ok(self):
+        results = self.fan_out.run(lambda x: x * 2, [1, 2, 3, 2, 1])
+        self.assertDictEqual(results, {1: 2, 2: 4, 3: 6})
+
+        results = self.fan_out.run(lambda x: x * 2, [])
+        self.assertDictEqual(results, {})
+
+    def test_run_serial_ok(self):
+        fan_out = FanOut(1)
+        called = list()
+
+        def func(x):
+            called.append(x)
+            return x < 3
+
+        results = fan_out.run(func, [1, 2, 3, 4, 5], stop=lambda r: not r)
+        self.assertDictEqual(results, {1: True, 2: True, 3: False})
+        self.assertEqual(called, [1, 2, 3])
+
+    def test_run_concurrently(self):
+        lock = threading.Lock()
+        running = {'now': 0, 'max': 0}
+
+        def func(x):
+            with lock:
+                running['now'] += 1
+                running['max'] = max(running['max'], running['now'])
+            time.sleep(0.05)
+            with lock:
+                running['now'] -= 1
+            return x
+
+        start = time.time()
+        results = self.fan_out.run(func, list(range(8)))
+        self.assertEqual(len(results), 8)
+        self.assertEqual(running['max'], 4)
+        self.assertLess(time.time() - start, 0.05 * 8)
+
+    def test_run_stop_early(self):
+        called = list()
+
+        def func(x):
+            called.append(x)
+            if x == 0:
+                return False
+            time.sleep(0.05)
+            return True
+
+        results = self.fan_out.run(func, list(range(40)), stop=lambda r: not r)
+        self.assertFalse(results[0])
+        self.assertFalse(all(results.values()))
+        # pending calls are cancelled
+        time.sleep(0.2)
+        self.assertLess(len(called), 40)
+
+    def test_run_fail(self):
+        def func(x):
+            if x == 3:
+                raise ValueError('bad item')
+            return x
+
+        with self.assertRaises(ValueError) as context:
+            self.fan_out.run(func, list(range(10)))
+
+        self.assertIn('bad item', str(context.exception.args))
+
+    def test_run_async_ok(self):
+        running = {'now': 0, 'max': 0}
+
+        async def func(x):
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+            await asyncio.sleep(0.01)
+            running['now'] -= 1
+            return x * 2
+
+        results = asyncio.run(self.fan_out.run_async(func, [1, 2, 3, 2, 1] + list(range(10, 20))))
+        self.assertEqual(len(results), 13)
+        self.assertEqual(results[3], 6)
+        self.assertEqual(running['max'], 4)
+
+    def test_run_async_stop_early(self):
+        called = list()
+
+        async def func(x):
+            called.append(x)
+            if x == 0:
+                return False
+            await asyncio.sleep(0.05)
+            return True
+
+        results = asyncio.run(self.fan_out.run_async(func, list(range(40)), stop=lambda r: not r))
+        self.assertFalse(all(results.values()))
+        self.assertLess(len(called), 40)
+
+    def test_run_deadline(self):
+        called = list()
+
+        def func(x):
+            called.append(x)
+            # calls see the deadline of the caller
+            self.assertIsNotNone(Deadline.current())
+            time.sleep(0.05)
+            return x
+
+        token = Deadline.start(0.1)
+        try:
+            start = time.time()
+            with self.assertRaises(ValueError) as context:
+                self.fan_out.run(func, list(range(40)))
+            self.assertLess(time.time() - start, 0.2)
+            self.assertIn('Request deadline of 0.1s exceeded', str(context.exception.args))
+
+            with self.assertRaises(ValueError):
+                FanOut(1).run(func, list(range(40)))
+
+            with self.assertRaises(ValueError):
+                asyncio.run(self.fan_out.run_async(lambda x: asyncio.sleep(0.05), range(40)))
+        finally:
+            Deadline.finish(token)
+
+        # pending calls are abandoned
+        time.sleep(0.2)
+        self.assertLess(len(called), 40)
+
+    def test_imap_ok(self):
+        lock = threading.Lock()
+        running = {'now': 0, 'max': 0}
+
+        def func(x):
+            with lock:
+                running['now'] += 1
+                running['max'] = max(running['max'], running['now'])
+            # later items finish first
+            time.sleep(0.01 * (10 - x))
+            with lock:
+                running['now'] -= 1
+            return x * 2
+
+        results = list(self.fan_out.imap(func, range(10)))
+        self.assertEqual(results, [x * 2 for x in range(10)])
+        self.assertEqual(running['max'], 4)
+
+        self.assertEqual(list(self.fan_out.imap(func, [])), [])
+        self.assertEqual(list(FanOut(1).imap(func, [1, 1, 2])), [2, 2, 4])
+
+    def test_imap_fail(self):
+        called = list()
+
+        def func(x):
+            called.append(x)
+            if x == 3:
+                raise ValueError('bad item')
+            time.sleep(0.02)
+            return x
+
+        results = list()
+        with self.assertRaises(ValueError) as context:
+            for result in self.fan_out.imap(func, range(40)):
+                results.append(result)
+
+        self.assertIn('bad item', str(context.exception.args))
+        self.assertEqual(results, [0, 1, 2])
+        # pending calls are cancelled
+        time.sleep(0.1)
+        self.assertLess(len(called), 40)
+
+    def test_imap_deadline(self):
+        def func(x):
+            self.assertIsNotNone(Deadline.current())
+            time.sleep(0.05)
+            return x
+
+        token = Deadline.start(0.1)
+        try:
+            start = time.time()
+            with self.assertRaises(ValueError) as context:
+                list(self.fan_out.imap(func, range(40)))
+            self.assertLess(time.time() - start, 0.2)
+            self.assertIn('Request deadline of 0.1s exceeded', str(context.exception.args))
+        finally:
+            Deadline.finish(token)
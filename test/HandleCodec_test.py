@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import unittest
+from datetime import datetime
+
+from mongo_util import MongoHelper
+from AbstractHandle.Utils.HandleCodec import HandleCodec
+
+
+class HandleCodecTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.mongo_helper = MongoHelper()
+        cls.my_client = cls.mongo_helper.create_test_db(db='handle_db', col='handle_codec')
+        cls.collection = cls.my_client['handle_db']['handle_codec']
+        cls.collection.database['handle_codec' + HandleCodec.DICTIONARY_SUFFIX].drop()
+
+        cls.codec = HandleCodec(cls.collection)
+        cls.codec.load()
+
+        cls.handle = {'hid': 67712, '_id': 67712,
+                      'id': 'b753774f-0bbd-4b96-9202-89b0c70bf31c',
+                      'file_name': 'interleaved.fastq', 'type': 'shock',
+                      'url': 'http://ci.kbase.us:7044/', 'remote_md5': None,
+                      'remote_sha1': None, 'created_by': 'tgu2',
+                      'creation_date': '2016-12-20 10:18:17'}
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing HandleCodec')
+
+    def test_encode_doc_ok(self):
+        compact = self.codec.encode_doc(self.handle)
+
+        self.assertEqual(compact['_id'], 67712)
+        self.assertNotIn('hid', compact)
+        self.assertEqual(compact['i'], self.handle['id'])
+        self.assertEqual(compact['c'], 'tgu2')
+        self.assertIsInstance(compact['t'], int)
+        self.assertIsInstance(compact['u'], int)
+        self.assertNotEqual(compact['t'], compact['u'])
+        self.assertEqual(compact['d'], datetime(2016, 12, 20, 10, 18, 17))
+
+        # codes are stable and shared by codecs of the collection
+        other_codec = HandleCodec(self.collection)
+        self.assertEqual(other_codec.encode_doc(self.handle), compact)
+        other_codec.load()
+        self.assertEqual(other_codec._codes['shock'], compact['t'])
+
+    def test_decode_doc_ok(self):
+        compact = self.codec.encode_doc(self.handle)
+
+        self.assertDictEqual(self.codec.decode_doc(compact), self.handle)
+
+        handle = self.codec.decode_doc(compact, keep_id=False)
+        self.assertNotIn('_id', handle)
+        self.assertEqual(handle['hid'], 67712)
+
+        # plain docs decode as they are
+        self.assertDictEqual(self.codec.decode_doc(self.handle), self.handle)
+
+        # dates not in the usual format are kept as strings
+        handle = dict(self.handle, creation_date='20 Dec 2016')
+        self.assertDictEqual(self.codec.decode_doc(self.codec.encode_doc(handle)), handle)
+
+        with self.assertRaises(ValueError) as context:
+            self.codec.decode_doc(dict(compact, t=123456))
+        self.assertIn('Unknown dictionary code 123456', str(context.exception.args))
+
+    def test_encode_query_ok(self):
+        self.codec.encode_doc(self.handle)
+
+        self.assertEqual(self.codec.key('hid'), '_id')
+        self.assertEqual(self.codec.key('created_by'), 'c')
+        self.assertEqual(self.codec.key('unknown_field'), 'unknown_field')
+
+        # values missing from the dictionary cannot match and are not added to it
+        codes = self.codec.encode_values('type', ['shock', 'fake_type'])
+        self.assertEqual(codes, [self.codec._codes['shock']])
+        self.assertNotIn('fake_type', self.codec._codes)
+
+        self.assertEqual(self.codec.encode_values('hid', [67712]), [67712])
+
+        self.assertDictEqual(self.codec.encode_projection({'_id': False, 'node_owner': False}),
+                             {'o': False, '_id': True})
+        self.assertDictEqual(self.codec.encode_projection({'_id': False, 'hid': True,
+                                                           'type': True}),
+                             {'t': True, '_id': True})
+        self.assertIsNone(self.codec.encode_projection({'_id': False}))
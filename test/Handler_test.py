@@ -11,6 +11,8 @@ from AbstractHandle.authclient import KBaseAuth as _KBaseAuth
 from mongo_util import MongoHelper
 from AbstractHandle.Utils.Handler import Handler
 from AbstractHandle.Utils.MongoUtil import MongoUtil
+from AbstractHandle.Utils.FanOut import FanOut
+from AbstractHandle.Utils.NodeStore import MemoryNodeStore, ShockNodeStore
 
 
 class HandlerTest(unittest.TestCase):
@@ -126,6 +128,64 @@ class HandlerTest(unittest.TestCase):
         self.assertFalse('_id' in handle)
         self.assertEqual(handle.get('hid'), 67712)
 
+    def test_iter_handles_by_okay(self):
+        self.start_test()
+        handler = self.getHandler()
+
+        elements = [68021, 68022]
+        handles = handler.iter_handles_by({'elements': elements, 'field_name': 'hid'})
+        self.assertFalse(isinstance(handles, list))
+        self.assertCountEqual(elements, [h.get('hid') for h in handles])
+
+        with self.assertRaises(ValueError) as context:
+            handler.iter_handles_by({'elements': elements})
+        self.assertIn('Required keys', str(context.exception.args))
+
+    def test_fetch_handles_page_okay(self):
+        self.start_test()
+        handler = self.getHandler()
+
+        handle = {'id': 'id', 'file_name': 'file_name', 'type': 'shock',
+                  'url': 'http://ci.kbase.us:7044/'}
+        new_hid = handler.persist_handle(handle, self.user_id)  # string hids sort after numbers
+
+        elements = [68022, 68021, 67712, new_hid, 0]
+        params = {'elements': elements, 'field_name': 'hid', 'limit': 2}
+        page = handler.fetch_handles_page(params)
+        self.assertEqual([h.get('hid') for h in page['handles']], [67712, 68021])
+        self.assertFalse('_id' in page['handles'][0])
+
+        params['continuation_token'] = page['continuation_token']
+        page = handler.fetch_handles_page(params)
+        self.assertEqual([h.get('hid') for h in page['handles']], [68022, new_hid])
+        self.assertIsNone(page['continuation_token'])
+
+        page = handler.fetch_handles_page({'elements': elements, 'field_name': 'hid'})
+        self.assertEqual(len(page['handles']), 4)
+        self.assertIsNone(page['continuation_token'])
+
+        handler.delete_handles([{'hid': new_hid}], self.user_id)
+
+    def test_fetch_handles_page_fail(self):
+        self.start_test()
+        handler = self.getHandler()
+
+        params = {'elements': [68021, 68022], 'field_name': 'hid', 'limit': 1}
+        token = handler.fetch_handles_page(params)['continuation_token']
+
+        with self.assertRaises(ValueError) as context:
+            handler.fetch_handles_page({'elements': ['id'], 'field_name': 'id',
+                                        'continuation_token': token})
+        self.assertIn('Cannot continue fetching handles by id', str(context.exception.args))
+
+        with self.assertRaises(ValueError) as context:
+            handler.fetch_handles_page(dict(params, continuation_token='fake_token'))
+        self.assertIn('Invalid continuation_token', str(context.exception.args))
+
+        with self.assertRaises(ValueError) as context:
+            handler.fetch_handles_page(dict(params, limit=handler.max_page_limit + 1))
+        self.assertIn('Unexpected limit', str(context.exception.args))
+
     def test_persist_handle_fail(self):
         self.start_test()
         handler = self.getHandler()
@@ -183,8 +243,61 @@ class HandlerTest(unittest.TestCase):
 
         self.assertEqual(new_hid, hid)
 
+        # testing persist_handle with existing handle created by another user
+        with self.assertRaises(ValueError) as context:
+            handler.persist_handle(new_handle, 'another_user')
+        self.assertIn('Cannot update handle not created by owner', str(context.exception.args))
+
+        new_handle['created_by'] = 'another_user'
+        with self.assertRaises(ValueError) as context:
+            handler.persist_handle(new_handle, self.user_id)
+        self.assertIn('Cannot update handle not created by owner', str(context.exception.args))
+
+        handles = handler.fetch_handles_by({'elements': [hid], 'field_name': 'hid'})
+        self.assertEqual(handles[0].get('created_by'), self.user_id)
+
         self.mongo_util.delete_one(handle)
 
+    def test_persist_handles_ok(self):
+        self.start_test()
+        handler = self.getHandler()
+
+        handle = {'id': 'id',
+                  'file_name': 'file_name',
+                  'type': 'shock',
+                  'url': 'http://ci.kbase.us:7044/'}
+        hid = handler.persist_handle(handle, self.user_id)
+
+        new_handle = copy.deepcopy(handle)
+        new_handle['hid'] = hid
+        new_handle['file_name'] = 'new_file_name'
+        other_handle = copy.deepcopy(handle)
+        other_handle['hid'] = hid
+        other_handle['created_by'] = 'another_user'
+
+        results = handler.persist_handles([handle, new_handle, {'id': ''}, other_handle, 'handle'],
+                                          self.user_id)
+        self.assertEqual(len(results), 5)
+
+        # inserted, updated, invalid, not owner, invalid
+        new_hid = results[0]['hid']
+        self.assertIsNone(results[0]['error'])
+        self.assertNotEqual(new_hid, hid)
+        self.assertDictEqual(results[1], {'hid': hid, 'error': None})
+        self.assertIsNone(results[2]['hid'])
+        self.assertIn('Missing one or more required positional field', results[2]['error'])
+        self.assertEqual(results[3]['hid'], hid)
+        self.assertIn('Cannot update handle not created by owner', results[3]['error'])
+        self.assertIsNotNone(results[4]['error'])
+
+        handles = handler.fetch_handles_by({'elements': [hid, new_hid], 'field_name': 'hid'})
+        self.assertEqual(len(handles), 2)
+        file_names = {h.get('hid'): h.get('file_name') for h in handles}
+        self.assertDictEqual(file_names, {hid: 'new_file_name', new_hid: 'file_name'})
+
+        for handle in handles:
+            self.mongo_util.delete_one(handle)
+
     def test_delete_handles_fail(self):
         self.start_test()
         handler = self.getHandler()
@@ -214,6 +327,32 @@ class HandlerTest(unittest.TestCase):
 
         self.assertEqual(delete_count, len(hids_to_delete))
 
+    def test_delete_handles_by_hid_ok(self):
+        self.start_test()
+        handler = self.getHandler()
+
+        handle = {'id': 'id', 'file_name': 'file_name', 'type': 'shock',
+                  'url': 'http://ci.kbase.us:7044/'}
+        hid = handler.persist_handle(handle, self.user_id)
+        other_hid = handler.persist_handle(dict(handle, created_by='other_user'), self.user_id)
+
+        results = handler.delete_handles_by_hid([hid, other_hid, 'fake_hid', hid], self.user_id)
+        self.assertEqual(results, [{'hid': hid, 'outcome': handler.DELETED},
+                                   {'hid': other_hid, 'outcome': handler.NOT_OWNER},
+                                   {'hid': 'fake_hid', 'outcome': handler.NOT_FOUND},
+                                   {'hid': hid, 'outcome': handler.DELETED}])
+
+        handles = handler.fetch_handles_by({'elements': [hid, other_hid], 'field_name': 'hid'})
+        self.assertEqual([h.get('hid') for h in handles], [other_hid])
+
+        # numeric hids match however they are given
+        results = handler.delete_handles_by_hid(['68021'], 'fake_user')
+        self.assertEqual(results, [{'hid': '68021', 'outcome': handler.NOT_OWNER}])
+
+        self.assertEqual(handler.delete_handles_by_hid([], self.user_id), [])
+
+        handler.mongo_util.delete_one({'hid': other_hid})
+
     def test_is_owner_ok(self):
         self.start_test()
         handler = self.getHandler()
@@ -231,8 +370,16 @@ class HandlerTest(unittest.TestCase):
         is_owner = handler.is_owner(hids, self.token, self.user_id)
         self.assertTrue(is_owner)
 
-        is_owner = handler.is_owner(hids, self.token, 'fake_user_100')
-        self.assertFalse(is_owner)
+        # node owner is recorded on the handle but not returned to clients
+        doc = self.mongo_util.find_in(hids, 'hid', projection=None).next()
+        self.assertEqual(doc.get('node_owner'), self.user_id)
+        handles = handler.fetch_handles_by({'elements': hids, 'field_name': 'hid'})
+        self.assertFalse('node_owner' in handles[0])
+
+        with patch.object(handler.shock_util, "get_owner") as get_owner:
+            is_owner = handler.is_owner(hids, self.token, 'fake_user_100')
+            self.assertFalse(is_owner)
+            get_owner.assert_not_called()
 
         handles_to_delete = handler.fetch_handles_by({'elements': hids, 'field_name': 'hid'})
         delete_count = handler.delete_handles(handles_to_delete, self.user_id)
@@ -332,3 +479,151 @@ class HandlerTest(unittest.TestCase):
         handles_to_delete = handler.fetch_handles_by({'elements': hids, 'field_name': 'hid'})
         delete_count = handler.delete_handles(handles_to_delete, self.user_id)
         self.assertEqual(delete_count, len(hids))
+
+    def test_bulk_add_read_acl_ok(self):
+        self.start_test()
+        handler = self.getHandler()
+        node_id = self.createTestNode()
+
+        hids = list()
+
+        handle = {'id': node_id,
+                  'file_name': 'file_name',
+                  'type': 'shock',
+                  'url': self.shock_url}
+        hid = handler.persist_handle(handle, self.user_id)
+        hids.append(hid)
+
+        handle = {'id': 'fake_node_id',
+                  'file_name': 'file_name',
+                  'type': 'shock',
+                  'url': self.shock_url}
+        fake_hid = handler.persist_handle(handle, self.user_id)
+        hids.append(fake_hid)
+
+        report = handler.bulk_add_read_acl(hids, self.token)
+        self.assertDictEqual(report, {hid: 'granted', fake_hid: 'failed'})
+
+        report = handler.bulk_add_read_acl(hids, self.token)
+        self.assertDictEqual(report, {hid: 'already-set', fake_hid: 'failed'})
+
+        with patch.object(Handler, "_is_admin_user", return_value=True):
+            with self.assertRaises(ValueError) as context:
+                handler.add_read_acl(hids, self.token)
+            self.assertIn('Unable to set acl(s) on handles {}'.format(fake_hid),
+                          str(context.exception.args))
+
+        handles_to_delete = handler.fetch_handles_by({'elements': hids, 'field_name': 'hid'})
+        delete_count = handler.delete_handles(handles_to_delete, self.user_id)
+        self.assertEqual(delete_count, len(hids))
+
+    def test_add_read_acl_report_ok(self):
+        self.start_test()
+        handler = self.getHandler()
+        node_id = self.createTestNode()
+
+        handle = {'id': node_id, 'file_name': 'file_name', 'type': 'shock',
+                  'url': self.shock_url}
+        hid = handler.persist_handle(handle, self.user_id)
+        handle = {'id': 'fake_node_id', 'file_name': 'file_name', 'type': 'shock',
+                  'url': self.shock_url}
+        fake_hid = handler.persist_handle(handle, self.user_id)
+        hids = [hid, fake_hid, 'fake_hid']
+
+        with self.assertRaises(ValueError) as context:
+            handler.add_read_acl_report(hids, self.token)
+        self.assertIn('User may not run add_read_acl_report method', str(context.exception.args))
+
+        with patch.object(Handler, "_is_admin_user", return_value=True):
+            results = handler.add_read_acl_report(hids, self.token, username='')
+        self.assertEqual(results, [{'hid': hid, 'outcome': 'granted'},
+                                   {'hid': fake_hid, 'outcome': 'failed'},
+                                   {'hid': 'fake_hid', 'outcome': 'not-found'}])
+
+        handler.delete_handles_by_hid([hid, fake_hid], self.user_id)
+
+    def test_is_owner_distinct_nodes(self):
+        self.start_test()
+        handler = self.getHandler()
+
+        class RecordingShockUtil:
+            owners = {'node_a': self.user_id, 'node_b': 'fake_user_100', 'node_c': self.user_id}
+
+            def __init__(self):
+                self.calls = list()
+
+            def get_owner(self, node_id, token):
+                self.calls.append(node_id)
+                return self.owners[node_id]
+
+        shock_util = RecordingShockUtil()
+        handler.register_node_store('recorded_shock', ShockNodeStore(shock_util, None, FanOut(1),
+                                                                     FanOut(1), FanOut(1)))
+
+        hids = list()
+        for node_id in ['node_a', 'node_a', 'node_b', 'node_c']:
+            handle = {'id': node_id, 'file_name': 'file_name', 'type': 'recorded_shock',
+                      'url': 'http://ci.kbase.us:7044/'}
+            hids.append(handler.persist_handle(handle, self.user_id))
+
+        # each distinct node is asked once
+        self.assertTrue(handler.is_owner([hids[0], hids[1], hids[3]], self.token, self.user_id))
+        self.assertEqual(shock_util.calls, ['node_a', 'node_c'])
+
+        # owners are recorded on the handles, only node_b is left to ask and it mismatches
+        shock_util.calls.clear()
+        self.assertFalse(handler.is_owner(hids, self.token, self.user_id))
+        self.assertEqual(shock_util.calls, ['node_b'])
+
+        # with no recorded owner, the check stops at the first node owned by someone else
+        new_hids = list()
+        for node_id in ['node_a', 'node_b', 'node_c']:
+            handle = {'id': node_id, 'file_name': 'file_name', 'type': 'recorded_shock',
+                      'url': 'http://ci.kbase.us:7044/'}
+            new_hids.append(handler.persist_handle(handle, self.user_id))
+        shock_util.calls.clear()
+        self.assertFalse(handler.is_owner(new_hids, self.token, self.user_id))
+        self.assertEqual(shock_util.calls, ['node_a', 'node_b'])
+
+        handler.node_stores.pop('recorded_shock')
+        handler.delete_handles_by_hid(hids + new_hids, self.user_id)
+
+    def test_node_store_ok(self):
+        self.start_test()
+        handler = self.getHandler()
+
+        node_store = MemoryNodeStore()
+        node_store.add_user(self.token, self.user_id)
+        node_store.add_node('memory_node_1', self.user_id)
+        node_store.add_node('memory_node_2', 'fake_user_100')
+        handler.register_node_store('memory', node_store)
+
+        hids = list()
+        for node_id in ['memory_node_1', 'memory_node_2', 'memory_node_1']:
+            handle = {'id': node_id,
+                      'file_name': 'file_name',
+                      'type': 'memory',
+                      'url': 'memory://'}
+            hids.append(handler.persist_handle(handle, self.user_id))
+
+        self.assertTrue(handler.is_owner([hids[0], hids[2]], self.token, self.user_id))
+        self.assertFalse(handler.is_owner(hids, self.token, self.user_id))
+        self.assertFalse(handler.are_readable(hids, self.token))
+
+        report = handler.bulk_add_read_acl(hids, self.token, username=self.user_id)
+        self.assertDictEqual(report, {hids[0]: 'already-set',
+                                      hids[1]: 'granted',
+                                      hids[2]: 'already-set'})
+        self.assertTrue(handler.are_readable(hids, self.token))
+
+        handle = {'id': 'node_id', 'file_name': 'file_name', 'type': 'fake_type', 'url': 'url'}
+        fake_hid = handler.persist_handle(handle, self.user_id)
+        with self.assertRaises(ValueError) as context:
+            handler.are_readable([fake_hid], self.token)
+        self.assertIn('Do not support node type fake_type', str(context.exception.args))
+
+        handler.node_stores.pop('memory')
+        handles_to_delete = handler.fetch_handles_by({'elements': hids + [fake_hid],
+                                                      'field_name': 'hid'})
+        delete_count = handler.delete_handles(handles_to_delete, self.user_id)
+        self.assertEqual(delete_count, len(hids) + 1)
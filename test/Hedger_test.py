@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+
+from AbstractHandle.Utils.Hedger import Hedger
+
+
+class HedgerTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing Hedger')
+
+    def warm_up(self, hedger, count=20):
+        for _ in range(count):
+            hedger.call(lambda: time.sleep(0.001))
+
+    def test_no_hedge_before_warm_up(self):
+        hedger = Hedger(95, 1, 0.01, 20, 4)
+        self.assertIsNone(hedger.delay())
+
+        self.assertEqual(hedger.call(lambda: 'result'), 'result')
+        self.warm_up(hedger)
+
+        self.assertIsNotNone(hedger.delay())
+        self.assertGreaterEqual(hedger.delay(), 0.01)
+        self.assertEqual(hedger.stats()['hedged'], 0)
+
+    def test_hedge_slow_call(self):
+        hedger = Hedger(95, 0.5, 0.01, 20, 4)
+        self.warm_up(hedger)
+
+        lock = threading.Lock()
+        calls = list()
+
+        def slow_first_call():
+            with lock:
+                calls.append(1)
+                first = len(calls) == 1
+            time.sleep(1 if first else 0.001)
+            return 'slow' if first else 'fast'
+
+        start = time.time()
+        self.assertEqual(hedger.call(slow_first_call), 'fast')
+        self.assertLess(time.time() - start, 0.5)
+
+        stats = hedger.stats()
+        self.assertEqual(stats['hedged'], 1)
+        self.assertEqual(stats['hedge_wins'], 1)
+
+    def test_hedge_budget(self):
+        hedger = Hedger(95, 0.05, 0.01, 20, 4)
+        self.warm_up(hedger)
+
+        # 21 calls so far allow a single hedge
+        for _ in range(3):
+            hedger.call(lambda: time.sleep(0.05))
+
+        self.assertEqual(hedger.stats()['hedged'], 1)
+
+    def test_hedge_failed_copy(self):
+        hedger = Hedger(95, 1, 0.01, 20, 4)
+        self.warm_up(hedger)
+
+        lock = threading.Lock()
+        calls = list()
+
+        def failing_first_call():
+            with lock:
+                calls.append(1)
+                first = len(calls) == 1
+            if first:
+                time.sleep(0.05)
+                raise ValueError('first copy failed')
+            time.sleep(0.1)
+            return 'second'
+
+        self.assertEqual(hedger.call(failing_first_call), 'second')
+
+        def always_failing_call():
+            time.sleep(0.05)
+            raise ValueError('always fails')
+
+        with self.assertRaises(ValueError) as context:
+            hedger.call(always_failing_call)
+        self.assertIn('always fails', str(context.exception.args))
+
+    def test_primary_on_caller_thread(self):
+        hedger = Hedger(95, 0, 0.01, 20, 2)
+        self.warm_up(hedger)
+
+        # no budget for a hedge, the call is not handed to another thread
+        self.assertIs(hedger.call(threading.current_thread), threading.current_thread())
+
+        # no free threads for a call and its hedge
+        hedger = Hedger(95, 1, 0.01, 20, 2)
+        self.warm_up(hedger)
+        started = threading.Event()
+
+        def slow_call():
+            started.set()
+            time.sleep(0.2)
+
+        other = threading.Thread(target=hedger.call, args=(slow_call,))
+        other.start()
+        started.wait()
+        self.assertIs(hedger.call(threading.current_thread), threading.current_thread())
+        other.join()
+        time.sleep(0.3)  # the hedge of the slow call may still be running
+
+        # with free threads the primary is handed over, so that a hedge can race it
+        self.assertIsNot(hedger.call(threading.current_thread), threading.current_thread())
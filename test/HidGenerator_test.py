@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+import uuid
+
+from AbstractHandle.Utils.HidGenerator import HidGenerator
+
+
+class HidGeneratorTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing HidGenerator')
+
+    @staticmethod
+    def decode(chars):
+        value = 0
+        for char in chars:
+            value = (value << 5) | HidGenerator.ENCODING.index(char)
+        return value
+
+    def test_uuid4_ok(self):
+        hid = HidGenerator().new_hid()
+        self.assertTrue(hid.startswith('KBH_'))
+        self.assertEqual(uuid.UUID(hid[4:]).version, 4)
+
+    def test_ulid_ok(self):
+        generator = HidGenerator('ulid')
+
+        start_ms = int(time.time() * 1000)
+        hids = [generator.new_hid() for _ in range(10000)]
+
+        self.assertEqual(len(set(hids)), len(hids))
+        # minted in order, within and across milliseconds
+        self.assertEqual(hids, sorted(hids))
+        for hid in hids[:10]:
+            self.assertRegex(hid, '^KBH_[0-9A-HJKMNP-TV-Z]{26}$')
+
+        # the first 10 characters are the minting time
+        first_ms = self.decode(hids[0][4:14])
+        self.assertGreaterEqual(first_ms, start_ms)
+        self.assertLess(first_ms - start_ms, 1000)
+
+    def test_ulid_threads_ok(self):
+        generator = HidGenerator('ulid')
+        hids = list()
+
+        def mint():
+            hids.extend(generator.new_hid() for _ in range(1000))
+
+        threads = [threading.Thread(target=mint) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(hids)), 4000)
+
+    def test_ulid_overflow_ok(self):
+        generator = HidGenerator('ulid')
+        last_ms = int(time.time() * 1000) + 60000
+        generator._last_ms = last_ms
+        generator._last_random = (1 << HidGenerator.RANDOM_BITS) - 1
+
+        # the random part overflowing moves to the next millisecond
+        hid = generator.new_hid()
+        self.assertEqual(self.decode(hid[4:14]), last_ms + 1)
+
+    def test_unknown_generator_fail(self):
+        with self.assertRaises(ValueError) as context:
+            HidGenerator('fake_generator')
+
+        self.assertIn('Unexpected hid-generator fake_generator', str(context.exception.args))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from AbstractHandle.Utils.MongoPool import MongoPool
+
+
+class MongoPoolTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing MongoPool')
+
+    def test_client_options(self):
+        options = MongoPool.client_options({})
+        self.assertDictEqual(options, {'maxPoolSize': MongoPool.MAX_POOL_SIZE,
+                                       'minPoolSize': MongoPool.MIN_POOL_SIZE,
+                                       'waitQueueTimeoutMS': MongoPool.WAIT_QUEUE_TIMEOUT_MS})
+
+        config = {'mongo-max-pool-size': '50',
+                  'mongo-min-pool-size': '5',
+                  'mongo-wait-queue-timeout-ms': '1000',
+                  'mongo-server-selection-timeout-ms': '2000',
+                  'mongo-socket-timeout-ms': '',
+                  'mongo-compressors': 'zlib',
+                  'mongo-write-concern': 'majority',
+                  'mongo-read-concern': 'majority'}
+        options = MongoPool.client_options(config)
+        self.assertDictEqual(options, {'maxPoolSize': 50,
+                                       'minPoolSize': 5,
+                                       'waitQueueTimeoutMS': 1000,
+                                       'serverSelectionTimeoutMS': 2000,
+                                       'compressors': 'zlib',
+                                       'w': 'majority',
+                                       'readConcernLevel': 'majority'})
+
+        options = MongoPool.client_options({'mongo-write-concern': '1'})
+        self.assertEqual(options['w'], 1)
+
+    def test_get_client(self):
+        options = MongoPool.client_options({'mongo-max-pool-size': '7'})
+
+        # clients connect lazily, no server is needed here
+        client = MongoPool.get_client('fake_mongo_host', 1234, 'db_1', options)
+        try:
+            self.assertIs(MongoPool.get_client('fake_mongo_host', 1234, 'db_1', options), client)
+            self.assertIsNot(MongoPool.get_client('fake_mongo_host', 1234, 'db_2', options),
+                             client)
+
+            stats = MongoPool.stats('fake_mongo_host', 1234, 'db_1')
+            self.assertEqual(stats['max_pool_size'], 7)
+            self.assertEqual(stats['open'], 0)
+            self.assertEqual(stats['in_use'], 0)
+        finally:
+            MongoPool.discard('fake_mongo_host', 1234, 'db_1')
+            MongoPool.discard('fake_mongo_host', 1234, 'db_2')
+
+        self.assertIsNone(MongoPool.stats('fake_mongo_host', 1234, 'db_1'))
+        self.assertIsNot(MongoPool.get_client('fake_mongo_host', 1234, 'db_1', options), client)
+        MongoPool.discard('fake_mongo_host', 1234, 'db_1')
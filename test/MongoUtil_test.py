@@ -3,10 +3,16 @@ import os
 import unittest
 from configparser import ConfigParser
 import inspect
+import threading
 import copy
+import time
+from unittest.mock import patch
+
+from pymongo.collection import Collection
 
 from mongo_util import MongoHelper
 from AbstractHandle.Utils.MongoUtil import MongoUtil
+from AbstractHandle.Utils.Deadline import Deadline
 
 
 class MongoUtilTest(unittest.TestCase):
@@ -46,9 +52,44 @@ class MongoUtilTest(unittest.TestCase):
 
         self.assertIn('Connot connect to Mongo server', str(context.exception.args))
 
+    def test_lazy_startup(self):
+        self.start_test()
+
+        cfg = dict(self.cfg)
+        cfg['mongo-startup'] = 'lazy'
+        mongo_util = MongoUtil(cfg)
+        self.assertNotIn('_handle_collection', mongo_util.__dict__)
+        self.assertNotIn('service', mongo_util.startup_timings)
+
+        # first use connects
+        self.assertEqual(mongo_util.handle_collection.name, 'handle')
+        self.assertTrue(set(MongoUtil.INDEXES) <= mongo_util.indexed_fields)
+        self.assertIn('connect', mongo_util.startup_timings)
+        self.assertIn('indexes', mongo_util.startup_timings)
+
+        mongo_util.warm_up(connections=3)
+        self.assertIn('warm_up', mongo_util.startup_timings)
+        self.assertGreaterEqual(mongo_util.pool_stats()['open'], 1)
+
+        # connection errors show up on first use
+        cfg['mongo-host'] = 'fake_mongo_host'
+        cfg['mongo-server-selection-timeout-ms'] = '100'
+        mongo_util = MongoUtil(cfg)
+        with self.assertRaises(ValueError) as context:
+            mongo_util.find_in([68021], 'hid')
+        self.assertIn('Connot connect to Mongo server', str(context.exception.args))
+
+        with self.assertRaises(AttributeError):
+            mongo_util.fake_attribute
+
+        cfg['mongo-startup'] = 'fake_mode'
+        with self.assertRaises(ValueError) as context:
+            MongoUtil(cfg)
+        self.assertIn('Unexpected mongo-startup fake_mode', str(context.exception.args))
+
     def test_init_ok(self):
         self.start_test()
-        class_attri = ['mongo_host', 'mongo_port', 'mongo_database', 'mongo_collection', 'handle_collection']
+        class_attri = ['mongo_host', 'mongo_port', 'mongo_database', 'mongo_collection', '_handle_collection']
         mongo_util = self.getMongoUtil()
         self.assertTrue(set(class_attri) <= set(mongo_util.__dict__.keys()))
 
@@ -56,6 +97,68 @@ class MongoUtilTest(unittest.TestCase):
         self.assertEqual(handle_collection.name, 'handle')
         self.assertEqual(handle_collection.count_documents({}), 10)
 
+    def test_pool_stats_ok(self):
+        self.start_test()
+        mongo_util = self.getMongoUtil()
+
+        # all MongoUtils of the process share one client
+        other_mongo_util = MongoUtil(self.cfg)
+        self.assertIs(other_mongo_util.handle_collection.database.client,
+                      mongo_util.handle_collection.database.client)
+
+        mongo_util.find_in([68021], 'hid').next()
+        stats = mongo_util.pool_stats()
+        self.assertEqual(stats['max_pool_size'], int(self.cfg['mongo-max-pool-size']))
+        self.assertGreater(stats['open'], 0)
+        self.assertGreater(stats['checkouts'], 0)
+        self.assertEqual(stats['checkout_failures'], 0)
+
+    def test_client_per_process(self):
+        self.start_test()
+        mongo_util = self.getMongoUtil()
+        client = mongo_util.handle_collection.database.client
+
+        pid = os.fork()
+        if pid == 0:
+            # a worker forked after the master connected opens a client of its own
+            try:
+                own_client = mongo_util.handle_collection.database.client is not client
+                stats = mongo_util.pool_stats()
+                counted = mongo_util.find_in([68021], 'hid').count() == 1 and stats is not None
+                os._exit(0 if own_client and counted and
+                         mongo_util.pool_stats()['checkouts'] > 0 else 1)
+            except Exception:
+                os._exit(1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        self.assertIs(mongo_util.handle_collection.database.client, client)
+        self.assertIsNotNone(mongo_util.pool_stats())
+
+    def test_read_preference_ok(self):
+        self.start_test()
+        mongo_util = self.getMongoUtil()
+        self.assertEqual(mongo_util.read_preference.mongos_mode, 'primary')
+
+        cfg = dict(self.cfg)
+        cfg['mongo-read-preference'] = 'secondaryPreferred'
+        cfg['mongo-max-staleness-seconds'] = '120'
+        secondary_mongo_util = MongoUtil(cfg)
+        read_preference = secondary_mongo_util.read_collection.read_preference
+        self.assertEqual(read_preference.mongos_mode, 'secondaryPreferred')
+        self.assertEqual(read_preference.max_staleness, 120)
+        self.assertEqual(secondary_mongo_util.handle_collection.read_preference.mongos_mode,
+                         'primary')
+
+        # a standalone server serves secondaryPreferred reads itself
+        docs = secondary_mongo_util.find_in([68021, 68022], 'hid')
+        self.assertEqual(len(list(docs)), 2)
+
+        cfg['mongo-read-preference'] = 'fake_mode'
+        with self.assertRaises(ValueError) as context:
+            MongoUtil(cfg)
+        self.assertIn('Unexpected mongo-read-preference fake_mode', str(context.exception.args))
+
     def test_find_in_ok(self):
         self.start_test()
         mongo_util = self.getMongoUtil()
@@ -86,6 +189,149 @@ class MongoUtilTest(unittest.TestCase):
         self.assertEqual(doc.get('_id'), 67712)
         self.assertEqual(doc.get('hid'), 67712)
 
+    def test_find_in_chunks_ok(self):
+        self.start_test()
+        mongo_util = self.getMongoUtil()
+
+        chunk_size = mongo_util.query_chunk_size
+        mongo_util.query_chunk_size = 1
+        try:
+            # duplicates are dropped, docs come in the order of the chunks
+            elements = [68021, 68022, 68021, 0]
+            docs = list(mongo_util.find_in(elements, 'hid'))
+            self.assertEqual([doc.get('hid') for doc in docs], [68021, 68022])
+            self.assertFalse('_id' in docs[0].keys())
+        finally:
+            mongo_util.query_chunk_size = chunk_size
+
+    def test_find_page_ok(self):
+        self.start_test()
+        mongo_util = self.getMongoUtil()
+
+        elements = [68022, 68021, 67712, 0]
+        docs, last_id = mongo_util.find_page(elements, 'hid', 2)
+        self.assertEqual([doc.get('hid') for doc in docs], [67712, 68021])
+        self.assertFalse('_id' in docs[0].keys())
+        self.assertEqual(last_id, 68021)
+
+        docs, last_id = mongo_util.find_page(elements, 'hid', 2, after=last_id, projection=None)
+        self.assertEqual([doc.get('_id') for doc in docs], [68022])
+        self.assertIsNone(last_id)
+
+        # string _ids sort after numbers
+        docs, last_id = mongo_util.find_page(elements, 'hid', 2, after='KBH_')
+        self.assertEqual(docs, [])
+
+    def test_find_deadline_ok(self):
+        self.start_test()
+        mongo_util = self.getMongoUtil()
+
+        with patch.object(Collection, 'find', autospec=True,
+                          side_effect=Collection.find) as find:
+            # without a deadline queries are not bounded
+            mongo_util.find_in([68021], 'hid')
+            mongo_util.find_page([68021], 'hid', 2)
+            self.assertEqual([call[1]['max_time_ms'] for call in find.call_args_list],
+                             [None, None])
+            find.reset_mock()
+
+            # under a deadline the server gives up on queries when it expires
+            token = Deadline.start(10)
+            try:
+                self.assertEqual(mongo_util.find_in([68021], 'hid').count(), 1)
+                docs, _ = mongo_util.find_page([68021], 'hid', 2)
+                self.assertEqual(len(docs), 1)
+            finally:
+                Deadline.finish(token)
+            for call in find.call_args_list:
+                self.assertTrue(0 < call[1]['max_time_ms'] <= 10000)
+            self.assertEqual(find.call_count, 2)
+
+        # an expired deadline fails before querying
+        token = Deadline.start(0.01)
+        try:
+            time.sleep(0.02)
+            with self.assertRaises(ValueError) as context:
+                mongo_util.find_page([68021], 'hid', 2)
+            self.assertIn('exceeded while querying MongoDB', str(context.exception.args))
+        finally:
+            Deadline.finish(token)
+
+    def test_compact_encoding_ok(self):
+        self.start_test()
+
+        cfg = dict(self.cfg)
+        cfg['mongo-encoding'] = 'compact'
+        cfg['mongo-collection'] = 'handle_compact'
+        self.my_client[cfg['mongo-database']]['handle_compact'].delete_many({})
+        mongo_util = MongoUtil(cfg)
+
+        self.assertIn(('c', 1), [tuple(index['key'][0])
+                                 for index in mongo_util.handle_collection.index_information()
+                                 .values()])
+
+        doc = {'hid': 68021, '_id': 68021, 'id': 'node_id', 'file_name': 'file_name',
+               'type': 'shock', 'url': 'http://ci.kbase.us:7044/', 'remote_md5': None,
+               'remote_sha1': None, 'created_by': 'tgu2', 'creation_date': '2016-12-20 10:18:17'}
+        self.assertTrue(mongo_util.upsert_one(doc, 'tgu2'))
+
+        stored = mongo_util.handle_collection.find_one({'_id': 68021})
+        self.assertNotIn('hid', stored)
+        self.assertEqual(stored['c'], 'tgu2')
+
+        # lookups and results use handle fields
+        docs = list(mongo_util.find_in(['shock'], 'type'))
+        self.assertEqual(len(docs), 1)
+        self.assertDictEqual(docs[0], {k: v for k, v in doc.items() if k != '_id'})
+        self.assertEqual(list(mongo_util.find_in(['fake_type'], 'type')), [])
+
+        mongo_util.set_node_owner([68021], 'node_id', 'tgu2')
+        docs = list(mongo_util.find_in([68021], 'hid', projection={'_id': False, 'hid': True,
+                                                                   'node_owner': True}))
+        self.assertEqual(docs[0]['hid'], 68021)
+        self.assertEqual(docs[0]['node_owner'], 'tgu2')
+
+        docs, last_id = mongo_util.find_page(['tgu2'], 'created_by', 1)
+        self.assertEqual(docs[0]['file_name'], 'file_name')
+        self.assertIsNone(last_id)
+
+        self.assertFalse(mongo_util.upsert_one(dict(doc, file_name='new_file_name'), 'tgu2'))
+        with self.assertRaises(ValueError) as context:
+            mongo_util.upsert_one(dict(doc, created_by='other_user'), 'other_user')
+        self.assertIn('Cannot update handle not created by owner', str(context.exception.args))
+
+        docs = list(mongo_util.find_in([68021], 'hid', projection=None))
+        self.assertEqual(docs[0]['file_name'], 'new_file_name')
+        self.assertNotIn('node_owner', docs[0])
+
+        self.assertEqual(mongo_util.delete_many(docs), 1)
+
+    def test_indexes_ok(self):
+        self.start_test()
+        mongo_util = self.getMongoUtil()
+
+        index_keys = [index['key'][0][0]
+                      for index in mongo_util.handle_collection.index_information().values()]
+        self.assertTrue(set(MongoUtil.INDEXES + ['_id']) <= set(index_keys))
+        self.assertTrue(set(MongoUtil.INDEXES + ['_id']) <= mongo_util.indexed_fields)
+
+        # hid lookups use the _id index
+        self.assertEqual(mongo_util._query_field('hid'), '_id')
+        self.assertEqual(mongo_util._query_field('id'), 'id')
+
+        # unindexed fields are only flagged unless strict
+        self.assertEqual(mongo_util._query_field('file_name'), 'file_name')
+        docs = mongo_util.find_in(['fake_file'], 'file_name')
+        self.assertEqual(docs.count(), 0)
+
+        mongo_util.strict_indexes = True
+        try:
+            with self.assertRaises(ValueError) as context:
+                mongo_util.find_in(['fake_file'], 'file_name')
+            self.assertIn('Cannot query unindexed field file_name', str(context.exception.args))
+        finally:
+            mongo_util.strict_indexes = False
+
     def test_update_one_ok(self):
         self.start_test()
         mongo_util = self.getMongoUtil()
@@ -127,6 +373,94 @@ class MongoUtilTest(unittest.TestCase):
         mongo_util.delete_one(doc)
         self.assertEqual(mongo_util.handle_collection.find().count(), 10)
 
+    def test_upsert_one_ok(self):
+        self.start_test()
+        mongo_util = self.getMongoUtil()
+
+        doc = {'_id': 9999, 'hid': 9999, 'file_name': 'fake_file', 'created_by': 'user_1'}
+        self.assertTrue(mongo_util.upsert_one(doc, 'user_1'))
+        self.assertEqual(mongo_util.handle_collection.find().count(), 11)
+
+        doc['file_name'] = 'new_fake_file'
+        self.assertFalse(mongo_util.upsert_one(doc, 'user_1'))
+        docs = mongo_util.find_in([9999], 'hid', projection=None)
+        self.assertEqual(docs.next().get('file_name'), 'new_fake_file')
+
+        # only the creator may update
+        with self.assertRaises(ValueError) as context:
+            mongo_util.upsert_one(doc, 'user_2')
+        self.assertIn('Cannot update handle not created by owner', str(context.exception.args))
+
+        doc['created_by'] = 'user_2'
+        with self.assertRaises(ValueError) as context:
+            mongo_util.upsert_one(doc, 'user_1')
+        self.assertIn('Cannot update handle not created by owner', str(context.exception.args))
+
+        docs = mongo_util.find_in([9999], 'hid', projection=None)
+        self.assertEqual(docs.next().get('created_by'), 'user_1')
+
+        mongo_util.delete_one(doc)
+        self.assertEqual(mongo_util.handle_collection.find().count(), 10)
+
+    def test_upsert_one_group_commit_ok(self):
+        self.start_test()
+
+        cfg = dict(self.cfg)
+        cfg['mongo-group-commit-size'] = '10'
+        cfg['mongo-group-commit-delay-ms'] = '50'
+        mongo_util = MongoUtil(cfg)
+
+        hids = ['KBH_group_commit_{}'.format(i) for i in range(10)]
+        results = {hid: list() for hid in hids}
+
+        def upsert(hid):
+            doc = {'_id': hid, 'hid': hid, 'id': 'id', 'created_by': 'owner'}
+            owner = 'other_user' if hid == hids[0] else 'owner'
+            try:
+                results[hid].append(mongo_util.upsert_one(doc, owner))
+            except ValueError as e:
+                results[hid].append(str(e))
+
+        threads = [threading.Thread(target=upsert, args=(hid,)) for hid in hids * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # each call gets its own result: inserted once, then updated by owner only
+        for hid in hids[1:]:
+            self.assertCountEqual(results[hid], [True, False])
+        self.assertIn(True, results[hids[0]])
+        self.assertIn('Cannot update handle not created by owner', results[hids[0]])
+        self.assertEqual(mongo_util.handle_collection.count_documents({'_id': {'$in': hids}}),
+                         10)
+
+        mongo_util.delete_many([{'hid': hid} for hid in hids])
+
+    def test_upsert_many_ok(self):
+        self.start_test()
+        mongo_util = self.getMongoUtil()
+
+        docs = [{'_id': 9998, 'hid': 9998, 'file_name': 'fake_file', 'created_by': 'user_1'},
+                {'_id': 9999, 'hid': 9999, 'file_name': 'fake_file', 'created_by': 'user_2'}]
+        results = mongo_util.upsert_many(docs, 'user_1')
+        self.assertEqual(results, [{'inserted': True}, {'inserted': True}])
+        self.assertEqual(mongo_util.handle_collection.find().count(), 12)
+
+        docs[0]['file_name'] = 'new_fake_file'
+        docs[1]['created_by'] = 'user_1'
+        results = mongo_util.upsert_many(docs, 'user_1')
+        self.assertEqual(results[0], {'inserted': False})
+        self.assertIn('Cannot update handle not created by owner', results[1]['error'])
+
+        docs = mongo_util.find_in([9998, 9999], 'hid', projection=None)
+        file_names = {doc['hid']: (doc['file_name'], doc['created_by']) for doc in docs}
+        self.assertDictEqual(file_names, {9998: ('new_fake_file', 'user_1'),
+                                          9999: ('fake_file', 'user_2')})
+
+        mongo_util.delete_many([{'hid': 9998}, {'hid': 9999}])
+        self.assertEqual(mongo_util.handle_collection.find().count(), 10)
+
     def test_delete_one_ok(self):
         self.start_test()
         mongo_util = self.getMongoUtil()
@@ -146,6 +480,46 @@ class MongoUtilTest(unittest.TestCase):
         docs = mongo_util.find_in([hid], 'hid', projection=None)
         self.assertEqual(docs.count(), 1)
 
+    def test_delete_owned_ok(self):
+        self.start_test()
+        mongo_util = self.getMongoUtil()
+
+        doc = {'_id': 'KBH_delete_owned', 'hid': 'KBH_delete_owned', 'id': 'id',
+               'created_by': 'owner'}
+        mongo_util.insert_one(doc)
+
+        deleted, not_owner = mongo_util.delete_owned([doc['hid'], 'fake_hid'], 'other_user')
+        self.assertEqual(deleted, [])
+        self.assertEqual(not_owner, [doc['hid']])
+
+        deleted, not_owner = mongo_util.delete_owned([doc['hid'], 'fake_hid'], 'owner')
+        self.assertEqual(deleted, [doc['hid']])
+        self.assertEqual(not_owner, [])
+        self.assertEqual(mongo_util.handle_collection.count_documents({'_id': doc['hid']}), 0)
+
+    def test_delete_owned_replaced_meanwhile(self):
+        self.start_test()
+        mongo_util = self.getMongoUtil()
+
+        doc = {'_id': 'KBH_delete_replaced', 'hid': 'KBH_delete_replaced', 'id': 'id',
+               'created_by': 'other_user'}
+        mongo_util.insert_one(doc)
+
+        # owners read before the doc was replaced by one of other_user
+        read_owners = mongo_util._read_owners
+        stale_owners = [{doc['hid']: 'owner'}]
+
+        def first_read_stale(hids, created_by):
+            return stale_owners.pop() if stale_owners else read_owners(hids, created_by)
+
+        with patch.object(mongo_util, '_read_owners', side_effect=first_read_stale):
+            deleted, not_owner = mongo_util.delete_owned([doc['hid']], 'owner')
+        self.assertEqual(deleted, [])
+        self.assertEqual(not_owner, [doc['hid']])
+        self.assertEqual(mongo_util.handle_collection.count_documents({'_id': doc['hid']}), 1)
+
+        mongo_util.delete_owned([doc['hid']], 'other_user')
+
     def test_delete_many_ok(self):
         self.start_test()
         mongo_util = self.getMongoUtil()
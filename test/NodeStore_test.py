@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import unittest
+
+from AbstractHandle.Utils.NodeStore import NodeStore, MemoryNodeStore
+
+
+class NodeStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.node_store = MemoryNodeStore()
+        self.node_store.add_user('token_1', 'user_1')
+        self.node_store.add_user('token_2', 'user_2')
+        self.node_store.add_node('node_1', 'user_1')
+        self.node_store.add_node('node_2', 'user_2', readers=['user_1'])
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing NodeStore')
+
+    def test_interface(self):
+        with self.assertRaises(TypeError):
+            NodeStore()
+
+        # a backend missing a method fails when it is created, not when the method is called
+        class IncompleteNodeStore(NodeStore):
+            def owners_of(self, node_ids, token, expected_owner=None):
+                return {}
+
+            def readable(self, node_ids, token):
+                return {}
+
+        with self.assertRaises(TypeError) as context:
+            IncompleteNodeStore()
+        self.assertIn('grant_read', str(context.exception))
+
+        class CompleteNodeStore(IncompleteNodeStore):
+            def grant_read(self, node_ids, token, username=None):
+                return {}
+
+        self.assertEqual(asyncio.run(CompleteNodeStore().readable_async(['node_1'], 'token_1')),
+                         {})
+
+    def test_owners_of(self):
+        owners = self.node_store.owners_of(['node_1', 'node_2'], 'token_1')
+        self.assertDictEqual(owners, {'node_1': 'user_1', 'node_2': 'user_2'})
+
+        # stop at first node not owned by expected owner
+        owners = self.node_store.owners_of(['node_2', 'node_1'], 'token_1', expected_owner='user_1')
+        self.assertDictEqual(owners, {'node_2': 'user_2'})
+
+        with self.assertRaises(ValueError) as context:
+            self.node_store.owners_of(['fake_node'], 'token_1')
+        self.assertIn('Request owner failed', str(context.exception.args))
+
+    def test_readable(self):
+        readable = self.node_store.readable(['node_1', 'node_2'], 'token_1')
+        self.assertTrue(all(readable.values()))
+
+        readable = self.node_store.readable(['node_2', 'node_1'], 'token_2')
+        self.assertDictEqual(readable, {'node_2': True, 'node_1': False})
+
+        readable = self.node_store.readable(['fake_node'], 'token_1')
+        self.assertFalse(all(readable.values()))
+
+    def test_grant_read(self):
+        outcomes = self.node_store.grant_read(['node_1', 'fake_node'], 'token_1', username='user_2')
+        self.assertDictEqual(outcomes, {'node_1': NodeStore.GRANTED,
+                                        'fake_node': NodeStore.FAILED})
+        self.assertTrue(all(self.node_store.readable(['node_1'], 'token_2').values()))
+
+        outcomes = self.node_store.grant_read(['node_1'], 'token_1', username='user_2')
+        self.assertDictEqual(outcomes, {'node_1': NodeStore.ALREADY_SET})
+
+        # public read
+        outcomes = self.node_store.grant_read(['node_2'], 'token_1')
+        self.assertDictEqual(outcomes, {'node_2': NodeStore.GRANTED})
+        self.assertTrue(self.node_store.get_node('node_2')['public_read'])
+        self.assertTrue(all(self.node_store.readable(['node_2'], 'unknown_token').values()))
+
+    def test_async(self):
+        owners = asyncio.run(self.node_store.owners_of_async(['node_1'], 'token_1'))
+        self.assertDictEqual(owners, {'node_1': 'user_1'})
+
+        readable = asyncio.run(self.node_store.readable_async(['node_1'], 'token_2'))
+        self.assertDictEqual(readable, {'node_1': False})
+
+        outcomes = asyncio.run(self.node_store.grant_read_async(['node_1'], 'token_1'))
+        self.assertDictEqual(outcomes, {'node_1': NodeStore.GRANTED})
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import time
+import unittest
+
+from AbstractHandle.Utils.Resilience import CircuitBreaker, RetryPolicy
+
+
+class ResilienceTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing Resilience')
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(3, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+        # failures below threshold keep the breaker closed, success resets the count
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+        # open after threshold, calls are refused
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        # half-open after reset timeout, only one trial call goes through
+        time.sleep(0.15)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+
+        # failed trial opens the breaker again
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # successful trial closes the breaker
+        time.sleep(0.15)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+        stats = breaker.stats()
+        self.assertEqual(stats['open_count'], 2)
+        self.assertEqual(stats['rejected_count'], 2)
+        self.assertEqual(stats['consecutive_failures'], 0)
+
+    def test_circuit_breaker_trial(self):
+        breaker = CircuitBreaker(1, 0.1)
+        breaker.record_failure()
+        time.sleep(0.15)
+
+        # a released trial lets the next call through, a release by another caller does not
+        trial, other = object(), object()
+        self.assertTrue(breaker.allow(trial))
+        breaker.release(other)
+        self.assertFalse(breaker.allow(other))
+        breaker.release(trial)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow(other))
+
+        # a trial that is never settled nor released is given up after reset timeout
+        self.assertFalse(breaker.allow())
+        time.sleep(0.15)
+        self.assertTrue(breaker.allow())
+
+        # releasing a settled trial changes nothing
+        breaker.record_failure()
+        breaker.release(other)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_retry_policy(self):
+        retry_policy = RetryPolicy(3, 0.1, 0.3)
+
+        for attempt in range(6):
+            delay = retry_policy.delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(0.3, 0.1 * 2 ** attempt))
+
+        retry_policy.record_exhausted()
+        self.assertDictEqual(retry_policy.stats(), {'retry_count': 6, 'exhausted_count': 1})
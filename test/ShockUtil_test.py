@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 import os
+import threading
+import time
 import unittest
 from configparser import ConfigParser
 import inspect
 import requests as _requests
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 from AbstractHandle.authclient import KBaseAuth as _KBaseAuth
+from AbstractHandle.Utils.Deadline import Deadline
+from AbstractHandle.Utils.Resilience import CircuitBreaker
 from AbstractHandle.Utils.ShockUtil import ShockUtil
 
 
@@ -74,23 +78,118 @@ class ShockUtilTest(unittest.TestCase):
 
     def test_init_ok(self):
         self.start_test()
-        class_attri = ['admin_token', 'shock_url']
+        class_attri = ['admin_token', 'shock_url', 'pool_connections', 'pool_maxsize',
+                       'connect_timeout', 'read_timeout', 'acl_cache', 'retry_policy',
+                       'circuit_breaker']
         shock_util = self.getShockUtil()
         self.assertTrue(set(class_attri) <= set(shock_util.__dict__.keys()))
 
     @patch.object(ShockUtil, "SERVER_TYPE", new='fake_server_type')
     def test_init_fail(self):
         self.start_test()
-        config = {'shock-url': self.shock_url + '/' + 'fake_endpoint_100'}
+        config = {'shock-url': self.shock_url + '/' + 'fake_endpoint_100',
+                  'shock-startup-check': 'sync'}
         with self.assertRaises(ValueError) as context:
             ShockUtil(config)
         self.assertIn('Connot connect to shock server', str(context.exception.args))
 
-        config = {'shock-url': self.shock_url}
+        config = {'shock-url': self.shock_url, 'shock-startup-check': 'sync'}
         with self.assertRaises(ValueError) as context:
             ShockUtil(config)
         self.assertIn('Unexpected response from shock server', str(context.exception.args))
 
+        config = {'shock-url': self.shock_url, 'shock-startup-check': 'fake_mode'}
+        with self.assertRaises(ValueError) as context:
+            ShockUtil(config)
+        self.assertIn('Unexpected shock-startup-check', str(context.exception.args))
+
+    def test_lazy_startup_check(self):
+        self.start_test()
+        # startup does not touch shock, failure shows in health
+        config = {'shock-url': self.shock_url + '/' + 'fake_endpoint_100',
+                  'shock-startup-check': 'lazy'}
+        shock_util = ShockUtil(config)
+        self.assertEqual(shock_util.connection_stats()['requests'], 0)
+
+        health = shock_util.health()
+        self.assertFalse(health['healthy'])
+        self.assertIn('Connot connect to shock server', health['error'])
+
+        with self.assertRaises(ValueError) as context:
+            shock_util.check_connection()
+        self.assertIn('Connot connect to shock server', str(context.exception.args))
+
+        shock_util = ShockUtil({'shock-url': self.shock_url, 'shock-startup-check': 'lazy'})
+        self.assertTrue(shock_util.health()['healthy'])
+
+    def test_background_startup_check(self):
+        self.start_test()
+        config = {'shock-url': self.shock_url,
+                  'shock-startup-check': 'background',
+                  'shock-health-interval': 0.1}
+        threads = threading.active_count()
+        shock_util = ShockUtil(config)
+
+        # no thread is started before the process serving requests uses it, the uwsgi master
+        # must not fork workers while a thread runs
+        self.assertEqual(threading.active_count(), threads)
+        shock_util.health()  # first use starts the probe
+        self.assertEqual(threading.active_count(), threads + 1)
+
+        time.sleep(1)
+        health = shock_util.health()
+        self.assertTrue(health['healthy'])
+        self.assertIsNone(health['error'])
+
+    def test_session_per_process(self):
+        self.start_test()
+        shock_util = ShockUtil({'shock-url': self.shock_url, 'shock-startup-check': 'lazy'})
+        session = shock_util._get_session()
+        self.assertIs(shock_util._get_session(), session)
+
+        pid = os.fork()
+        if pid == 0:
+            # a forked worker opens its own pooled connections
+            new_session = shock_util._get_session()
+            os._exit(0 if new_session is not session and shock_util._adapter is not None else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        self.assertIs(shock_util._get_session(), session)
+
+    def test_connection_stats_ok(self):
+        self.start_test()
+        shock_util = self.getShockUtil()
+        node_id = self.createTestNode()
+
+        shock_util.is_readable(node_id, self.token)
+        stats = shock_util.connection_stats()
+
+        for _ in range(3):
+            self.assertTrue(shock_util.is_readable(node_id, self.token))
+
+        new_stats = shock_util.connection_stats()
+        self.assertEqual(new_stats['requests'] - stats['requests'], 3)
+        # keep-alive connection should be reused instead of opening new ones
+        self.assertEqual(new_stats['opened'], stats['opened'])
+        self.assertEqual(new_stats['reused'] - stats['reused'], 3)
+
+    def test_acl_cache_ok(self):
+        self.start_test()
+        shock_util = self.getShockUtil()
+        node_id = self.createTestNode()
+
+        stats = shock_util.cache_stats()
+        self.assertEqual(shock_util.get_owner(node_id, self.token), self.user_id)
+        self.assertEqual(shock_util.get_owner(node_id, self.token), self.user_id)
+        new_stats = shock_util.cache_stats()
+        self.assertEqual(new_stats['misses'] - stats['misses'], 1)
+        self.assertEqual(new_stats['hits'] - stats['hits'], 1)
+
+        # granting access drops the cached entries of the node
+        shock_util.add_read_acl(node_id, self.token)
+        self.assertIsNone(shock_util.acl_cache.get('owner', self.token, node_id))
+
     def test_get_owner_fail(self):
         self.start_test()
         shock_util = self.getShockUtil()
@@ -140,13 +239,13 @@ class ShockUtilTest(unittest.TestCase):
         self.assertCountEqual(users, [self.user_id])
 
         # grant public read access
-        shock_util.add_read_acl(node_id, self.token)
+        self.assertTrue(shock_util.add_read_acl(node_id, self.token))
         resp = _requests.get(end_point, headers=headers)
         data = resp.json()
         self.assertTrue(data.get('data').get('public').get('read'))
 
         # should work for already publicly accessable ndoes
-        shock_util.add_read_acl(node_id, self.token)
+        self.assertFalse(shock_util.add_read_acl(node_id, self.token))
         resp = _requests.get(end_point, headers=headers)
         data = resp.json()
         self.assertTrue(data.get('data').get('public').get('read'))
@@ -165,3 +264,159 @@ class ShockUtilTest(unittest.TestCase):
         data = resp.json()
         new_users = [user.get('username') for user in data.get('data').get('read')]
         self.assertCountEqual(new_users, [self.user_id, new_user])
+
+
+class ShockUtilRequestTest(unittest.TestCase):
+    """
+    request paths of ShockUtil against a mocked session, no shock server needed
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing ShockUtil requests')
+
+    def getShockUtil(self, **config):
+        config = dict({'shock-url': 'http://fake_shock_host', 'shock-startup-check': 'lazy',
+                       'shock-retry-backoff': 0.01}, **config)
+        shock_util = ShockUtil(config)
+        session = Mock()
+        session.request.return_value = Mock(status_code=200)
+        patcher = patch.object(shock_util, '_get_session', return_value=session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return shock_util, session
+
+    def test_deadline_timeouts(self):
+        shock_util, session = self.getShockUtil()
+
+        # without a deadline, the configured timeouts
+        shock_util._request('GET', 'http://fake_shock_host/node')
+        self.assertEqual(session.request.call_args[1]['timeout'],
+                         (ShockUtil.CONNECT_TIMEOUT, ShockUtil.READ_TIMEOUT))
+
+        # timeouts are cut to the time left to the deadline
+        token = Deadline.start(1)
+        try:
+            shock_util._request('GET', 'http://fake_shock_host/node')
+            connect_timeout, read_timeout = session.request.call_args[1]['timeout']
+            self.assertLessEqual(connect_timeout, 1)
+            self.assertLessEqual(read_timeout, 1)
+            self.assertGreater(read_timeout, 0.5)
+        finally:
+            Deadline.finish(token)
+
+        # no attempt is made once the deadline has passed
+        session.request.reset_mock()
+        token = Deadline.start(0.01)
+        try:
+            time.sleep(0.02)
+            with self.assertRaises(ValueError) as context:
+                shock_util._request('GET', 'http://fake_shock_host/node')
+            self.assertIn('Request deadline of 0.01s exceeded', str(context.exception.args))
+        finally:
+            Deadline.finish(token)
+        session.request.assert_not_called()
+
+        # a timeout cut short by the deadline is not retried and not counted against shock
+        def slow_timeout(*args, **kwargs):
+            time.sleep(0.05)
+            raise _requests.exceptions.Timeout('read timed out')
+
+        session.request.side_effect = slow_timeout
+        token = Deadline.start(0.03)
+        try:
+            with self.assertRaises(ValueError) as context:
+                shock_util._request('GET', 'http://fake_shock_host/node')
+            self.assertIn('Request deadline of 0.03s exceeded', str(context.exception.args))
+        finally:
+            Deadline.finish(token)
+        self.assertEqual(session.request.call_count, 1)
+        self.assertEqual(shock_util.circuit_breaker.stats()['consecutive_failures'], 0)
+
+    def test_retries(self):
+        shock_util, session = self.getShockUtil(**{'shock-max-retries': 2,
+                                                   'shock-breaker-failures': 10})
+        end_point = 'http://fake_shock_host/node'
+
+        # a GET failing with 5xx responses is tried max_retries more times
+        session.request.return_value = Mock(status_code=503)
+        self.assertEqual(shock_util._request('GET', end_point).status_code, 503)
+        self.assertEqual(session.request.call_count, 3)
+        self.assertEqual(shock_util.retry_policy.stats(), {'retry_count': 2,
+                                                           'exhausted_count': 1})
+
+        # and succeeds once a retry does
+        session.request.reset_mock()
+        session.request.side_effect = [Mock(status_code=502), Mock(status_code=200)]
+        self.assertEqual(shock_util._request('GET', end_point).status_code, 200)
+        self.assertEqual(session.request.call_count, 2)
+
+        # timeouts are retried too
+        session.request.reset_mock()
+        session.request.side_effect = _requests.exceptions.Timeout('read timed out')
+        with self.assertRaises(_requests.exceptions.Timeout):
+            shock_util._request('GET', end_point)
+        self.assertEqual(session.request.call_count, 3)
+
+        # a PUT may have been applied, so it is never retried
+        for side_effect in [None, _requests.exceptions.Timeout('read timed out')]:
+            session.request.reset_mock()
+            session.request.side_effect = side_effect
+            if side_effect is None:
+                self.assertEqual(shock_util._request('PUT', end_point).status_code, 503)
+            else:
+                with self.assertRaises(_requests.exceptions.Timeout):
+                    shock_util._request('PUT', end_point)
+            self.assertEqual(session.request.call_count, 1)
+
+    def test_circuit_breaker(self):
+        shock_util, session = self.getShockUtil(**{'shock-max-retries': 0,
+                                                   'shock-breaker-failures': 2})
+        end_point = 'http://fake_shock_host/node'
+
+        session.request.side_effect = _requests.exceptions.ConnectionError('connection refused')
+        for _ in range(2):
+            with self.assertRaises(_requests.exceptions.ConnectionError):
+                shock_util._request('GET', end_point)
+        self.assertEqual(shock_util.circuit_breaker.state, CircuitBreaker.OPEN)
+
+        # an open breaker fails at once, without calling shock
+        session.request.reset_mock()
+        with self.assertRaises(ValueError) as context:
+            shock_util._request('GET', end_point)
+        self.assertIn('circuit breaker is open', str(context.exception.args))
+        session.request.assert_not_called()
+        self.assertEqual(shock_util.circuit_breaker.stats()['rejected_count'], 1)
+
+    def test_trial_released_on_deadline(self):
+        shock_util, session = self.getShockUtil(**{'shock-max-retries': 0,
+                                                   'shock-breaker-failures': 1,
+                                                   'shock-breaker-reset': 0.2})
+        end_point = 'http://fake_shock_host/node'
+
+        session.request.return_value = Mock(status_code=503)
+        shock_util._request('GET', end_point)
+        self.assertEqual(shock_util.circuit_breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.25)
+
+        # the trial call is cut short by the deadline
+        def slow_timeout(*args, **kwargs):
+            time.sleep(0.05)
+            raise _requests.exceptions.Timeout('read timed out')
+
+        session.request.side_effect = slow_timeout
+        token = Deadline.start(0.02)
+        try:
+            with self.assertRaises(ValueError) as context:
+                shock_util._request('GET', end_point)
+            self.assertIn('Request deadline of 0.02s exceeded', str(context.exception.args))
+        finally:
+            Deadline.finish(token)
+
+        # and gives up its trial, so the next call is the trial instead of waiting for it to
+        # time out
+        self.assertEqual(shock_util.circuit_breaker.state, CircuitBreaker.HALF_OPEN)
+        session.request.side_effect = None
+        session.request.return_value = Mock(status_code=200)
+        self.assertEqual(shock_util._request('GET', end_point).status_code, 200)
+        self.assertEqual(shock_util.circuit_breaker.state, CircuitBreaker.CLOSED)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+
+from AbstractHandle.Utils.Deadline import Deadline
+from AbstractHandle.Utils.WriteBuffer import WriteBuffer
+
+
+class WriteBufferTest(unittest.TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        print('Finished testing WriteBuffer')
+
+    def submit_all(self, write_buffer, items):
+        results = dict()
+
+        def submit(item):
+            try:
+                results[item] = write_buffer.submit(item)
+            except Exception as e:
+                results[item] = e
+
+        threads = [threading.Thread(target=submit, args=(item,)) for item in items]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def test_submit_ok(self):
+        flushes = list()
+
+        def flush(items):
+            flushes.append(list(items))
+            return [item * 2 for item in items]
+
+        write_buffer = WriteBuffer(flush, 100, 0.1)
+        results = self.submit_all(write_buffer, range(20))
+
+        # each caller gets its own result, from fewer flushes than callers
+        self.assertDictEqual(results, {item: item * 2 for item in range(20)})
+        self.assertLess(len(flushes), 20)
+        self.assertCountEqual([item for items in flushes for item in items], range(20))
+
+        # a lone write is flushed after max_delay
+        start = time.time()
+        self.assertEqual(write_buffer.submit(5), 10)
+        self.assertGreaterEqual(time.time() - start, 0.1)
+
+    def test_submit_max_size(self):
+        flushes = list()
+
+        def flush(items):
+            flushes.append(list(items))
+            return items
+
+        # full batches are flushed without waiting for max_delay
+        write_buffer = WriteBuffer(flush, 5, 10)
+        start = time.time()
+        results = self.submit_all(write_buffer, range(20))
+
+        self.assertLess(time.time() - start, 5)
+        self.assertDictEqual(results, {item: item for item in range(20)})
+        self.assertTrue(all(len(items) == 5 for items in flushes))
+
+    def test_submit_fail(self):
+        def flush(items):
+            raise ValueError('bad batch')
+
+        results = self.submit_all(WriteBuffer(flush, 100, 0.05), range(5))
+
+        for result in results.values():
+            self.assertIsInstance(result, ValueError)
+            self.assertIn('bad batch', str(result.args))
+
+    def test_submit_deadline(self):
+        flushed = threading.Event()
+        flushed_items = list()
+
+        def flush(items):
+            # the flush is not bound to the deadline of any caller
+            self.assertIsNone(Deadline.current())
+            flushed_items.extend(items)
+            flushed.set()
+            return items
+
+        write_buffer = WriteBuffer(flush, 100, 0.5)
+        leader = threading.Thread(target=write_buffer.submit, args=(1,))
+        leader.start()
+        time.sleep(0.05)
+
+        # a caller past its deadline does not add its write
+        token = Deadline.start(0.01)
+        try:
+            time.sleep(0.02)
+            with self.assertRaises(ValueError) as context:
+                write_buffer.submit(2)
+            self.assertIn('Request deadline of 0.01s exceeded', str(context.exception.args))
+        finally:
+            Deadline.finish(token)
+
+        # a caller whose write is added waits for the flush past its deadline
+        token = Deadline.start(0.1)
+        try:
+            self.assertEqual(write_buffer.submit(3), 3)
+        finally:
+            Deadline.finish(token)
+
+        leader.join()
+        self.assertTrue(flushed.is_set())
+        self.assertEqual(flushed_items, [1, 3])